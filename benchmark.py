@@ -0,0 +1,357 @@
+"""Benchmarks for the Offer Finder extraction code, run against saved pages.
+
+Save a search page with the browser (or driver.page_source) and pass the
+.html files on the command line:
+
+    python benchmark.py amazon-extraction saved/amazon_*.html
+    python benchmark.py parser-backends --amazon saved/amazon_*.html --bestbuy saved/bestbuy_*.html
+    python benchmark.py fetch-backends saved/ --with-browser
+    python benchmark.py lean-load "laptop"      (live sites)
+
+Fixtures recorded with --record (see replay.py) are replayed through every
+extraction path with no browser or network:
+
+    python benchmark.py replay fixtures/
+
+Loading saved offer2 sweeps from CSV vs the Parquet dataset:
+
+    python benchmark.py sweep-load --csv "deals_202405*.csv" --parquet sweeps/ --start 2024-05-01
+
+The category classifier against the original substring scan:
+
+    python benchmark.py categories --count 100000
+"""
+import argparse
+import statistics
+import threading
+import time
+import tracemalloc
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote
+
+import tracing
+
+DEFAULT_AMAZON_URL = "https://www.amazon.com/s?k=benchmark&deals-widget=%257B%2522version%2522%253A1%257D"
+
+def time_call(func, repeat):
+    """Run func repeat times and return (median seconds, last result)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+def bench_amazon_extraction(args):
+    """Compare WebDriver element extraction, one page_source parse and one execute_script call"""
+    from offer import setup_driver, get_amazon_products
+
+    driver = setup_driver()
+    try:
+        print(f"{'Page':40} {'Items':>6} {'DOM ms':>10} {'Source ms':>10} {'Script ms':>10} {'Speedup':>8}")
+        for page in args.pages:
+            path = Path(page).resolve()
+            driver.get(path.as_uri())
+            dom_time, dom_products = time_call(
+                lambda: get_amazon_products(driver, mode="dom", page_url=args.page_url), args.repeat)
+            source_time, source_products = time_call(
+                lambda: get_amazon_products(driver, mode="page_source", page_url=args.page_url), args.repeat)
+            script_time, script_products = time_call(
+                lambda: get_amazon_products(driver, mode="script", page_url=args.page_url), args.repeat)
+            for mode, products in (("DOM", dom_products), ("script", script_products)):
+                if len(products) != len(source_products):
+                    print(f"Warning: {path.name} extracted {len(products)} items via {mode} but {len(source_products)} via page_source")
+            print(f"{path.name[:40]:40} {len(source_products):>6} {dom_time * 1000:>10.1f} "
+                  f"{source_time * 1000:>10.1f} {script_time * 1000:>10.1f} "
+                  f"{dom_time / max(min(source_time, script_time), 1e-9):>7.1f}x")
+    finally:
+        driver.quit()
+
+def peak_memory(func):
+    """Peak traced allocation in bytes while func runs"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bench_parser_backends(args):
+    """Per-page parse time and peak memory of each offer2 parser backend"""
+    import offer2
+
+    page_sets = [
+        ('Amazon', args.amazon, offer2.parse_amazon_search_page),
+        ('Best Buy', args.bestbuy, offer2.parse_bestbuy_search_page),
+    ]
+    print(f"{'Retailer':10} {'Page':30} {'Backend':12} {'Items':>6} {'Parse ms':>10} {'Peak KiB':>10}")
+    for retailer, pages, parse in page_sets:
+        for page in pages or []:
+            html = Path(page).read_text(encoding='utf-8')
+            for name in offer2.PARSER_BACKENDS:
+                backend = offer2.get_parser_backend(name)
+                run = lambda: parse(html, args.max_items, backend)
+                elapsed, products = time_call(run, args.repeat)
+                peak = peak_memory(run)
+                print(f"{retailer:10} {Path(page).name[:30]:30} {name:12} {len(products):>6} "
+                      f"{elapsed * 1000:>10.1f} {peak / 1024:>10.0f}")
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def serve_directory(directory):
+    """Serve saved fixture pages from a local HTTP server on a free port"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def bench_fetch_backends(args):
+    """Fetch latency of the aiohttp backend (and optionally Selenium) against local fixtures"""
+    import http_fetch
+
+    server = serve_directory(args.fixtures)
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+        urls = [base_url + quote(path.name) for path in sorted(Path(args.fixtures).glob('*.html'))]
+        if not urls:
+            print(f"No .html fixtures found in {args.fixtures}")
+            return
+
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            pages = http_fetch.fetch_pages(urls, concurrency=args.concurrency)
+            elapsed = time.perf_counter() - start
+            failed = [url for url, result in pages.items() if result.error or result.status != 200]
+            print(f"http: {len(urls)} pages in {elapsed:.3f}s ({len(failed)} failed)")
+
+        if args.with_browser:
+            from offer import setup_driver, load_page
+            driver = setup_driver()
+            try:
+                for _ in range(args.repeat):
+                    for url in urls:
+                        load_page(driver, url)
+            finally:
+                driver.quit()
+
+        http_fetch.print_latency_report()
+    finally:
+        server.shutdown()
+
+def bench_lean_load(args):
+    """Bytes transferred and time-to-grid per retailer, with and without lean loading"""
+    import offer, pacing, lean_load
+
+    targets = [('Amazon', offer.amazon_search_urls(args.query)[0][0], offer.AMAZON_READY_SELECTORS, 10)]
+    for store in args.retailer or ['Walmart', 'Best Buy']:
+        spec = offer.RETAILER_SPECS[store]
+        targets.append((store, offer.retailer_search_url(spec, args.query), [spec['wait_selector']], spec['wait_timeout']))
+
+    print(f"{'Retailer':12} {'Mode':6} {'KiB':>10} {'Grid s':>8} {'Ready':>6}")
+    for lean in (False, True):
+        driver = offer.setup_driver(lean=lean, network_log=True)
+        try:
+            for store, url, selectors, timeout in targets:
+                lean_load.transferred_bytes(driver)  # discard earlier traffic
+                start = time.perf_counter()
+                driver.get(url)
+                ready = pacing.wait_for_ready(driver, selectors, timeout)
+                elapsed = time.perf_counter() - start
+                size = lean_load.transferred_bytes(driver)
+                print(f"{store:12} {'lean' if lean else 'full':6} {size / 1024:>10.0f} {elapsed:>8.2f} {'yes' if ready else 'no':>6}")
+        finally:
+            driver.quit()
+
+def replay_cases(entry, stub):
+    """(mode, extract) pairs that run one recorded page through its extraction paths"""
+    import offer, offer2
+
+    if entry['source'] == 'offer2':
+        parse = offer2.parse_amazon_search_page if entry['retailer'] == 'Amazon' else offer2.parse_bestbuy_search_page
+        return [('html', lambda: parse(stub.page_source))]
+    if entry['retailer'] == 'Amazon':
+        return [(mode, partial(offer.get_amazon_products, stub, mode=mode, page_url=entry['final_url']))
+                for mode in ('page_source', 'dom')]
+    spec = offer.RETAILER_SPECS[entry['retailer']]
+    return [('html', lambda: offer.extract_products(stub.page_source, spec, entry['final_url']))]
+
+def bench_replay(args):
+    """Pages/sec, items/sec and peak memory per retailer, replaying recorded fixtures"""
+    from replay import StubDriver
+
+    stub = StubDriver(args.fixtures)
+    if not stub.entries:
+        print(f"No fixtures recorded in {args.fixtures}")
+        return
+
+    totals = {}
+    for entry in stub.entries:
+        if args.retailer and entry['retailer'] not in args.retailer:
+            continue
+        stub.load(entry)
+        for mode, extract in replay_cases(entry, stub):
+            elapsed, products = time_call(extract, args.repeat)
+            peak = peak_memory(extract)
+            row = totals.setdefault((entry['source'], entry['retailer'], mode), [0, 0, 0.0, 0])
+            row[0] += 1
+            row[1] += len(products)
+            row[2] += elapsed
+            row[3] = max(row[3], peak)
+
+    print(f"{'Source':7} {'Retailer':12} {'Mode':12} {'Pages':>6} {'Items':>6} {'Pages/s':>9} {'Items/s':>10} {'Peak KiB':>10}")
+    for (source, retailer, mode), (pages, items, seconds, peak) in sorted(totals.items()):
+        seconds = max(seconds, 1e-9)
+        print(f"{source:7} {retailer:12} {mode:12} {pages:>6} {items:>6} {pages / seconds:>9.1f} "
+              f"{items / seconds:>10.0f} {peak / 1024:>10.0f}")
+
+def bench_sweep_load(args):
+    """Time and disk size of loading saved sweeps from CSV vs the partitioned Parquet dataset"""
+    import glob
+    import pandas as pd
+    import sweep_store
+
+    csv_files = sorted(glob.glob(args.csv))
+    csv_columns = {'title': 'Product', 'category': 'Category', 'price': 'Current Price ($)',
+                   'original_price': 'Original Price ($)', 'discount': 'Discount (%)', 'link': 'URL',
+                   'source': 'Source'}
+    usecols = [csv_columns[column] for column in args.columns] if args.columns else None
+
+    csv_time, csv_frame = time_call(
+        lambda: pd.concat([pd.read_csv(path, usecols=usecols) for path in csv_files], ignore_index=True), args.repeat)
+    parquet_time, parquet_frame = time_call(
+        lambda: sweep_store.load_sweeps(args.parquet, args.columns, args.start, args.end, categories=args.category),
+        args.repeat)
+
+    csv_size = sum(Path(path).stat().st_size for path in csv_files)
+    parquet_size = sum(path.stat().st_size for path in Path(args.parquet).rglob('*.parquet'))
+    print(f"{'Format':8} {'Rows':>8} {'Load ms':>10} {'Disk KiB':>10}")
+    print(f"{'csv':8} {len(csv_frame):>8} {csv_time * 1000:>10.1f} {csv_size / 1024:>10.0f}")
+    print(f"{'parquet':8} {len(parquet_frame):>8} {parquet_time * 1000:>10.1f} {parquet_size / 1024:>10.0f}")
+
+def substring_category(title):
+    """The original offer2 detect_product_category, kept as the baseline"""
+    title = title.lower()
+    categories = {
+        'laptop': ['laptop', 'notebook', 'chromebook'],
+        'tablet': ['tablet', 'ipad', 'galaxy tab'],
+        'phone': ['phone', 'iphone', 'smartphone', 'galaxy s', 'pixel'],
+        'headphone': ['headphone', 'earphone', 'earbud', 'airpod'],
+        'tv': ['tv', 'television', 'smart tv', 'oled', 'qled'],
+        'camera': ['camera', 'webcam', 'security cam'],
+        'gaming': ['gaming', 'xbox', 'playstation', 'nintendo', 'console'],
+        'computer': ['desktop', 'pc', 'computer', 'monitor'],
+        'wearable': ['watch', 'smartwatch', 'fitness tracker', 'band'],
+        'clothing': ['shirt', 'pants', 'jacket', 'dress', 'shoes', 'clothing'],
+        'home': ['furniture', 'chair', 'table', 'bed', 'sofa', 'mattress'],
+        'kitchen': ['kitchen', 'cookware', 'appliance', 'refrigerator', 'microwave']
+    }
+    for category, keywords in categories.items():
+        if any(keyword in title for keyword in keywords):
+            return category
+    return 'other'
+
+SAMPLE_TITLE_WORDS = ['Samsung', 'Apple', 'Sony', 'LG', 'Dell', '15.6"', 'Wireless', 'Pro', 'Max', 'Ultra',
+                      'Laptop', 'Tablet', 'Headphones', 'OLED', 'Smart', 'TV', 'Gaming', 'Chair', 'Watch',
+                      'Jacket', 'Shoes', 'Microwave', 'Activity', 'Portable', 'Speaker', 'Bluetooth', 'Black',
+                      '128GB', 'Galaxy', 'S24', 'Desktop', 'Monitor', 'Camera', 'Kitchen', 'Table', 'Headband']
+
+# Most words in real listing titles are brand, spec and marketing filler
+SAMPLE_FILLER_WORDS = ['with', 'for', 'and', 'Compatible', 'Fast', 'Charging', 'Edition', 'Pack', 'New', 'Inch',
+                       'HD', '4K', 'USB-C', 'Lightweight', 'Durable', 'Premium', 'Women\'s', 'Men\'s', 'Set',
+                       '2024', 'Model', 'Version', 'Gray', 'Silver', 'Home', 'Office', 'Travel', 'Large']
+
+def sample_titles(count, seed=0):
+    """Synthetic listing titles of 8-25 words, a few of them category keywords"""
+    import random
+    rng = random.Random(seed)
+    titles = []
+    for _ in range(count):
+        words = [rng.choice(SAMPLE_FILLER_WORDS) for _ in range(rng.randint(8, 25))]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(SAMPLE_TITLE_WORDS))
+        titles.append(' '.join(words))
+    return titles
+
+def bench_categories(args):
+    """Classify titles with the original substring scan and the compiled classifier"""
+    import categories
+
+    if args.titles:
+        titles = [line.strip() for line in open(args.titles, encoding='utf-8') if line.strip()]
+    else:
+        titles = sample_titles(args.count)
+    classifier = categories.CategoryClassifier()
+
+    baseline_time, baseline = time_call(lambda: [substring_category(title) for title in titles], args.repeat)
+    single_time, single = time_call(lambda: [classifier.classify(title) for title in titles], args.repeat)
+    batch_time, batch = time_call(lambda: classifier.classify_many(titles), args.repeat)
+    if single != batch:
+        print("Warning: classify and classify_many disagree")
+
+    print(f"{len(titles)} titles")
+    print(f"{'Method':22} {'ms':>10} {'Titles/s':>12}")
+    for label, elapsed in (('substring scan', baseline_time), ('compiled classify', single_time),
+                           ('compiled batch', batch_time)):
+        print(f"{label:22} {elapsed * 1000:>10.1f} {len(titles) / max(elapsed, 1e-9):>12.0f}")
+    changed = sum(old != new for old, new in zip(baseline, batch))
+    print(f"{changed} titles ({changed / max(len(titles), 1) * 100:.1f}%) categorized differently than before")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offer Finder benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    amazon_parser = subparsers.add_parser("amazon-extraction", help="DOM vs page_source vs script extraction for Amazon pages")
+    amazon_parser.add_argument("pages", nargs="+", help="Saved Amazon search result pages")
+    amazon_parser.add_argument("--page-url", default=DEFAULT_AMAZON_URL, help="URL the pages were saved from")
+    amazon_parser.add_argument("--repeat", type=int, default=3)
+    amazon_parser.set_defaults(func=bench_amazon_extraction)
+
+    backends_parser = subparsers.add_parser("parser-backends", help="offer2 parse time and memory per parser backend")
+    backends_parser.add_argument("--amazon", nargs="*", help="Saved Amazon search result pages")
+    backends_parser.add_argument("--bestbuy", nargs="*", help="Saved Best Buy search result pages")
+    backends_parser.add_argument("--max-items", type=int, default=50)
+    backends_parser.add_argument("--repeat", type=int, default=5)
+    backends_parser.set_defaults(func=bench_parser_backends)
+
+    fetch_parser = subparsers.add_parser("fetch-backends", help="Fetch latency per backend against a local fixture server")
+    fetch_parser.add_argument("fixtures", help="Directory of saved .html pages to serve")
+    fetch_parser.add_argument("--with-browser", action="store_true", help="Also load every page through Selenium")
+    fetch_parser.add_argument("--concurrency", type=int, default=8)
+    fetch_parser.add_argument("--repeat", type=int, default=3)
+    fetch_parser.set_defaults(func=bench_fetch_backends)
+
+    lean_parser = subparsers.add_parser("lean-load", help="Page weight and time-to-grid with and without --lean")
+    lean_parser.add_argument("query")
+    lean_parser.add_argument("--retailer", action="append", help="Spec retailer to include besides Amazon (repeatable)")
+    lean_parser.set_defaults(func=bench_lean_load)
+
+    replay_parser = subparsers.add_parser("replay", help="Extraction throughput and memory over recorded fixtures")
+    replay_parser.add_argument("fixtures", help="Directory written by --record")
+    replay_parser.add_argument("--retailer", action="append", help="Only replay this retailer (repeatable)")
+    replay_parser.add_argument("--repeat", type=int, default=3)
+    replay_parser.set_defaults(func=bench_replay)
+
+    sweep_parser = subparsers.add_parser("sweep-load", help="Load saved sweeps from CSV vs Parquet")
+    sweep_parser.add_argument("--csv", required=True, help="Glob of offer2 deals_*.csv files")
+    sweep_parser.add_argument("--parquet", required=True, help="Dataset directory written with offer2 --parquet")
+    sweep_parser.add_argument("--columns", nargs="*", help="Columns to load, e.g. title discount")
+    sweep_parser.add_argument("--start", help="First date (YYYY-MM-DD) read from the Parquet dataset")
+    sweep_parser.add_argument("--end", help="Last date (YYYY-MM-DD) read from the Parquet dataset")
+    sweep_parser.add_argument("--category", action="append", help="Only load this category from Parquet (repeatable)")
+    sweep_parser.add_argument("--repeat", type=int, default=3)
+    sweep_parser.set_defaults(func=bench_sweep_load)
+
+    categories_parser = subparsers.add_parser("categories", help="Category classifier vs the original substring scan")
+    categories_parser.add_argument("--titles", help="File with one product title per line (default: synthetic titles)")
+    categories_parser.add_argument("--count", type=int, default=100000, help="Number of synthetic titles")
+    categories_parser.add_argument("--repeat", type=int, default=3)
+    categories_parser.set_defaults(func=bench_categories)
+
+    args = parser.parse_args()
+    # Keep the scrapers' progress messages out of the timings
+    tracing.configure_logging('WARNING')
+    args.func(args)
@@ -0,0 +1,82 @@
+"""Canonical product identity from retailer links.
+
+Links collected from search pages carry per-visit tracking parameters and
+sponsored-click redirects, so the same product shows up under many URLs.
+product_key reduces a link to the retailer's own id (Amazon ASIN, Best Buy
+SKU, Walmart item id) and canonical_link to a clean URL for that id;
+links without a recognizable id are normalized and stripped of tracking
+parameters instead.
+"""
+import re
+from urllib.parse import parse_qs, parse_qsl, unquote, urlencode, urljoin, urlsplit, urlunsplit
+
+import page_cache
+
+AMAZON_ASIN = re.compile(r'/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})(?:[/?]|$)')
+BESTBUY_SKU = re.compile(r'/(\d{5,})\.p(?:$|\?)')
+WALMART_ITEM = re.compile(r'/ip/(?:[^/]+/)?(\d+)(?:[/?]|$)')
+
+TRACKING_PARAMS = {
+    'ref', 'ref_', 'qid', 'sr', 'crid', 'sprefix', 'keywords', 'th', 'psc', 'smid', 'dib', 'dib_tag',
+    'content-id', 'sp_csd', 'spla', 'from', 'sid', 'adsredirect', 'classtype', 'irclickid', 'irgwc',
+    'gclid', 'fbclid', 'msclkid',
+}
+TRACKING_PREFIXES = ('utm_', 'pf_rd_', 'pd_rd_', 'ath')
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def unwrap_redirect(link):
+    """Target of an Amazon sponsored-click redirect (/sspa/click?...&url=/dp/...), else link itself"""
+    if '/sspa/click' not in link:
+        return link
+    parts = urlsplit(link)
+    if '/sspa/click' in parts.path:
+        target = parse_qs(parts.query).get('url')
+        if target:
+            return urljoin(link, unquote(target[0]))
+    return link
+
+def product_id(store, link):
+    """The retailer's own id for the product behind link, or None"""
+    parts = urlsplit(unwrap_redirect(link))
+    if store == 'Amazon':
+        match = AMAZON_ASIN.search(parts.path)
+        return match.group(1) if match else None
+    if store == 'Best Buy':
+        sku = parse_qs(parts.query).get('skuId') or BESTBUY_SKU.findall(parts.path)
+        return sku[0] if sku else None
+    if store == 'Walmart':
+        match = WALMART_ITEM.search(parts.path)
+        return match.group(1) if match else None
+    return None
+
+def strip_tracking(link):
+    parts = urlsplit(link)
+    params = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+              if not is_tracking_param(key)]
+    path = '/'.join(segment for segment in parts.path.split('/') if not segment.startswith('ref='))
+    return urlunsplit((parts.scheme, parts.netloc, path, urlencode(params), ''))
+
+def canonical_link(store, link):
+    """Shortest stable URL for the product behind link"""
+    link = unwrap_redirect(link)
+    item = product_id(store, link)
+    if item is None:
+        return strip_tracking(link)
+    if store == 'Amazon':
+        return f"https://www.amazon.com/dp/{item}"
+    if store == 'Walmart':
+        return f"https://www.walmart.com/ip/{item}"
+    if store == 'Best Buy':
+        return f"https://www.bestbuy.com/site/{item}.p?skuId={item}"
+    return link
+
+def product_key(store, link):
+    """Stable id for a product: ASIN, SKU or item id when the link has one, else the normalized link"""
+    prefix = store.lower().replace(' ', '')
+    item = product_id(store, link)
+    if item:
+        return f"{prefix}:{item}"
+    return f"{prefix}:{page_cache.normalize_url(strip_tracking(unwrap_redirect(link)))}"
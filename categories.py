@@ -0,0 +1,130 @@
+"""Product category classifier compiled once from a keyword taxonomy.
+
+Keywords are compiled into hash sets of whole words and word phrases, so a
+title is tokenized once and matched with a set intersection: 'tv' no
+longer matches inside 'activity' and 'pc' inside 'npc'. Plurals of
+keywords longer than two letters match too, and a keyword ending in '*'
+may be followed by a model number ('galaxy s*' matches 'Galaxy S24').
+
+Every keyword found scores its category one point per word it has, so
+'smart tv' outweighs a stray 'watch'; ties go to the category listed first,
+as the old first-match order did. A taxonomy can be loaded from JSON:
+
+    {"laptop": ["laptop", "notebook"], "tv": ["tv", "smart tv"]}
+"""
+import json
+import re
+
+DEFAULT_CATEGORY = 'other'
+
+DEFAULT_TAXONOMY = {
+    'laptop': ['laptop', 'notebook', 'chromebook'],
+    'tablet': ['tablet', 'ipad', 'galaxy tab'],
+    'phone': ['phone', 'iphone', 'smartphone', 'galaxy s*', 'pixel'],
+    'headphone': ['headphone', 'earphone', 'earbud', 'airpod'],
+    'tv': ['tv', 'television', 'smart tv', 'oled', 'qled'],
+    'camera': ['camera', 'webcam', 'security cam'],
+    'gaming': ['gaming', 'xbox', 'playstation', 'nintendo', 'console'],
+    'computer': ['desktop', 'pc', 'computer', 'monitor'],
+    'wearable': ['watch', 'smartwatch', 'fitness tracker', 'fitness band', 'smart band'],
+    'clothing': ['shirt', 'pants', 'jacket', 'dress', 'shoes', 'clothing'],
+    'home': ['furniture', 'chair', 'table', 'bed', 'sofa', 'mattress'],
+    'kitchen': ['kitchen', 'cookware', 'appliance', 'refrigerator', 'microwave'],
+}
+
+WORD = re.compile(r'\w+')
+DIGITS = '0123456789'
+
+def load_taxonomy(path):
+    """Read a {category: [keywords]} taxonomy from a JSON file, keeping its order"""
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+class CategoryClassifier:
+    def __init__(self, taxonomy=None, default=DEFAULT_CATEGORY):
+        taxonomy = taxonomy or DEFAULT_TAXONOMY
+        self.default = default
+        self.categories = list(taxonomy)
+        self._rank = {category: index for index, category in enumerate(self.categories)}
+        self._phrases = {}   # word or phrase as written in a title -> (keyword, categories)
+        self._numbered = {}  # the same for '*' keywords, with the model number stripped
+        self._phrase_starts = set()
+        self._longest = 1
+        for category, keywords in taxonomy.items():
+            for keyword in keywords:
+                keyword = ' '.join(keyword.lower().split())
+                table = self._phrases
+                forms = [keyword]
+                if keyword.endswith('*'):
+                    table = self._numbered
+                    forms = [keyword[:-1].rstrip()]
+                elif len(keyword) > 2:
+                    forms += [keyword + 's', keyword + 'es']
+                for form in forms:
+                    table.setdefault(form, (keyword, []))[1].append(category)
+                    words = form.split()
+                    if len(words) > 1:
+                        self._phrase_starts.add(words[0])
+                        self._longest = max(self._longest, len(words))
+        self._words = {text for text in self._phrases if ' ' not in text}
+        self._numbered_words = {text for text in self._numbered if ' ' not in text}
+
+    def _entry(self, text):
+        entry = self._phrases.get(text)
+        if entry is None and text[-1] in DIGITS:
+            entry = self._numbered.get(text.rstrip(DIGITS))
+        return entry
+
+    def _matched(self, title):
+        """{keyword: categories} for each distinct keyword found in title"""
+        words = WORD.findall(title.lower())
+        # Single words are found with one set intersection; phrases are only
+        # looked at when a title contains a word one of them starts with
+        matched = dict(self._phrases[word] for word in self._words.intersection(words))
+        if self._numbered_words:
+            numbered = {word.rstrip(DIGITS) for word in words if word[-1] in DIGITS}
+            matched.update(self._numbered[word] for word in self._numbered_words.intersection(numbered))
+        for start in self._phrase_starts.intersection(words):
+            index = words.index(start)
+            while True:
+                for length in range(2, min(self._longest, len(words) - index) + 1):
+                    entry = self._entry(' '.join(words[index:index + length]))
+                    if entry is not None:
+                        matched[entry[0]] = entry[1]
+                try:
+                    index = words.index(start, index + 1)
+                except ValueError:
+                    break
+        return matched
+
+    def _scores(self, matched_keywords):
+        scores = {}
+        for keyword, categories in matched_keywords.items():
+            weight = len(keyword.split())
+            for category in categories:
+                scores[category] = scores.get(category, 0) + weight
+        return scores
+
+    def scores(self, title):
+        """{category: score} for one title"""
+        return self._scores(self._matched(title))
+
+    def classify(self, title):
+        matched = self._matched(title)
+        if not matched:
+            return self.default
+        if len(matched) == 1:
+            categories = next(iter(matched.values()))
+            if len(categories) == 1:
+                return categories[0]
+        scores = self._scores(matched)
+        return min(scores, key=lambda category: (-scores[category], self._rank[category]))
+
+    def classify_many(self, titles):
+        """Categories for a list of titles; titles repeated across pages are classified once"""
+        titles = list(titles)
+        known = dict.fromkeys(titles)
+        classify = self.classify
+        for title in known:
+            known[title] = classify(title)
+        return [known[title] for title in titles]
@@ -0,0 +1,83 @@
+"""Discounts of a whole batch of products at once.
+
+Prices are gathered into NumPy arrays once per batch, so discounts, sanity
+checks and the minimum-discount filter are array operations instead of a
+Python expression per product. Suspicious rows are flagged rather than
+silently kept or dropped:
+
+    ZERO_PRICE              current or original price is zero or negative
+    ORIGINAL_BELOW_CURRENT  the "was" price is lower than the current price
+    BADGE_ONLY              no was price; the discount is the BADGE_DISCOUNT sentinel
+                            offer.py gives items that only carry a deal badge
+    MISMATCH                the reported discount disagrees with the prices
+
+Masks and indices refer back to positions in the product batch.
+"""
+import numpy as np
+
+# Discount offer.py assigns to items with a deal badge but no was price
+BADGE_DISCOUNT = 0.1
+
+ZERO_PRICE = 1
+ORIGINAL_BELOW_CURRENT = 2
+BADGE_ONLY = 4
+MISMATCH = 8
+FLAG_NAMES = {ZERO_PRICE: 'zero price', ORIGINAL_BELOW_CURRENT: 'original below current',
+              BADGE_ONLY: 'badge only', MISMATCH: 'discount mismatch'}
+
+# offer2 rounds reported discounts to 2 places, offer.py does not round them
+MISMATCH_TOLERANCE = 0.01
+
+# Flags of rows whose prices cannot be a real offer
+INVALID = ZERO_PRICE | ORIGINAL_BELOW_CURRENT
+
+def price_arrays(products):
+    """(current, original, reported discount) float arrays for a product batch"""
+    count = len(products)
+    current = np.fromiter((p.price for p in products), dtype=np.float64, count=count)
+    original = np.fromiter((p.original_price for p in products), dtype=np.float64, count=count)
+    reported = np.fromiter((p.discount for p in products), dtype=np.float64, count=count)
+    return current, original, reported
+
+def compute_discounts(current, original):
+    """Percent off original, rounded to 2 places; 0 where the prices do not make a discount"""
+    valid = (current > 0) & (original > current)
+    discounts = np.zeros(len(current))
+    np.divide(original - current, original, out=discounts, where=valid)
+    return np.round(discounts * 100, 2)
+
+def flag_suspicious(current, original, reported):
+    """Bit flags (see the module docstring) per product; 0 for a clean row"""
+    flags = np.zeros(len(current), dtype=np.uint8)
+    flags[(current <= 0) | (original <= 0)] |= ZERO_PRICE
+    flags[original < current] |= ORIGINAL_BELOW_CURRENT
+    flags[(reported == BADGE_DISCOUNT) & (original == current)] |= BADGE_ONLY
+    computed = compute_discounts(current, original)
+    flags[(flags == 0) & (np.abs(computed - reported) > MISMATCH_TOLERANCE)] |= MISMATCH
+    return flags
+
+def batch_flags(products):
+    """flag_suspicious over a whole product batch"""
+    if not products:
+        return np.zeros(0, dtype=np.uint8)
+    return flag_suspicious(*price_arrays(products))
+
+def discount_mask(products, min_discount):
+    """(mask of products at or above min_discount with sane prices, flags)"""
+    current, original, reported = price_arrays(products)
+    flags = flag_suspicious(current, original, reported)
+    sane = (flags & INVALID) == 0
+    return sane & (reported >= min_discount), flags
+
+def flag_counts(flags):
+    """{flag name: products carrying it}, for flags that occur"""
+    return {name: int(np.count_nonzero(flags & flag)) for flag, name in FLAG_NAMES.items()
+            if np.any(flags & flag)}
+
+def filter_discounted(products, min_discount):
+    """(products meeting min_discount, their indices in products, flags of the whole batch)"""
+    if not products:
+        return [], np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.uint8)
+    mask, flags = discount_mask(products, min_discount)
+    indices = np.flatnonzero(mask)
+    return [products[index] for index in indices.tolist()], indices, flags
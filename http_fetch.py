@@ -0,0 +1,94 @@
+"""Browserless page fetching for retailers whose results are in the initial HTML.
+
+Pages are retrieved concurrently over one pooled keep-alive aiohttp session
+and handed to the same parsers used for driver.page_source. Latencies are
+recorded per backend ("http" here, "selenium" for driver.get) so the two
+fetch paths can be compared at the end of a run. Requests share the
+per-host rate limits in pacing with the browser workers.
+"""
+import asyncio
+import statistics
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+import pacing
+import tracing
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed for --fetch http
+    aiohttp = None
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+FetchResult = namedtuple('FetchResult', ['url', 'final_url', 'status', 'html', 'seconds', 'error'])
+
+_latencies = defaultdict(list)
+_latency_lock = threading.Lock()
+
+def record_latency(backend, seconds):
+    with _latency_lock:
+        _latencies[backend].append(seconds)
+
+def reset_latencies():
+    """Forget the recorded samples, e.g. before each query of a long-running daemon"""
+    with _latency_lock:
+        _latencies.clear()
+
+def latency_report():
+    """Per-backend fetch count, median and p90 latency in seconds"""
+    report = {}
+    with _latency_lock:
+        for backend, samples in _latencies.items():
+            ordered = sorted(samples)
+            report[backend] = {
+                'count': len(ordered),
+                'median': statistics.median(ordered),
+                'p90': ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+            }
+    return report
+
+def print_latency_report():
+    report = latency_report()
+    if not report:
+        return
+    print("\nFetch latency by backend:")
+    for backend, stats in report.items():
+        print(f"  {backend:10} {stats['count']:>4} pages  median {stats['median'] * 1000:.0f} ms  p90 {stats['p90'] * 1000:.0f} ms")
+
+async def _fetch_one(session, semaphore, url, timeout):
+    await pacing.RATE_LIMITER.acquire_async(url)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                html = await response.text(errors='replace')
+                elapsed = time.perf_counter() - start
+                record_latency('http', elapsed)
+                return FetchResult(url, str(response.url), response.status, html, elapsed, None)
+        except Exception as e:
+            return FetchResult(url, url, None, None, time.perf_counter() - start, str(e))
+
+async def fetch_pages_async(urls, concurrency=8, timeout=20, headers=None):
+    """Fetch urls concurrently over a shared keep-alive session, keyed by requested url"""
+    if aiohttp is None:
+        raise RuntimeError("aiohttp is required for the http fetch backend (pip install aiohttp)")
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers=headers or DEFAULT_HEADERS) as session:
+        results = await asyncio.gather(*(_fetch_one(session, semaphore, url, timeout) for url in urls))
+    for result in results:
+        tracing.TRACER.record('fetch', result.seconds, url=result.url, backend='http')
+    return {result.url: result for result in results}
+
+def fetch_pages(urls, concurrency=8, timeout=20, headers=None):
+    """Blocking wrapper around fetch_pages_async"""
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    return asyncio.run(fetch_pages_async(urls, concurrency, timeout, headers))
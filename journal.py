@@ -0,0 +1,87 @@
+"""Checkpoint journal of a run's completed search pages.
+
+Every search job that yields products is appended to a JSON-lines file as
+soon as it finishes, together with those products, and flushed to disk. A
+run started with --resume reads the journal back, skips every (store, URL)
+already in it and rebuilds its output from the journaled products plus the
+remaining pages, so a crash late in a sweep costs only the unfinished
+pages. Jobs that produced nothing are not journaled and run again on
+resume. The journal is removed once the run has saved its output.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from product import Product
+
+DEFAULT_DIRECTORY = Path.home() / '.cache' / 'offer_finder' / 'journals'
+
+log = logging.getLogger(__name__)
+
+def default_path(script, name=''):
+    """Today's journal for a script and query, e.g. journals/offer_laptop_20240501.jsonl"""
+    slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+    filename = '_'.join(part for part in (script, slug, datetime.now().strftime('%Y%m%d')) if part)
+    return DEFAULT_DIRECTORY / f"{filename}.jsonl"
+
+class RunJournal:
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._completed = self._read() if resume else {}
+        if resume and self._completed:
+            log.info(f"Resuming from {self.path}: {len(self._completed)} pages already done")
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def _read(self):
+        completed = {}
+        if not self.path.exists():
+            return completed
+        valid = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                completed[(entry['store'], entry['url'])] = entry['products']
+                valid += len(line)
+        # The last line of a crashed run may be cut off; drop it before appending
+        os.truncate(self.path, valid)
+        return completed
+
+    def completed(self, store, url):
+        """The journaled products of a finished (store, url) job, or None"""
+        products = self._completed.get((store, url))
+        if products is None:
+            return None
+        return [Product.from_dict(values) for values in products]
+
+    def record(self, store, url, products):
+        """Journal a finished job; jobs without products are left to run again on resume"""
+        if not products:
+            return
+        entry = {'store': store, 'url': url, 'products': [product.as_dict() for product in products]}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def finish(self):
+        """The run's output is saved; the journal is no longer needed"""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
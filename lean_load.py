@@ -0,0 +1,69 @@
+"""Lean page loads: skip the assets the scrapers never read.
+
+Only text and hrefs are extracted, so images, fonts, media and third-party
+trackers are blocked before they are requested, and navigation returns at
+DOMContentLoaded (pageLoadStrategy "eager") because every search waits for
+its result grid explicitly anyway.
+"""
+import json
+
+BLOCKED_EXTENSIONS = [
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'svg', 'ico',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    'mp4', 'webm', 'm3u8', 'mp3',
+]
+
+TRACKER_DOMAINS = [
+    'doubleclick.net',
+    'googlesyndication.com',
+    'google-analytics.com',
+    'googletagmanager.com',
+    'googleadservices.com',
+    'amazon-adsystem.com',
+    'facebook.net',
+    'connect.facebook.com',
+    'scorecardresearch.com',
+    'criteo.com',
+    'criteo.net',
+    'adnxs.com',
+    'hotjar.com',
+    'quantserve.com',
+    'taboola.com',
+    'outbrain.com',
+    'bing.com/bat',
+    'tiktok.com/i18n/pixel',
+]
+
+BLOCKED_URL_PATTERNS = ([f"*.{extension}" for extension in BLOCKED_EXTENSIONS] +
+                        [f"*.{extension}?*" for extension in BLOCKED_EXTENSIONS] +
+                        [f"*{domain}*" for domain in TRACKER_DOMAINS])
+
+# 2 = block for the Chrome content settings
+LEAN_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.default_content_setting_values.notifications': 2,
+}
+
+def apply_lean_options(options):
+    """Configure Chrome options for a lean load before the browser starts"""
+    options.page_load_strategy = 'eager'
+    options.add_experimental_option('prefs', LEAN_PREFS)
+    options.add_argument('--blink-settings=imagesEnabled=false')
+
+def block_heavy_requests(driver):
+    """Block asset and tracker requests through CDP on a running browser"""
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+
+def enable_network_log(options):
+    """Record CDP network events so transferred_bytes() can measure page weight"""
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+def transferred_bytes(driver):
+    """Bytes received since the previous call, from the CDP performance log"""
+    total = 0
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        if message.get('method') == 'Network.loadingFinished':
+            total += message['params'].get('encodedDataLength', 0)
+    return total
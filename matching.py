@@ -0,0 +1,133 @@
+"""Grouping of the same product across retailers.
+
+Products are only compared within blocks that share a key:
+
+    ('model', 'oled65c3pua')   a model-number token: letters and digits, not a unit like 16gb
+    ('title', brand, band)     an LSH band of the title's MinHash signature, within one brand
+
+Blocks larger than MAX_BLOCK (accessory floods, tokens like 'usb3') are
+skipped, so the work stays close to linear in the number of products. Two
+products from different stores match when they share a model token and
+their brands agree, or when their titles' word shingles have Jaccard
+similarity >= threshold. comparison_rows turns the groups into a view with
+the best price of each group first.
+"""
+import csv
+import re
+from collections import defaultdict
+from datetime import datetime
+
+import tracing
+from near_dupes import BANDS, NUM_HASHES, UnionFind, jaccard, shingles, signatures
+
+WORD = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+UNIT = re.compile(r'\d+(?:\.\d+)?(?:gb|tb|mb|ghz|hz|mhz|w|mah|v|in|inch|mp|p|k|mm|cm|m|ft|oz|lb|lbs|qt|pack|pk|pcs|ct|th|nd|rd|st|x)$')
+MAX_BLOCK = 50
+
+# Leading words that are not a brand
+NOT_BRANDS = {'new', 'the', 'renewed', 'refurbished', 'restored', 'open', 'box', 'sponsored', '2024', '2025'}
+
+COMPARISON_HEADER = ['Group', 'Title', 'Best Store', 'Best Price', 'Highest Price', 'Savings %', 'Prices', 'Link']
+
+def title_words(title):
+    return WORD.findall(title.lower())
+
+def brand(words):
+    """First word of a title that is not a condition or filler word"""
+    for word in words[:3]:
+        if word not in NOT_BRANDS and not word.isdigit():
+            return word
+    return ''
+
+def model_tokens(words):
+    """Tokens that look like model numbers: letters and digits, at least 4 long, not a unit"""
+    tokens = set()
+    for word in words:
+        token = word.replace('-', '')
+        if (len(token) >= 4 and not token.isdigit() and not token.isalpha()
+                and not UNIT.match(token)):
+            tokens.add(token)
+    return tokens
+
+def blocks(brands, models, shingle_sets):
+    """{blocking key: [product indices]}"""
+    result = defaultdict(list)
+    for index, tokens in enumerate(models):
+        for token in tokens:
+            result[('model', token)].append(index)
+    matrix = signatures(shingle_sets)
+    rows = NUM_HASHES // BANDS
+    width = rows * matrix.itemsize
+    for band in range(BANDS):
+        keys = matrix[:, band * rows:(band + 1) * rows].tobytes()
+        for index, product_brand in enumerate(brands):
+            if product_brand:
+                result[('title', product_brand, band, keys[index * width:(index + 1) * width])].append(index)
+    return result
+
+@tracing.timed('match')
+def match_products(products, threshold=0.6):
+    """Groups (lists of products) of the same item listed by more than one store"""
+    products = [product for product in products if product.condition == 'New' and product.price > 0]
+    words = [title_words(product.title) for product in products]
+    brands = [brand(product_words) for product_words in words]
+    models = [model_tokens(product_words) for product_words in words]
+    shingle_sets = [shingles(product.title) for product in products]
+
+    groups = UnionFind(len(products))
+    compared = set()
+    for key, members in blocks(brands, models, shingle_sets).items():
+        if len(members) < 2 or len(members) > MAX_BLOCK:
+            continue
+        for position, first in enumerate(members):
+            for second in members[position + 1:]:
+                if products[first].store == products[second].store or (first, second) in compared:
+                    continue
+                compared.add((first, second))
+                same_brand = brands[first] == brands[second] or not brands[first] or not brands[second]
+                if key[0] == 'model' and same_brand:
+                    groups.union(first, second)
+                elif same_brand and jaccard(shingle_sets[first], shingle_sets[second]) >= threshold:
+                    groups.union(first, second)
+
+    members_by_root = defaultdict(list)
+    for index, product in enumerate(products):
+        members_by_root[groups.find(index)].append(product)
+    return [members for members in members_by_root.values()
+            if len({product.store for product in members}) > 1]
+
+def cheapest_by_store(group):
+    """{store: cheapest product of that store in the group}"""
+    cheapest = {}
+    for product in group:
+        if product.store not in cheapest or product.price < cheapest[product.store].price:
+            cheapest[product.store] = product
+    return cheapest
+
+def comparison_rows(groups):
+    """One row per group with its best price, biggest savings between stores first"""
+    ranked = []
+    for number, group in enumerate(groups, 1):
+        cheapest = cheapest_by_store(group)
+        by_price = sorted(cheapest.values(), key=lambda product: product.price)
+        best, highest = by_price[0], by_price[-1]
+        savings = (highest.price - best.price) / highest.price * 100
+        prices = '; '.join(f"{product.store} ${product.price:.2f}" for product in by_price)
+        ranked.append((savings, [number, best.title, best.store, f"${best.price:.2f}", f"${highest.price:.2f}",
+                                 f"{savings:.1f}%", prices, best.link]))
+    ranked.sort(key=lambda entry: -entry[0])
+    return [row for _, row in ranked]
+
+def save_comparison(groups, query, filename=None):
+    filename = filename or f"price_matches_{query}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(COMPARISON_HEADER)
+        writer.writerows(comparison_rows(groups))
+    return filename
+
+def print_comparison(groups, limit=10):
+    rows = comparison_rows(groups)
+    print(f"\nMatched {len(groups)} products across stores")
+    for row in rows[:limit]:
+        print(f"  {row[5]:>6} cheaper at {row[2]:10} {row[3]:>10}  {row[1][:60]}")
@@ -0,0 +1,132 @@
+"""De-duplication of a sweep's products in near-linear time.
+
+Exact duplicates share a canonical product key (see canonical.py). Near
+duplicates are the same listing under different ids or links, e.g. a
+sponsored and an organic card for one item: same store, titles with word
+shingle Jaccard similarity >= threshold and prices within tolerance.
+
+Titles are MinHashed with NumPy and bucketed with LSH banding, so only
+titles that collide in some band are ever compared, instead of every pair.
+"""
+import logging
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+import tracing
+
+from canonical import canonical_link, product_key
+
+NUM_HASHES = 64
+BANDS = 16            # 16 bands x 4 rows: pairs above ~0.5 similarity almost always collide
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+log = logging.getLogger(__name__)
+WORD = re.compile(r'\w+')
+
+_random = np.random.RandomState(7)
+_A = _random.randint(1, MAX_HASH, size=NUM_HASHES, dtype=np.uint64)
+_B = _random.randint(0, MAX_HASH, size=NUM_HASHES, dtype=np.uint64)
+
+def shingles(title):
+    """Word bigrams of a lower-cased title (single words for one-word titles)"""
+    words = WORD.findall(title.lower())
+    if len(words) < 2:
+        return set(words)
+    return {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+def minhash(shingle_set):
+    """NUM_HASHES-long MinHash signature of a shingle set"""
+    return signatures([shingle_set])[0]
+
+def signatures(shingle_sets, chunk=2000):
+    """(len(shingle_sets), NUM_HASHES) MinHash signatures, hashed chunk titles at a time"""
+    result = np.full((len(shingle_sets), NUM_HASHES), MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(shingle_sets), chunk):
+        batch = shingle_sets[start:start + chunk]
+        sizes = np.fromiter((len(s) for s in batch), dtype=np.int64, count=len(batch))
+        filled = np.flatnonzero(sizes)
+        if not len(filled):
+            continue
+        hashes = np.fromiter((zlib.crc32(text.encode('utf-8')) for s in batch for text in s),
+                             dtype=np.uint64, count=int(sizes.sum()))
+        # (a * x + b) mod p with 32-bit a, x keeps every product below 2**64
+        permuted = ((np.outer(_A, hashes) + _B[:, None]) % MERSENNE_PRIME) & MAX_HASH
+        offsets = (np.cumsum(sizes) - sizes)[filled]
+        result[start + filled] = np.minimum.reduceat(permuted, offsets, axis=1).T
+    return result
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, first, second):
+        self.parent[self.find(second)] = self.find(first)
+
+def near_duplicate_groups(products, threshold=0.8, price_tolerance=0.01):
+    """Lists of indices into products that are near duplicates of each other"""
+    shingle_sets = [shingles(product.title) for product in products]
+    rows = NUM_HASHES // BANDS
+    buckets = defaultdict(list)
+    matrix = signatures(shingle_sets)
+    for band in range(BANDS):
+        keys = matrix[:, band * rows:(band + 1) * rows].tobytes()
+        width = rows * matrix.itemsize
+        for index, product in enumerate(products):
+            buckets[(product.store, band, keys[index * width:(index + 1) * width])].append(index)
+
+    groups = UnionFind(len(products))
+    compared = set()
+    for members in buckets.values():
+        for position, first in enumerate(members):
+            for second in members[position + 1:]:
+                if (first, second) in compared:
+                    continue
+                compared.add((first, second))
+                a, b = products[first], products[second]
+                if abs(a.price - b.price) > price_tolerance * max(a.price, b.price):
+                    continue
+                if jaccard(shingle_sets[first], shingle_sets[second]) >= threshold:
+                    groups.union(first, second)
+
+    members_by_root = defaultdict(list)
+    for index in range(len(products)):
+        members_by_root[groups.find(index)].append(index)
+    return [members for members in members_by_root.values() if len(members) > 1]
+
+@tracing.timed('dedupe')
+def dedupe(products, threshold=0.8, price_tolerance=0.01):
+    """Products without exact or near duplicates, keeping the best discount of each.
+
+    Links are rewritten to their canonical form on the way.
+    """
+    best = {}
+    for product in products:
+        product.link = canonical_link(product.store, product.link)
+        key = product_key(product.store, product.link)
+        if key not in best or product.discount > best[key].discount:
+            best[key] = product
+    unique = list(best.values())
+    exact = len(products) - len(unique)
+
+    dropped = set()
+    for members in near_duplicate_groups(unique, threshold, price_tolerance):
+        keep = max(members, key=lambda index: unique[index].discount)
+        dropped.update(index for index in members if index != keep)
+    result = [product for index, product in enumerate(unique) if index not in dropped]
+    log.info(f"De-duplicated {len(products)} products: {exact} exact and {len(dropped)} near duplicates removed")
+    return result
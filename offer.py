@@ -1,4 +1,20 @@
+import argparse
 import csv
+import heapq
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -7,10 +23,102 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
+from bs4 import BeautifulSoup
+import soupsieve
+from urllib.parse import urljoin
 import time
-import random
-
-def setup_driver():
+import canonical
+import discounts
+import http_fetch
+import journal
+import lean_load
+import matching
+import pacing
+import page_cache
+import pagination
+import price_history
+import profiling
+import replay
+import retry
+import script_extract
+import tracing
+from product import Product
+
+log = logging.getLogger(__name__)
+
+# Resolved chromedriver path, keyed by the installed Chrome version
+DRIVER_CACHE_FILE = Path.home() / '.cache' / 'offer_finder' / 'chromedriver.json'
+CHROME_BINARIES = [
+    'google-chrome',
+    'google-chrome-stable',
+    'chromium',
+    'chromium-browser',
+    '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+]
+
+# Per-browser startup breakdown in seconds: resolve, launch, first_page
+startup_timings = []
+
+def installed_chrome_version():
+    """Version string of the local Chrome install, or None if it cannot be found"""
+    if sys.platform == 'win32':
+        try:
+            import winreg
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Software\Google\Chrome\BLBeacon") as key:
+                return winreg.QueryValueEx(key, 'version')[0]
+        except OSError:
+            return None
+    for binary in CHROME_BINARIES:
+        path = shutil.which(binary) or (binary if os.path.exists(binary) else None)
+        if not path:
+            continue
+        try:
+            output = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        match = re.search(r'\d+(\.\d+)+', output)
+        if match:
+            return match.group(0)
+    return None
+
+# Browsers start in parallel; only one of them may download and unpack a driver
+_resolve_lock = threading.Lock()
+
+def resolve_chromedriver_path():
+    """Cached chromedriver path for the installed Chrome, resolving it only after an upgrade"""
+    with _resolve_lock:
+        return _resolve_chromedriver_path()
+
+def _resolve_chromedriver_path():
+    chrome_version = installed_chrome_version()
+    try:
+        cached = json.loads(DRIVER_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        cached = {}
+    if chrome_version and cached.get('chrome_version') == chrome_version and os.path.exists(cached.get('path', '')):
+        return cached['path']
+
+    path = ChromeDriverManager().install()
+    if chrome_version:
+        try:
+            DRIVER_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            DRIVER_CACHE_FILE.write_text(json.dumps({'chrome_version': chrome_version, 'path': path}))
+        except OSError as e:
+            log.warning(f"Could not cache chromedriver path: {str(e)}")
+    return path
+
+def print_startup_report():
+    if not startup_timings:
+        return
+    print(f"\nBrowser startup ({len(startup_timings)} browser(s), mean seconds):")
+    for stage in ('resolve', 'launch', 'first_page'):
+        samples = [timings[stage] for timings in startup_timings if stage in timings]
+        if samples:
+            print(f"  {stage:12} {sum(samples) / len(samples):6.2f}")
+
+def setup_driver(lean=False, network_log=False):
+    """Start Chrome; lean skips images, fonts, media and trackers, network_log records page weight"""
+    timings = {}
     chrome_options = Options()
     chrome_options.add_argument('--headless')  # Run in headless mode
     chrome_options.add_argument('--no-sandbox')
@@ -36,171 +144,466 @@ def setup_driver():
     # Add these specific options for storage handling
     chrome_options.add_argument('--disable-local-storage')
     chrome_options.add_argument('--disable-session-storage')
+    if lean:
+        lean_load.apply_lean_options(chrome_options)
+    if network_log:
+        lean_load.enable_network_log(chrome_options)
     
-    service = Service(ChromeDriverManager().install())
+    start = time.perf_counter()
+    service = Service(resolve_chromedriver_path())
+    timings['resolve'] = time.perf_counter() - start
+
+    start = time.perf_counter()
     driver = webdriver.Chrome(service=service, options=chrome_options)
     
     # Mask webdriver presence
     driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'})
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    if lean:
+        lean_load.block_heavy_requests(driver)
+    timings['launch'] = time.perf_counter() - start
+
+    tracing.TRACER.record('driver_startup', timings['resolve'] + timings['launch'])
+    driver.startup_timings = timings
+    startup_timings.append(timings)
     return driver
 
+def load_page(driver, url):
+    """Navigate the driver to url once the host's rate limit allows, recording the load time"""
+    pacing.RATE_LIMITER.acquire(url)
+    start = time.perf_counter()
+    driver.pages_loaded = getattr(driver, 'pages_loaded', 0) + 1
+    with tracing.span('navigate', url=url):
+        driver.get(url)
+    elapsed = time.perf_counter() - start
+    http_fetch.record_latency('selenium', elapsed)
+    timings = getattr(driver, 'startup_timings', None)
+    if timings is not None and 'first_page' not in timings:
+        timings['first_page'] = elapsed
+
+def result_markers(store):
+    """page_cache.has_results markers of a store fetched over HTTP"""
+    return [AMAZON_RESULT_MARKER if store == 'Amazon' else RETAILER_SPECS[store]['result_marker']]
+
+# Any of these in the DOM means the search results have rendered
+AMAZON_READY_SELECTORS = [
+    ".s-main-slot",
+    "#search",
+    ".s-result-list",
+    ".s-search-results"
+]
+
+# Condition filters searched after the department pages
+AMAZON_OTHER_CONDITIONS = [
+    ("used", "&rh=n%3A172282%2Cp_n_condition-type%3A6461716011"),
+    ("renewed", "&rh=n%3A172282%2Cp_n_condition-type%3A3242851011"),
+    ("open box", "&rh=n%3A172282%2Cp_n_condition-type%3A16318461011"),
+    ("refurbished", "&rh=n%3A172282%2Cp_n_condition-type%3A17726800011")
+]
+
+def amazon_search_urls(query):
+    """Department/deal URLs and condition URLs, each paginated while it yields deals"""
+    base_urls = [
+        # Main search pages
+        f"https://www.amazon.com/s?k={query}&i=all-departments",
+        f"https://www.amazon.com/s?k={query}&deals-widget=%257B%2522version%2522%253A1%257D",  # Today's Deals
+        
+        # Department-specific searches
+        f"https://www.amazon.com/s?k={query}&i=electronics",
+        f"https://www.amazon.com/s?k={query}&i=computers",
+        f"https://www.amazon.com/s?k={query}&i=fashion",
+        f"https://www.amazon.com/s?k={query}&i=fashion-mens",
+        f"https://www.amazon.com/s?k={query}&i=fashion-womens",
+        f"https://www.amazon.com/s?k={query}&i=sporting",
+        f"https://www.amazon.com/s?k={query}&i=home-garden",
+        f"https://www.amazon.com/s?k={query}&i=kitchen",
+        f"https://www.amazon.com/s?k={query}&i=tools",
+        f"https://www.amazon.com/s?k={query}&i=toys-and-games",
+        f"https://www.amazon.com/s?k={query}&i=beauty",
+        f"https://www.amazon.com/s?k={query}&i=automotive",
+    ]
+    urls = [(url, None) for url in base_urls]
+    urls += [(f"https://www.amazon.com/s?k={query}{condition_param}", condition_name)
+             for condition_name, condition_param in AMAZON_OTHER_CONDITIONS]
+    return urls
+
+def load_amazon_page(driver, url):
+    """Load an Amazon search page in the browser and return its final URL.
+
+    Raises retry.FetchFailed (retry.Blocked for a captcha) when no results rendered.
+    """
+    # Clear cookies and load page
+    driver.delete_all_cookies()
+    load_page(driver, url)
+    final_url = driver.current_url
+    if not final_url.startswith("https://www.amazon.com"):
+        raise retry.FetchFailed(f"Redirected away from Amazon to {final_url}")
+
+    # Wait for results
+    if not pacing.wait_for_ready(driver, AMAZON_READY_SELECTORS):
+        if retry.looks_blocked(driver.page_source):
+            raise retry.Blocked(f"Amazon served a captcha for {url}")
+        raise retry.FetchFailed(f"Timed out waiting for Amazon results: {url}")
+    return final_url
+
+def capture_amazon_page(driver, url):
+    """Page source and final URL of an Amazon search page, from the page cache or the browser"""
+    cached = page_cache.cached_page('offer', 'Amazon', url)
+    if cached:
+        return cached.html, cached.final_url
+
+    final_url = load_amazon_page(driver, url)
+    html = driver.page_source
+    page_cache.store_page('offer', 'Amazon', url, html, final_url)
+    return html, final_url
+
+def amazon_page_products(driver, url, follow_next=False, extract="page_source"):
+    """Products and (optionally) the next page URL of one Amazon search page.
+
+    extract="script" reads the cards with a single execute_script call
+    instead of transferring the page source; such pages are not cached.
+    """
+    if extract == "script" and not page_cache.CACHE.contains(url):
+        page_url = load_amazon_page(driver, url)
+        cards, next_url = script_extract.extract_cards(driver, AMAZON_CARD_CONFIG)
+        return amazon_products_from_cards(cards, page_url), (next_url if follow_next else None)
+
+    html, page_url = capture_amazon_page(driver, url)
+    return parse_amazon_page(html, page_url, follow_next)
+
+def search_amazon_url(driver, url, condition_name=None, extract="page_source", paginator=None):
+    """Products from one Amazon search URL and the following pages while they yield deals.
+
+    Each page is retried on its own; a page that still fails keeps what was found before it.
+    Follow-up pages come from paginator, the query's paginator (default: a fresh one).
+    """
+    paginator = paginator or pagination.PAGINATOR.for_query()
+    products = []
+    if condition_name:
+        log.info(f"Searching {condition_name} products...")
+    else:
+        log.info(f"Searching Amazon: {url}")
+
+    try:
+        page_products, next_url = retry.SCHEDULER.call(
+            'Amazon', url, partial(amazon_page_products, driver, url, True, extract))
+        products.extend(page_products)
+        if condition_name and products:
+            log.info(f"Found {len(products)} {condition_name} products")
+
+        page = 1
+        while next_url and paginator.should_continue(page, page_products):
+            page += 1
+            page_url = next_url
+            log.debug(f"Checking page {page}...")
+            page_products, next_url = retry.SCHEDULER.call(
+                'Amazon', page_url, partial(amazon_page_products, driver, page_url, True, extract))
+            products.extend(page_products)
+
+    except Exception as e:
+        log.warning(f"Error searching URL {url}: {str(e)}")
+    return products
+
+def best_deal_first(product):
+    return -product.discount
+
+@tracing.timed('dedupe')
+def merge_amazon_products(all_products):
+    """Remove duplicates keeping the best deals, new discounted items first.
+
+    Products are the same when they share an ASIN (or canonical link) and
+    condition. all_products must already be in best_deal_first order, so the
+    first copy of each is the best one and a stable split keeps the order.
+    """
+    seen = set()
+    new_deals = []
+    others = []
+    for product in all_products:
+        product.link = canonical.canonical_link('Amazon', product.link)
+        key = (canonical.product_key('Amazon', product.link), product.condition)
+        if key in seen:
+            continue
+        seen.add(key)
+        if product.condition == "New" and product.discount > 0:
+            new_deals.append(product)
+        else:
+            others.append(product)
+
+    log.info(f"Found {len(new_deals) + len(others)} total unique products across all departments")
+    return new_deals + others
+
 def search_amazon(query, driver):
-    results = []
-    max_retries = 3
-    current_retry = 0
-    
-    while current_retry < max_retries:
-        try:
-            all_products = []
-            
-            # Define all search URLs including departments and deals
-            base_urls = [
-                # Main search pages
-                f"https://www.amazon.com/s?k={query}&i=all-departments",
-                f"https://www.amazon.com/s?k={query}&deals-widget=%257B%2522version%2522%253A1%257D",  # Today's Deals
-                
-                # Department-specific searches
-                f"https://www.amazon.com/s?k={query}&i=electronics",
-                f"https://www.amazon.com/s?k={query}&i=computers",
-                f"https://www.amazon.com/s?k={query}&i=fashion",
-                f"https://www.amazon.com/s?k={query}&i=fashion-mens",
-                f"https://www.amazon.com/s?k={query}&i=fashion-womens",
-                f"https://www.amazon.com/s?k={query}&i=sporting",
-                f"https://www.amazon.com/s?k={query}&i=home-garden",
-                f"https://www.amazon.com/s?k={query}&i=kitchen",
-                f"https://www.amazon.com/s?k={query}&i=tools",
-                f"https://www.amazon.com/s?k={query}&i=toys-and-games",
-                f"https://www.amazon.com/s?k={query}&i=beauty",
-                f"https://www.amazon.com/s?k={query}&i=automotive",
-            ]
-            
-            # Search each URL and its second page
-            for url in base_urls:
-                print(f"\nSearching Amazon: {url}")
-                driver.delete_all_cookies()
-                driver.get(url)
-                time.sleep(random.uniform(2, 3))
-                
-                if driver.current_url.startswith("https://www.amazon.com"):
-                    try:
-                        # Get products from first page
-                        products = get_amazon_products(driver)
-                        if products:
-                            all_products.extend(products)
-                            
-                        # Try to get second page
-                        try:
-                            next_button = driver.find_element(By.CSS_SELECTOR, ".s-pagination-next:not(.s-pagination-disabled)")
-                            if next_button:
-                                next_url = next_button.get_attribute("href")
-                                if next_url:
-                                    print("Checking second page...")
-                                    driver.get(next_url)
-                                    time.sleep(random.uniform(2, 3))
-                                    more_products = get_amazon_products(driver)
-                                    if more_products:
-                                        all_products.extend(more_products)
-                        except: pass
-                            
-                    except Exception as e:
-                        print(f"Error searching URL {url}: {str(e)}")
-                        continue
-                
-                time.sleep(random.uniform(1, 2))
-            
-            # Then search other conditions (used, renewed, etc.)
-            other_conditions = [
-                ("used", "&rh=n%3A172282%2Cp_n_condition-type%3A6461716011"),
-                ("renewed", "&rh=n%3A172282%2Cp_n_condition-type%3A3242851011"),
-                ("open box", "&rh=n%3A172282%2Cp_n_condition-type%3A16318461011"),
-                ("refurbished", "&rh=n%3A172282%2Cp_n_condition-type%3A17726800011")
-            ]
-            
-            for condition_name, condition_param in other_conditions:
-                print(f"\nSearching {condition_name} products...")
-                url = f"https://www.amazon.com/s?k={query}{condition_param}"
-                
-                # Clear cookies and load page
-                driver.delete_all_cookies()
-                driver.get(url)
-                time.sleep(random.uniform(3, 5))
-                
-                if not driver.current_url.startswith("https://www.amazon.com"):
-                    continue
-                    
-                try:
-                    # Wait for results
-                    WebDriverWait(driver, 10).until(lambda d: any([
-                        d.find_elements(By.CSS_SELECTOR, selector) for selector in [
-                            ".s-main-slot",
-                            "#search",
-                            ".s-result-list",
-                            ".s-search-results"
-                        ]
-                    ]))
-                    
-                    # Get products for this condition
-                    products = get_amazon_products(driver)
-                    if products:
-                        print(f"Found {len(products)} {condition_name} products")
-                        all_products.extend(products)
-                    
-                except Exception as e:
-                    print(f"Error searching {condition_name} products: {str(e)}")
-                    continue
-                
-                # Add delay between condition searches
-                time.sleep(random.uniform(2, 3))
-            
-            if all_products:
-                # Remove duplicates keeping the best deals
-                seen = {}
-                for product in all_products:
-                    key = (product['title'], product['price'])
-                    existing = seen.get(key)
-                    if not existing or product['discount'] > existing['discount']:
-                        seen[key] = product
-                
-                unique_products = list(seen.values())
-                print(f"\nFound {len(unique_products)} total unique products across all departments")
-                return sorted(unique_products, 
-                    key=lambda x: (
-                        -int(x.get("condition", "New") == "New" and x["discount"] > 0),
-                        -x["discount"]
-                    ))
-            
-            print(f"No products found on attempt {current_retry + 1}")
-            current_retry += 1
-            
-        except Exception as e:
-            print(f"Error on attempt {current_retry + 1}: {str(e)}")
-            if current_retry < max_retries - 1:
-                time.sleep(random.uniform(3, 5))
-            current_retry += 1
-    
-    print("All attempts to fetch Amazon products failed")
+    """Every department URL (and its second page), then other conditions.
+
+    Failed pages are retried individually by search_amazon_url, so one
+    flaky URL never discards the products already collected.
+    """
+    all_products = []
+    paginator = pagination.PAGINATOR.for_query()
+    for url, condition_name in amazon_search_urls(query):
+        all_products.extend(search_amazon_url(driver, url, condition_name, paginator=paginator))
+
+    if all_products:
+        return merge_amazon_products(sorted(all_products, key=best_deal_first))
+    log.info("No Amazon products found")
     return []
 
-def get_amazon_products(driver):
-    """Helper function to extract products from current Amazon page"""
+# Selectors shared by every Amazon extraction mode
+AMAZON_GRID_SELECTORS = [
+    ".s-main-slot",
+    "#search .s-result-list",
+    "[data-component-type='s-search-results']"
+]
+AMAZON_ITEM_SELECTOR = "div[data-asin]:not([data-asin='']):not(.AdHolder)"
+AMAZON_TITLE_SELECTORS = [
+    "h2 a span",
+    ".a-text-normal",
+    ".a-link-normal .a-text-normal"
+]
+AMAZON_PRICE_SELECTOR = ".a-price .a-offscreen"
+AMAZON_CONDITION_SELECTOR = ".a-color-secondary:not(.a-size-base), .a-color-base:not(.a-text-normal), [class*='condition'], [class*='state'], .a-size-base"
+AMAZON_ORIGINAL_PRICE_SELECTOR = ".a-text-price .a-offscreen, .a-price[data-a-strike='true'] .a-offscreen"
+AMAZON_BADGE_SELECTOR = "span.a-badge-label, span.a-badge-supplementary-text"
+AMAZON_LINK_SELECTOR = "h2 a"
+
+# Condition filter ids used in Amazon search URLs
+AMAZON_CONDITION_CODES = [
+    ("6461716011", "Used"),
+    ("3242851011", "Renewed"),
+    ("16318461011", "Open Box"),
+    ("17726800011", "Refurbished"),
+    ("2224371011", "New"),
+]
+CONDITION_WORDS = ['used', 'renewed', 'refurbished', 'open box', 'pre-owned']
+DEAL_BADGE_WORDS = ['deal', 'save', 'off', '%']
+
+# Amazon search results are server-rendered
+AMAZON_REQUIRES_JS = False
+# Text only a page with result cards contains; a cheap check before an HTTP page is cached
+AMAZON_RESULT_MARKER = 's-search-result'
+
+AMAZON_NEXT_PAGE_SELECTOR = ".s-pagination-next:not(.s-pagination-disabled)"
+
+AMAZON_CARD_CONFIG = script_extract.card_config(
+    AMAZON_ITEM_SELECTOR,
+    {
+        'title': script_extract.field(AMAZON_TITLE_SELECTORS),
+        'price': script_extract.field([AMAZON_PRICE_SELECTOR]),
+        'condition': script_extract.field([AMAZON_CONDITION_SELECTOR], every=True),
+        'original_price': script_extract.field([AMAZON_ORIGINAL_PRICE_SELECTOR], every=True),
+        'badge': script_extract.field([AMAZON_BADGE_SELECTOR], every=True),
+        'link': script_extract.field([AMAZON_LINK_SELECTOR], attr='href'),
+    },
+    grid=AMAZON_GRID_SELECTORS,
+    next_link=AMAZON_NEXT_PAGE_SELECTOR,
+)
+
+def parse_price(text):
+    return float(text.replace('$', '').replace(',', '').strip())
+
+def amazon_url_condition(url):
+    """Condition implied by the condition-type filter in a search URL"""
+    url = url.lower()
+    if "condition-type" in url:
+        for code, condition in AMAZON_CONDITION_CODES:
+            if code in url:
+                return condition
+    return ""
+
+def get_amazon_products(driver, mode="page_source", page_url=None):
+    """Helper function to extract products from current Amazon page
+
+    mode="page_source" reads driver.page_source once and parses every card
+    in-process; mode="script" reads every card in one execute_script call;
+    mode="dom" walks the cards through WebDriver calls.
+    page_url overrides driver.current_url (used when replaying saved pages).
+    """
     try:
+        current_url = page_url or driver.current_url
         # First ensure we're on a valid page
-        if not driver.current_url.startswith("https://www.amazon.com"):
+        if not current_url.startswith("https://www.amazon.com"):
             return []
-            
+
+        if mode == "page_source":
+            return parse_amazon_products(driver.page_source, current_url)
+        if mode == "script":
+            cards, _ = script_extract.extract_cards(driver, AMAZON_CARD_CONFIG)
+            return amazon_products_from_cards(cards, current_url)
+        return get_amazon_products_dom(driver, current_url)
+
+    except Exception as e:
+        log.warning(f"Error processing Amazon page: {str(e)}")
+        return []
+
+@tracing.timed('extract')
+def parse_amazon_products(html, page_url, soup=None):
+    """Extract products from a captured Amazon search page without WebDriver calls"""
+    try:
+        soup = soup or BeautifulSoup(html, 'html.parser')
+
+        product_grid = None
+        for selector in AMAZON_GRID_SELECTORS:
+            product_grid = soup.select_one(selector)
+            if product_grid:
+                break
+
+        if not product_grid:
+            log.warning("Could not locate product grid")
+            return []
+
+        items = product_grid.select(AMAZON_ITEM_SELECTOR)
+        log.debug("Found %d potential items", len(items))
+
+        products = []
+        url_condition = amazon_url_condition(page_url)
+        current_url = page_url.lower()
+
+        for item in items:
+            try:
+                title = None
+                for selector in AMAZON_TITLE_SELECTORS:
+                    title_elem = item.select_one(selector)
+                    if title_elem:
+                        title = title_elem.get_text().strip()
+                        if title:
+                            break
+
+                if not title:
+                    continue
+
+                price_elem = item.select_one(AMAZON_PRICE_SELECTOR)
+                if not price_elem:
+                    continue
+
+                try:
+                    current_price = parse_price(price_elem.get_text())
+                except ValueError:
+                    continue
+
+                original_price = current_price
+                discount = 0.0
+
+                condition = "New"
+                for elem in item.select(AMAZON_CONDITION_SELECTOR):
+                    text = elem.get_text().strip()
+                    if any(state in text.lower() for state in CONDITION_WORDS):
+                        condition = text
+                        break
+
+                if url_condition and condition == "New":
+                    condition = url_condition
+
+                for orig_price_elem in item.select(AMAZON_ORIGINAL_PRICE_SELECTOR):
+                    try:
+                        price = parse_price(orig_price_elem.get_text())
+                    except ValueError:
+                        continue
+                    if price > current_price:
+                        original_price = price
+                        discount = ((original_price - current_price) / original_price) * 100
+                        break
+
+                if discount == 0:
+                    for badge in item.select(AMAZON_BADGE_SELECTOR):
+                        if any(word in badge.get_text().lower() for word in DEAL_BADGE_WORDS):
+                            discount = discounts.BADGE_DISCOUNT
+                            break
+
+                link_elem = item.select_one(AMAZON_LINK_SELECTOR)
+                if not link_elem or not link_elem.get('href'):
+                    continue
+                link = urljoin(page_url, link_elem['href'])
+
+                # Only add products if they're genuinely new or have explicit conditions
+                if condition != "New" or url_condition == "New" or "deals-widget" in current_url:
+                    products.append(Product(title, current_price, original_price, discount, link, 'Amazon', condition))
+
+            except Exception as e:
+                log.debug("Error processing item: %s", e)
+                continue
+
+        return products
+
+    except Exception as e:
+        log.warning(f"Error processing Amazon page: {str(e)}")
+        return []
+
+@tracing.timed('extract')
+def amazon_products_from_cards(cards, page_url):
+    """Apply the Amazon extraction rules to card fields read by script_extract"""
+    if cards is None:
+        log.warning("Could not locate product grid")
+        return []
+    log.debug("Found %d potential items", len(cards))
+
+    products = []
+    url_condition = amazon_url_condition(page_url)
+    current_url = page_url.lower()
+
+    for card in cards:
+        title = next((text.strip() for text in card['title'] if text and text.strip()), None)
+        if not title or not card['price'][0]:
+            continue
+
+        try:
+            current_price = parse_price(card['price'][0])
+        except ValueError:
+            continue
+
+        original_price = current_price
+        discount = 0.0
+
+        condition = next((text.strip() for text in card['condition']
+                          if any(state in text.lower() for state in CONDITION_WORDS)), "New")
+        if url_condition and condition == "New":
+            condition = url_condition
+
+        for text in card['original_price']:
+            try:
+                price = parse_price(text)
+            except ValueError:
+                continue
+            if price > current_price:
+                original_price = price
+                discount = ((original_price - current_price) / original_price) * 100
+                break
+
+        if discount == 0 and any(word in text.lower() for text in card['badge'] for word in DEAL_BADGE_WORDS):
+            discount = discounts.BADGE_DISCOUNT
+
+        link = card['link'][0]
+        if not link:
+            continue
+
+        # Only add products if they're genuinely new or have explicit conditions
+        if condition != "New" or url_condition == "New" or "deals-widget" in current_url:
+            products.append(Product(title, current_price, original_price, discount, link, 'Amazon', condition))
+
+    return products
+
+def amazon_next_page_url(soup, page_url):
+    """Absolute URL of the next results page in a parsed Amazon page, if any"""
+    next_link = compiled_selector(AMAZON_NEXT_PAGE_SELECTOR).select_one(soup)
+    if next_link is None or not next_link.get('href'):
+        return None
+    return urljoin(page_url, next_link['href'])
+
+def parse_amazon_page(html, page_url, follow_next=False):
+    """Products and (for department pages) the next page URL from a fetched Amazon page, parsed once"""
+    soup = BeautifulSoup(html, 'html.parser')
+    next_url = amazon_next_page_url(soup, page_url) if follow_next else None
+    return parse_amazon_products(html, page_url, soup), next_url
+
+@tracing.timed('extract')
+def get_amazon_products_dom(driver, current_url):
+    """Extract products from the loaded Amazon page through WebDriver element calls"""
+    try:
         # Initialize products list at the start
         products = []
             
         # Try multiple selectors for product grid
-        grid_selectors = [
-            ".s-main-slot",
-            "#search .s-result-list",
-            "[data-component-type='s-search-results']"
-        ]
-        
         product_grid = None
-        for selector in grid_selectors:
+        for selector in AMAZON_GRID_SELECTORS:
             try:
                 elements = driver.find_elements(By.CSS_SELECTOR, selector)
                 if elements:
@@ -209,27 +612,23 @@ def get_amazon_products(driver):
             except: continue
         
         if not product_grid:
-            print("Could not locate product grid")
+            log.warning("Could not locate product grid")
             return []
 
         # Get items with more specific selector
-        items = product_grid.find_elements(
-            By.CSS_SELECTOR, 
-            "div[data-asin]:not([data-asin='']):not(.AdHolder)"
-        )
+        items = product_grid.find_elements(By.CSS_SELECTOR, AMAZON_ITEM_SELECTOR)
         
-        print(f"Found {len(items)} potential items")
+        log.debug("Found %d potential items", len(items))
+
+        # Check URL for condition context
+        url_condition = amazon_url_condition(current_url)
+        current_url = current_url.lower()
         
         for item in items:
             try:
                 # Check for valid ASIN and get title
                 title = None
-                title_selectors = [
-                    "h2 a span",
-                    ".a-text-normal",
-                    ".a-link-normal .a-text-normal"
-                ]
-                for selector in title_selectors:
+                for selector in AMAZON_TITLE_SELECTORS:
                     try:
                         title_elem = item.find_element(By.CSS_SELECTOR, selector)
                         title = title_elem.text.strip()
@@ -241,13 +640,12 @@ def get_amazon_products(driver):
                     continue
 
                 # Get price information
-                price_elements = item.find_elements(By.CSS_SELECTOR, ".a-price .a-offscreen")
+                price_elements = item.find_elements(By.CSS_SELECTOR, AMAZON_PRICE_SELECTOR)
                 if not price_elements:
                     continue
 
                 try:
-                    current_price = float(price_elements[0].get_attribute('innerHTML')
-                        .replace('$', '').replace(',', '').strip())
+                    current_price = parse_price(price_elements[0].get_attribute('innerHTML'))
                 except:
                     continue
 
@@ -257,30 +655,13 @@ def get_amazon_products(driver):
                 
                 # Enhanced condition detection
                 condition = "New"  # Default to New
-                url_condition = ""
-                
-                # Check URL for condition context
-                current_url = driver.current_url.lower()
-                if "condition-type" in current_url:
-                    if "6461716011" in current_url:
-                        url_condition = "Used"
-                    elif "3242851011" in current_url:
-                        url_condition = "Renewed"
-                    elif "16318461011" in current_url:
-                        url_condition = "Open Box"
-                    elif "17726800011" in current_url:
-                        url_condition = "Refurbished"
-                    elif "2224371011" in current_url:
-                        url_condition = "New"
 
                 # Look for specific condition in the item
                 try:
-                    condition_elements = item.find_elements(By.CSS_SELECTOR, 
-                        ".a-color-secondary:not(.a-size-base), .a-color-base:not(.a-text-normal), [class*='condition'], [class*='state'], .a-size-base"
-                    )
+                    condition_elements = item.find_elements(By.CSS_SELECTOR, AMAZON_CONDITION_SELECTOR)
                     for elem in condition_elements:
                         text = elem.text.lower()
-                        if any(state in text for state in ['used', 'renewed', 'refurbished', 'open box', 'pre-owned']):
+                        if any(state in text for state in CONDITION_WORDS):
                             condition = elem.text.strip()
                             break
                 except: pass
@@ -291,13 +672,10 @@ def get_amazon_products(driver):
 
                 # Check for original price and calculate discount
                 try:
-                    original_price_elements = item.find_elements(By.CSS_SELECTOR, 
-                        ".a-text-price .a-offscreen, .a-price[data-a-strike='true'] .a-offscreen"
-                    )
+                    original_price_elements = item.find_elements(By.CSS_SELECTOR, AMAZON_ORIGINAL_PRICE_SELECTOR)
                     for orig_price_elem in original_price_elements:
                         try:
-                            price = float(orig_price_elem.get_attribute('innerHTML')
-                                .replace('$', '').replace(',', '').strip())
+                            price = parse_price(orig_price_elem.get_attribute('innerHTML'))
                             if price > current_price:
                                 original_price = price
                                 discount = ((original_price - current_price) / original_price) * 100
@@ -308,684 +686,941 @@ def get_amazon_products(driver):
                 # Check for deal badges if no discount found
                 if discount == 0:
                     try:
-                        deal_badges = item.find_elements(By.CSS_SELECTOR, 
-                            "span.a-badge-label, span.a-badge-supplementary-text"
-                        )
+                        deal_badges = item.find_elements(By.CSS_SELECTOR, AMAZON_BADGE_SELECTOR)
                         for badge in deal_badges:
-                            if any(word in badge.text.lower() for word in ['deal', 'save', 'off', '%']):
-                                discount = 0.1
+                            if any(word in badge.text.lower() for word in DEAL_BADGE_WORDS):
+                                discount = discounts.BADGE_DISCOUNT
                                 break
                     except: pass
 
                 # Get product link
                 try:
-                    link = item.find_element(By.CSS_SELECTOR, "h2 a").get_attribute("href")
+                    link = item.find_element(By.CSS_SELECTOR, AMAZON_LINK_SELECTOR).get_attribute("href")
                 except:
                     continue
 
                 # Only add products if they're genuinely new or have explicit conditions
                 if condition != "New" or url_condition == "New" or "deals-widget" in current_url:
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "condition": condition,
-                        "link": link
-                    })
+                    products.append(Product(title, current_price, original_price, discount, link, 'Amazon', condition))
                     
             except Exception as e:
-                print(f"Error processing item: {str(e)}")
+                log.debug("Error processing item: %s", e)
                 continue
 
         return products
 
     except Exception as e:
-        print(f"Error processing Amazon page: {str(e)}")
+        log.warning(f"Error processing Amazon page: {str(e)}")
         return []
 
-def search_walmart(query, driver):
-    try:
-        url = f"https://www.walmart.com/search?q={query.replace(' ', '+')}"
-        driver.get(url)
-        time.sleep(random.uniform(4, 6))
-
-        # Updated wait and selectors
+# Declarative extraction specs for the non-Amazon retailers. Each field lists
+# fallback selectors in the order they are tried; *_strip lists the extra
+# tokens removed before a price is parsed. name is the store products are
+# tagged with; requires_js marks stores whose results only appear after
+# client-side rendering. result_marker is text only a page with result
+# cards contains, checked before a page fetched over HTTP is cached.
+RETAILER_SPECS = {
+    'Walmart': {
+        'name': 'Walmart',
+        'url': "https://www.walmart.com/search?q={query}",
+        'requires_js': False,
+        'wait_selector': "[data-testid='search-results']",
+        'wait_timeout': 20,
+        'refresh_on_timeout': True,
+        'item': "[data-testid='search-results'] [data-testid='list-view'] > div",
+        'result_marker': 'list-view',
+        'title': [
+            "span[data-automation-id='product-title']",
+            "a[data-automation-id='product-title']",
+            "a span.w_U"
+        ],
+        'price': [
+            "span.w_V",
+            "span[data-automation-id='product-price']",
+            "div[data-automation-id='product-price'] span"
+        ],
+        'price_strip': ['Now'],
+        'price_requires_dollar': True,
+        'was_price': [
+            "span.w_X",
+            "*[data-automation-id='strikethrough-price']",
+            "div[class*='strike-through']",
+            "span[class*='line-through']"
+        ],
+        'badge': [
+            "span[class*='badge']",
+            "div[class*='discount']",
+            "span[class*='deal']",
+            "div[class*='save']"
+        ],
+        'badge_words': ['deal', 'save', 'off', '%', 'reduced'],
+        'link': "a[link-identifier='linkTest']",
+        'include_title_words': ['rollback', 'clearance'],
+    },
+    'Best Buy': {
+        'name': 'Best Buy',
+        'url': "https://www.bestbuy.com/site/searchpage.jsp?st={query}",
+        'requires_js': False,
+        'wait_selector': ".sku-item-list",
+        'wait_timeout': 15,
+        'item': ".sku-item",
+        'result_marker': 'sku-item',
+        'title': [".sku-title a"],
+        'title_attr': 'title',
+        'price': [".priceView-customer-price span"],
+        'was_price': [".pricing-price__regular-price"],
+        'was_strip': ['Was'],
+        'link': ".sku-title a",
+    },
+    'Target': {
+        'name': 'Target',
+        'url': "https://www.target.com/s?searchTerm={query}",
+        'requires_js': True,
+        'wait_selector': "[data-test='product-grid']",
+        'wait_timeout': 20,
+        'scrolls': 3,
+        'item': "[data-test='product-grid'] > div",
+        'title': ["[data-test='product-title']"],
+        'price': [
+            "[data-test='product-price']",
+            "span[data-test='current-price']",
+            ".styles__CurrentPriceWrapper-sc"
+        ],
+        'price_requires_dollar': True,
+        'was_price': [
+            "[data-test='product-regular-price']",
+            "span[data-test='previous-price']",
+            ".styles__ComparisonPriceWrapper-sc"
+        ],
+        'was_strip': ['Reg', 'reg.'],
+        'badge': [
+            "[data-test='product-badge']",
+            ".styles__BadgeWrapper-sc",
+            "span[class*='deal']"
+        ],
+        'badge_words': ['sale', 'deal', 'save', 'off', '%'],
+        'link': "a[data-test='product-title']",
+        'include_title_words': ['clearance', 'sale'],
+    },
+    "Macy's": {
+        'name': "Macy's",
+        'url': "https://www.macys.com/shop/featured/{query}",
+        'requires_js': True,
+        'query_separator': '-',
+        'consent_button_id': "onetrust-accept-btn-handler",
+        'wait_selector': ".productThumbnail",
+        'wait_timeout': 20,
+        'item': ".productThumbnail",
+        'title': ["div.productDescription"],
+        'price': [".prices span.price"],
+        'was_price': [".prices .original"],
+        'link': "a.productDescLink",
+    },
+    'Old Navy': {
+        'name': 'Old Navy',
+        'url': "https://oldnavy.gap.com/browse/search.do?searchText={query}",
+        'requires_js': True,
+        'wait_selector': ".product-card",
+        'wait_timeout': 15,
+        'item': ".product-card",
+        'title': [".product-card__name"],
+        'price': [".product-price__highlight"],
+        'was_price': [".product-price__was"],
+        'was_strip': ['Was'],
+        'link': ".product-card__link",
+    },
+    'H&M': {
+        'name': 'H&M',
+        'url': "https://www2.hm.com/en_us/search-results.html?q={query}",
+        'requires_js': False,
+        'wait_selector': "div.search-results-items",
+        'wait_timeout': 15,
+        'item': "div.search-results-items > div.item",
+        'result_marker': 'search-results-items',
+        'title': [".item-heading a"],
+        'price': [".item-price .price"],
+        'was_price': [".item-price .price-regular"],
+        'link': ".item-heading a",
+    },
+    'Forever 21': {
+        'name': 'Forever 21',
+        'url': "https://www.forever21.com/us/search?q={query}&lang=en_US",
+        'requires_js': True,
+        'wait_selector': "[data-testid='product-grid']",
+        'wait_timeout': 15,
+        'item': "[data-testid='product-grid'] > div",
+        'title': ["[data-testid='product-title']"],
+        'price': ["[data-testid='product-price-sale'], [data-testid='product-price']"],
+        'was_price': ["[data-testid='product-price-original']"],
+        'link': "a",
+    },
+    'Zara': {
+        'name': 'Zara',
+        'url': "https://www.zara.com/us/en/search?searchTerm={query}&section=MAN",
+        'requires_js': True,
+        'wait_selector': ".search-results",
+        'wait_timeout': 15,
+        'item': ".search-results .product",
+        'title': [".product-name"],
+        'price': [".price-current"],
+        'was_price': [".price-original"],
+        'link': "a",
+    },
+}
+
+# Compiled selectors are cached so every page reuses the same matchers
+_compiled_selectors = {}
+
+def compiled_selector(selector):
+    pattern = _compiled_selectors.get(selector)
+    if pattern is None:
+        pattern = _compiled_selectors[selector] = soupsieve.compile(selector)
+    return pattern
+
+def clean_price(text, strip_tokens=()):
+    """Parse a displayed price such as 'Now $1,299.99' or '$10.00 - $20.00'"""
+    for token in strip_tokens:
+        text = text.replace(token, '')
+    text = text.split('-')[0]
+    return parse_price(''.join(text.split()))
+
+def node_text(node):
+    return ' '.join(node.get_text().split())
+
+def parse_first_price(texts, strip_tokens=(), requires_dollar=False, above=None):
+    """Return the first parseable price among candidate texts, skipping None"""
+    for text in texts:
+        if text is None:
+            continue
+        if requires_dollar and '$' not in text:
+            continue
         try:
-            WebDriverWait(driver, 20).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='search-results']"))
-            )
-        except:
-            print("Retrying Walmart load...")
-            driver.refresh()
-            time.sleep(3)
-
-        # Updated item selectors
-        items = driver.find_elements(By.CSS_SELECTOR, 
-            "[data-testid='search-results'] [data-testid='list-view'] > div"
-        )
-        print(f"Debug: Found {len(items)} potential Walmart items")
-
-        products = []
-        for item in items:
-            try:
-                # Multiple selectors for title
-                title_selectors = [
-                    "span[data-automation-id='product-title']",
-                    "a[data-automation-id='product-title']",
-                    "a span.w_U"
-                ]
-                title = None
-                for selector in title_selectors:
-                    try:
-                        title = item.find_element(By.CSS_SELECTOR, selector).text.strip()
-                        if title: break
-                    except: continue
-
-                # Multiple selectors for current price
-                price_selectors = [
-                    "span.w_V",
-                    "span[data-automation-id='product-price']",
-                    "div[data-automation-id='product-price'] span"
-                ]
-                current_price = None
-                for selector in price_selectors:
-                    try:
-                        price_text = item.find_element(By.CSS_SELECTOR, selector).text
-                        if '$' in price_text:
-                            current_price = float(price_text.replace('$', '').replace(',', '').replace('Now', '').strip())
-                            break
-                    except: continue
-
-                if not (title and current_price):
+            price = clean_price(text, strip_tokens)
+        except ValueError:
+            continue
+        if above is None or price > above:
+            return price
+    return None
+
+def first_price(item, selectors, strip_tokens=(), requires_dollar=False, above=None):
+    """Return the first parseable price among the fallback selectors"""
+    nodes = (compiled_selector(selector).select_one(item) for selector in selectors)
+    return parse_first_price((node.get_text() for node in nodes if node is not None),
+                             strip_tokens, requires_dollar, above)
+
+@tracing.timed('extract')
+def extract_products(html, spec, page_url):
+    """Run a retailer extraction spec over a captured page source"""
+    soup = BeautifulSoup(html, 'html.parser')
+    items = compiled_selector(spec['item']).select(soup)
+    log.debug("Found %d potential items", len(items))
+
+    products = []
+    for item in items:
+        try:
+            title = None
+            for selector in spec['title']:
+                node = compiled_selector(selector).select_one(item)
+                if node is None:
                     continue
+                title = (spec.get('title_attr') and node.get(spec['title_attr'])) or node_text(node)
+                if title:
+                    break
 
-                # Look for any indication of a deal
-                original_price = current_price
-                discount = 0.0
-
-                # Check crossed out prices
-                try:
-                    was_selectors = [
-                        "span.w_X",
-                        "*[data-automation-id='strikethrough-price']",
-                        "div[class*='strike-through']",
-                        "span[class*='line-through']"
-                    ]
-                    for selector in was_selectors:
-                        was_elem = item.find_element(By.CSS_SELECTOR, selector)
-                        was_text = was_elem.text.strip()
-                        if '$' in was_text:
-                            was_price = float(was_text.replace('$', '').replace(',', '').strip())
-                            if was_price > current_price:
-                                original_price = was_price
-                                discount = ((original_price - current_price) / original_price) * 100
-                                break
-                except: pass
-
-                # Check for deal badges if no discount found
-                if discount == 0:
-                    badge_selectors = [
-                        "span[class*='badge']",
-                        "div[class*='discount']",
-                        "span[class*='deal']",
-                        "div[class*='save']"
-                    ]
-                    for selector in badge_selectors:
-                        try:
-                            badge = item.find_element(By.CSS_SELECTOR, selector)
-                            if any(word in badge.text.lower() for word in ['deal', 'save', 'off', '%', 'reduced']):
-                                discount = 0.1  # Minimal discount to include item
-                                break
-                        except: continue
-
-                link = item.find_element(By.CSS_SELECTOR, "a[link-identifier='linkTest']").get_attribute("href")
-
-                # Include items with any indication of discount
-                if discount > 0 or "rollback" in title.lower() or "clearance" in title.lower():
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
-
-            except Exception as e:
+            current_price = first_price(item, spec['price'], spec.get('price_strip', ()),
+                                        spec.get('price_requires_dollar', False))
+            if not (title and current_price):
                 continue
 
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
-
-    except Exception as e:
-        print(f"Error searching Walmart: {str(e)}")
-        return []
+            original_price = current_price
+            discount = 0.0
+
+            was_price = first_price(item, spec.get('was_price', []), spec.get('was_strip', ()),
+                                    above=current_price)
+            if was_price:
+                original_price = was_price
+                discount = ((original_price - current_price) / original_price) * 100
+
+            # Check for deal badges if no discount found
+            if discount == 0:
+                for selector in spec.get('badge', []):
+                    badge = compiled_selector(selector).select_one(item)
+                    if badge and any(word in badge.get_text().lower() for word in spec['badge_words']):
+                        discount = discounts.BADGE_DISCOUNT  # Minimal discount to include item
+                        break
+
+            link_node = compiled_selector(spec['link']).select_one(item)
+            if link_node is None or not link_node.get('href'):
+                continue
+            link = urljoin(page_url, link_node['href'])
 
-def search_bestbuy(query, driver):
-    try:
-        url = f"https://www.bestbuy.com/site/searchpage.jsp?st={query.replace(' ', '+')}"
-        driver.get(url)
-        time.sleep(random.uniform(2, 4))
-        
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".sku-item-list"))
-        )
-        
-        products = []
-        items = driver.find_elements(By.CSS_SELECTOR, ".sku-item")
-        
-        for item in items:
-            try:
-                title_elem = item.find_element(By.CSS_SELECTOR, ".sku-title a")
-                title = title_elem.get_attribute('title') or title_elem.text.strip()
-                current_price = float(item.find_element(By.CSS_SELECTOR, ".priceView-customer-price span").text.replace('$', '').replace(',', ''))
-                link = item.find_element(By.CSS_SELECTOR, ".sku-title a").get_attribute("href")
-                
-                # Get original price if available
-                original_price = current_price
-                discount = 0.0
-                try:
-                    was_price = item.find_element(By.CSS_SELECTOR, ".pricing-price__regular-price").text
-                    original_price = float(was_price.replace('Was $', '').replace(',', ''))
-                    if original_price > current_price:
-                        discount = ((original_price - current_price) / original_price) * 100
-                except: pass
-                
-                if discount > 0:
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
-            except: continue
-            
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
-    except Exception as e:
-        print(f"Error searching Best Buy: {str(e)}")
-        return []
+            lowered_title = title.lower()
+            if discount > 0 or any(word in lowered_title for word in spec.get('include_title_words', [])):
+                products.append(Product(title, current_price, original_price, discount, link, spec['name']))
 
-def search_target(query, driver):
+        except Exception as e:
+            log.debug("Error processing item: %s", e)
+            continue
+
+    return products
+
+def spec_card_config(spec):
+    """script_extract card config reading the same fields as extract_products"""
+    return script_extract.card_config(spec['item'], {
+        'title': script_extract.field(spec['title'], attr=spec.get('title_attr')),
+        'price': script_extract.field(spec['price']),
+        'was_price': script_extract.field(spec.get('was_price', [])),
+        'badge': script_extract.field(spec.get('badge', [])),
+        'link': script_extract.field([spec['link']], attr='href'),
+    })
+
+@tracing.timed('extract')
+def products_from_cards(cards, spec):
+    """Apply a retailer extraction spec to card fields read by script_extract"""
+    log.debug("Found %d potential items", len(cards))
+
+    products = []
+    for card in cards:
+        title = next((' '.join(text.split()) for text in card['title'] if text and text.strip()), None)
+        current_price = parse_first_price(card['price'], spec.get('price_strip', ()),
+                                          spec.get('price_requires_dollar', False))
+        if not (title and current_price):
+            continue
+
+        original_price = current_price
+        discount = 0.0
+
+        was_price = parse_first_price(card['was_price'], spec.get('was_strip', ()), above=current_price)
+        if was_price:
+            original_price = was_price
+            discount = ((original_price - current_price) / original_price) * 100
+
+        # Check for deal badges if no discount found
+        if discount == 0 and any(text and word in text.lower()
+                                 for text in card['badge'] for word in spec['badge_words']):
+            discount = discounts.BADGE_DISCOUNT  # Minimal discount to include item
+
+        link = card['link'][0]
+        if not link:
+            continue
+
+        lowered_title = title.lower()
+        if discount > 0 or any(word in lowered_title for word in spec.get('include_title_words', [])):
+            products.append(Product(title, current_price, original_price, discount, link, spec['name']))
+
+    return products
+
+def parse_retailer_page(spec, html, page_url):
+    return extract_products(html, spec, page_url), None
+
+def retailer_search_url(spec, query):
+    return spec['url'].format(query=query.replace(' ', spec.get('query_separator', '+')))
+
+def search_retailer(store, query, driver, extract="page_source"):
+    """Load a retailer search page and extract it with the store's spec
+
+    extract="script" reads the cards with a single execute_script call
+    instead of transferring the page source; such pages are not cached.
+    The page load is retried with backoff behind the store's circuit breaker.
+    """
+    spec = RETAILER_SPECS[store]
     try:
-        url = f"https://www.target.com/s?searchTerm={query.replace(' ', '+')}"
-        driver.get(url)
-        time.sleep(random.uniform(4, 6))
-
-        # Updated wait and selectors
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "[data-test='product-grid']"))
-        )
-
-        # Scroll to load more items
-        for _ in range(3):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
-
-        items = driver.find_elements(By.CSS_SELECTOR, "[data-test='product-grid'] > div")
-        print(f"Debug: Found {len(items)} Target items")
-
-        products = []
-        for item in items:
-            try:
-                title = item.find_element(By.CSS_SELECTOR, "[data-test='product-title']").text.strip()
-                
-                # Multiple price selectors
-                price_selectors = [
-                    "[data-test='product-price']",
-                    "span[data-test='current-price']",
-                    ".styles__CurrentPriceWrapper-sc"
-                ]
-                current_price = None
-                for selector in price_selectors:
-                    try:
-                        price_text = item.find_element(By.CSS_SELECTOR, selector).text
-                        if '$' in price_text:
-                            current_price = float(price_text.replace('$', '').replace(',', '').split('-')[0].strip())
-                            break
-                    except: continue
-
-                if not current_price:
-                    continue
-
-                # Check multiple indicators for deals
-                original_price = current_price
-                discount = 0.0
-
-                # Check regular price
-                try:
-                    reg_selectors = [
-                        "[data-test='product-regular-price']",
-                        "span[data-test='previous-price']",
-                        ".styles__ComparisonPriceWrapper-sc"
-                    ]
-                    for selector in reg_selectors:
-                        reg_elem = item.find_element(By.CSS_SELECTOR, selector)
-                        reg_text = reg_elem.text.replace('Reg', '').replace('reg.', '').strip()
-                        if '$' in reg_text:
-                            orig_price = float(reg_text.replace('$', '').replace(',', '').strip())
-                            if orig_price > current_price:
-                                original_price = orig_price
-                                discount = ((original_price - current_price) / original_price) * 100
-                                break
-                except: pass
-
-                # Check for deal badges
-                if discount == 0:
-                    try:
-                        badge_selectors = [
-                            "[data-test='product-badge']",
-                            ".styles__BadgeWrapper-sc",
-                            "span[class*='deal']"
-                        ]
-                        for selector in badge_selectors:
-                            badge = item.find_element(By.CSS_SELECTOR, selector)
-                            if any(word in badge.text.lower() for word in ['sale', 'deal', 'save', 'off', '%']):
-                                discount = 0.1
-                                break
-                    except: pass
-
-                link = item.find_element(By.CSS_SELECTOR, "a[data-test='product-title']").get_attribute("href")
-
-                if discount > 0 or "clearance" in title.lower() or "sale" in title.lower():
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
-
-            except Exception as e:
-                continue
+        url = retailer_search_url(spec, query)
+        cached = page_cache.cached_page('offer', store, url)
+        if cached:
+            products = extract_products(cached.html, spec, cached.final_url)
+            return sorted(products, key=lambda x: x.discount, reverse=True)
 
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
+        products = retry.SCHEDULER.call(store, url, partial(load_retailer_page, store, spec, url, driver, extract))
+        return sorted(products, key=lambda x: x.discount, reverse=True)
 
     except Exception as e:
-        print(f"Error searching Target: {str(e)}")
+        log.warning(f"Error searching {store}: {str(e)}")
         return []
 
-def search_macys(query, driver):
-    try:
-        url = f"https://www.macys.com/shop/featured/{query.replace(' ', '-')}"
-        print(f"Debug: Accessing Macy's URL - {url}")
-        driver.get(url)
-        time.sleep(random.uniform(4, 6))
+def load_retailer_page(store, spec, url, driver, extract="page_source"):
+    """Products of one retailer search page loaded in the browser; raises retry.FetchFailed if it did not render"""
+    log.debug("Accessing %s URL %s", store, url)
+    load_page(driver, url)
 
-        # Accept cookies if present
+    # Accept cookies if present
+    if spec.get('consent_button_id'):
         try:
             cookie_button = WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
+                EC.element_to_be_clickable((By.ID, spec['consent_button_id']))
             )
             cookie_button.click()
         except: pass
 
-        # Updated wait and selectors
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".productThumbnail"))
-        )
-
-        items = driver.find_elements(By.CSS_SELECTOR, ".productThumbnail")
-        products = []
-
-        for item in items:
-            try:
-                title = item.find_element(By.CSS_SELECTOR, "div.productDescription").text.strip()
-                
-                price_text = item.find_element(By.CSS_SELECTOR, ".prices span.price").text
-                current_price = float(price_text.replace('$', '').replace(',', '').strip())
-                
-                original_price = current_price
-                discount = 0.0
-                try:
-                    orig_elem = item.find_element(By.CSS_SELECTOR, ".prices .original")
-                    orig_price = float(orig_elem.text.replace('$', '').replace(',', '').strip())
-                    if orig_price > current_price:
-                        original_price = orig_price
-                        discount = ((original_price - current_price) / original_price) * 100
-                except: pass
-
-                link = item.find_element(By.CSS_SELECTOR, "a.productDescLink").get_attribute("href")
+    ready = pacing.wait_for_ready(driver, [spec['wait_selector']], spec['wait_timeout'])
+    if not ready:
+        if retry.looks_blocked(driver.page_source):
+            raise retry.Blocked(f"{store} served a captcha")
+        if not spec.get('refresh_on_timeout'):
+            raise retry.FetchFailed(f"Timed out waiting for {store} results")
+        log.info(f"Retrying {store} load...")
+        driver.refresh()
+        ready = pacing.wait_for_ready(driver, [spec['wait_selector']], spec['wait_timeout'])
+
+    # Scroll to load more items, continuing as soon as new ones render
+    for _ in range(spec.get('scrolls', 0)):
+        loaded = len(driver.find_elements(By.CSS_SELECTOR, spec['item']))
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        if not pacing.wait_for_more_items(driver, spec['item'], loaded):
+            break
+
+    if extract == "script":
+        cards, _ = script_extract.extract_cards(driver, spec_card_config(spec))
+        return products_from_cards(cards or [], spec)
+    html = driver.page_source
+    if ready:
+        page_cache.store_page('offer', store, url, html, driver.current_url)
+    return extract_products(html, spec, driver.current_url)
 
-                if discount > 0:
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
+def search_walmart(query, driver):
+    return search_retailer('Walmart', query, driver)
 
-            except Exception as e:
-                continue
+def search_bestbuy(query, driver):
+    return search_retailer('Best Buy', query, driver)
 
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
+def search_target(query, driver):
+    return search_retailer('Target', query, driver)
 
-    except Exception as e:
-        print(f"Error searching Macy's: {str(e)}")
-        return []
+def search_macys(query, driver):
+    return search_retailer("Macy's", query, driver)
 
 def search_oldnavy(query, driver):
-    try:
-        url = f"https://oldnavy.gap.com/browse/search.do?searchText={query.replace(' ', '+')}"
-        print(f"Debug: Accessing Old Navy URL - {url}")
-        driver.get(url)
-        time.sleep(random.uniform(3, 5))
-
-        # Updated selectors for product grid
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".product-card"))
-        )
-
-        products = []
-        items = driver.find_elements(By.CSS_SELECTOR, ".product-card")
-
-        for item in items:
-            try:
-                title = item.find_element(By.CSS_SELECTOR, ".product-card__name").text.strip()
-                
-                price_elem = item.find_element(By.CSS_SELECTOR, ".product-price__highlight")
-                current_price = float(price_elem.text.replace('$', '').replace(',', '').strip())
-                
-                original_price = current_price
-                discount = 0.0
-                
-                try:
-                    orig_price_elem = item.find_element(By.CSS_SELECTOR, ".product-price__was")
-                    orig_price = float(orig_price_elem.text.replace('Was $', '').replace(',', '').strip())
-                    if orig_price > current_price:
-                        original_price = orig_price
-                        discount = ((original_price - current_price) / original_price) * 100
-                except: pass
-
-                link = item.find_element(By.CSS_SELECTOR, ".product-card__link").get_attribute("href")
-
-                if discount > 0:
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
-
-            except Exception as e:
-                print(f"Debug: Error processing Old Navy item - {str(e)}")
-                continue
-
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
-
-    except Exception as e:
-        print(f"Debug: Major error in Old Navy search - {str(e)}")
-        return []
+    return search_retailer('Old Navy', query, driver)
 
 def search_hm(query, driver):
-    try:
-        url = f"https://www2.hm.com/en_us/search-results.html?q={query.replace(' ', '+')}"
-        print(f"Debug: Accessing H&M URL - {url}")
-        driver.get(url)
-        time.sleep(random.uniform(3, 5))
-
-        # Updated selectors for product grid
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div.search-results-items"))
-        )
-
-        products = []
-        items = driver.find_elements(By.CSS_SELECTOR, "div.search-results-items > div.item")
-
-        print(f"Debug: Found {len(items)} H&M items")
-
-        for item in items:
-            try:
-                # Get title
-                title = item.find_element(By.CSS_SELECTOR, ".item-heading a").text.strip()
-
-                # Get current price
-                price_elem = item.find_element(By.CSS_SELECTOR, ".item-price .price")
-                current_price = float(price_elem.text.replace('$', '').replace(',', '').strip())
-
-                # Check for sale price
-                original_price = current_price
-                discount = 0.0
-                try:
-                    orig_price_elem = item.find_element(By.CSS_SELECTOR, ".item-price .price-regular")
-                    if orig_price_elem:
-                        orig_price = float(orig_price_elem.text.replace('$', '').replace(',', '').strip())
-                        if orig_price > current_price:
-                            original_price = orig_price
-                            discount = ((original_price - current_price) / original_price) * 100
-                except: pass
-
-                # Get link
-                link = item.find_element(By.CSS_SELECTOR, ".item-heading a").get_attribute("href")
-
-                if discount > 0:
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
-
-            except Exception as e:
-                print(f"Debug: Error processing H&M item - {str(e)}")
-                continue
-
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
-
-    except Exception as e:
-        print(f"Debug: Major error in H&M search - {str(e)}")
-        return []
+    return search_retailer('H&M', query, driver)
 
 def search_forever21(query, driver):
-    try:
-        url = f"https://www.forever21.com/us/search?q={query.replace(' ', '+')}&lang=en_US"
-        print(f"Debug: Accessing Forever 21 URL - {url}")
-        driver.get(url)
-        time.sleep(random.uniform(3, 5))
+    return search_retailer('Forever 21', query, driver)
 
-        # Updated selectors for product grid
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='product-grid']"))
-        )
-
-        products = []
-        items = driver.find_elements(By.CSS_SELECTOR, "[data-testid='product-grid'] > div")
+def search_zara(query, driver):
+    return search_retailer('Zara', query, driver)
+
+class DriverLease:
+    """Proxy for a pooled browser that checks one out on first attribute access.
+
+    Jobs answered from the page cache never touch the driver, so they
+    neither wait for a free browser nor start the pool.
+    """
+
+    def __init__(self, pool):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_driver', None)
+
+    def _acquire(self):
+        if self._driver is None:
+            object.__setattr__(self, '_driver', self._pool.checkout())
+        return self._driver
+
+    def __getattr__(self, name):
+        return getattr(self._acquire(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._acquire(), name, value)
+
+class DriverPool:
+    """Fixed set of browser instances shared by the search workers.
+
+    The browsers are started on first use, so runs that never need one
+    (e.g. everything fetched over HTTP) skip Chrome startup entirely. With
+    max_pages set, a browser is replaced after loading that many pages; a
+    browser that stops responding is always replaced.
+    """
+
+    def __init__(self, size, factory=setup_driver, max_pages=None):
+        self.size = size
+        self.max_pages = max_pages
+        self._factory = factory
+        self._idle = queue.Queue()
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._drivers:
+                return
+            log.info(f"Initializing {self.size} browser(s)...")
+            # Start the browsers in parallel, startup dominates small pools
+            with ThreadPoolExecutor(max_workers=self.size) as executor:
+                self._drivers = list(executor.map(lambda _: self._factory(), range(self.size)))
+            for driver in self._drivers:
+                self._idle.put(driver)
+
+    @contextmanager
+    def driver(self):
+        """Lease a browser; it is only checked out once the job actually touches it"""
+        lease = DriverLease(self)
+        try:
+            yield lease
+        finally:
+            if lease._driver is not None:
+                self._idle.put(self._checked(lease._driver))
 
-        print(f"Debug: Found {len(items)} Forever 21 items")
+    def checkout(self):
+        self.start()
+        return self._idle.get()
 
-        for item in items:
+    def _checked(self, driver):
+        """Return driver, or a fresh replacement if it crashed or reached max_pages"""
+        try:
+            driver.current_url
+            if not self.max_pages or getattr(driver, 'pages_loaded', 0) < self.max_pages:
+                return driver
+            reason = f"after {driver.pages_loaded} pages"
+        except Exception as e:
+            reason = f"after a crash ({str(e)[:80]})"
+        log.info(f"Recycling browser {reason}")
+        try:
+            driver.quit()
+        except: pass
+        try:
+            replacement = self._factory()
+        except Exception as e:
+            # Keep the slot filled; the next release tries the replacement again
+            log.warning(f"Could not start replacement browser: {str(e)}")
+            replacement = driver
+        with self._lock:
+            self._drivers = [replacement if d is driver else d for d in self._drivers]
+        return replacement
+
+    def quit(self):
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
             try:
-                # Updated selectors for title and price
-                title = item.find_element(By.CSS_SELECTOR, "[data-testid='product-title']").text.strip()
-                
-                price_elem = item.find_element(By.CSS_SELECTOR, "[data-testid='product-price-sale'], [data-testid='product-price']")
-                current_price = float(price_elem.text.replace('$', '').replace(',', '').strip())
-                
-                original_price = current_price
-                discount = 0.0
-                
-                try:
-                    orig_price_elem = item.find_element(By.CSS_SELECTOR, "[data-testid='product-price-original']")
-                    orig_price = float(orig_price_elem.text.replace('$', '').replace(',', '').strip())
-                    if orig_price > current_price:
-                        original_price = orig_price
-                        discount = ((original_price - current_price) / original_price) * 100
-                except: pass
-
-                link = item.find_element(By.CSS_SELECTOR, "a").get_attribute("href")
-
-                if discount > 0:
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
-
-            except Exception as e:
-                print(f"Debug: Error processing Forever 21 item - {str(e)}")
+                driver.quit()
+            except: pass
+
+DEFAULT_STORE_CONCURRENCY = 3
+
+# search runs the page on a driver; parse(html, url) -> (products, next_url)
+# handles a page fetched without a browser and is None for JS-only stores
+SearchJob = namedtuple('SearchJob', ['store', 'url', 'search', 'parse'])
+
+def search_jobs(query, retailers, extract="page_source", paginator=None):
+    """Split every retailer search into per-page SearchJobs, paginating Amazon with the query's paginator"""
+    jobs = []
+    for store, search_function in retailers.items():
+        if search_function is search_amazon:
+            for url, condition_name in amazon_search_urls(query):
+                parse = None if AMAZON_REQUIRES_JS else partial(parse_amazon_page, follow_next=True)
+                search = partial(search_amazon_url, url=url, condition_name=condition_name, extract=extract,
+                                 paginator=paginator)
+                jobs.append(SearchJob(store, url, search, parse))
+        elif store in RETAILER_SPECS:
+            spec = RETAILER_SPECS[store]
+            parse = None if spec.get('requires_js') else partial(parse_retailer_page, spec)
+            search = partial(search_retailer, store, query, extract=extract)
+            jobs.append(SearchJob(store, retailer_search_url(spec, query), search, parse))
+        else:
+            jobs.append(SearchJob(store, store, partial(search_function, query), None))
+    return jobs
+
+def run_http_jobs(jobs, results, concurrency=8, on_results=None, run_journal=None, paginator=None):
+    """Fetch every server-rendered page over HTTP and parse it into results.
+
+    Each page's products are added to results[store] as one run sorted best
+    deal first. Pages still in the page cache are parsed without a request.
+    Next pages are followed while paginator (the query's) allows, and a job is
+    journaled once its last page is done. Returns the jobs that still need
+    a browser: JS-only stores and first pages whose HTTP fetch failed or
+    came back as a bot check or without results (those are not cached).
+    """
+    paginator = paginator or pagination.PAGINATOR.for_query()
+    browser_jobs = [job for job in jobs if job.parse is None]
+    pending = [(job, job.url, 1) for job in jobs if job.parse is not None]
+    collected = defaultdict(list)  # job url -> products of its pages so far
+    while pending:
+        pages = {}
+        stores = {}
+        for job, url, _ in pending:
+            stores[url] = job.store
+            cached = page_cache.cached_page('offer', job.store, url)
+            if cached:
+                pages[url] = (cached.html, cached.final_url)
+
+        to_fetch = [url for _, url, _ in pending if url not in pages]
+        if to_fetch:
+            log.info(f"Fetching {len(to_fetch)} pages over HTTP...")
+        for url, result in http_fetch.fetch_pages(to_fetch, concurrency=concurrency).items():
+            if result.error or result.status != 200:
+                log.warning(f"HTTP fetch failed for {url} ({result.error or result.status})")
                 continue
-
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
-
-    except Exception as e:
-        print(f"Debug: Major error in Forever 21 search - {str(e)}")
-        return []
-
-def search_zara(query, driver):
-    try:
-        url = f"https://www.zara.com/us/en/search?searchTerm={query.replace(' ', '+')}&section=MAN"
-        print(f"Debug: Accessing Zara URL - {url}")
-        driver.get(url)
-        time.sleep(random.uniform(3, 5))
-
-        # Updated selectors for product grid
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".search-results"))
-        )
-
-        products = []
-        items = driver.find_elements(By.CSS_SELECTOR, ".search-results .product")
-
-        print(f"Debug: Found {len(items)} Zara items")
-
-        for item in items:
+            if not page_cache.has_results(result.html, result_markers(stores[url])):
+                log.warning(f"HTTP fetch of {url} returned no results page, leaving it to the browser")
+                continue
+            page_cache.store_page('offer', stores[url], url, result.html, result.final_url)
+            pages[url] = (result.html, result.final_url)
+
+        next_pending = []
+        for job, url, page in pending:
+            if url not in pages:
+                if page == 1:
+                    browser_jobs.append(job)
+                elif run_journal:
+                    run_journal.record(job.store, job.url, collected.pop(job.url))
+                continue
+            with tracing.context(store=job.store, url=url), profiling.profile(job.store):
+                products, next_url = job.parse(*pages[url])
+            results[job.store].append(sorted(products, key=best_deal_first))
+            if on_results and products:
+                on_results(job.store, products)
+            collected[job.url].extend(products)
+            if next_url and paginator.should_continue(page, products):
+                next_pending.append((job, next_url, page + 1))
+            elif run_journal:
+                run_journal.record(job.store, job.url, collected.pop(job.url))
+            else:
+                collected.pop(job.url)
+        pending = next_pending
+    return browser_jobs
+
+def run_search_jobs(jobs, pool, store_limits=None, on_results=None, run_journal=None):
+    """Run page jobs on the driver pool, at most store_limits[store] at a time per store.
+
+    Returns each store's products as runs sorted best deal first, one per
+    job; on_results(store, products) is called and the job journaled as
+    every job finishes.
+    """
+    store_limits = store_limits or {}
+    pending = list(jobs)
+    active = defaultdict(int)
+    results = defaultdict(list)
+    condition = threading.Condition()
+
+    def next_job():
+        with condition:
+            while pending:
+                for index, job in enumerate(pending):
+                    store = job[0]
+                    if active[store] < store_limits.get(store, DEFAULT_STORE_CONCURRENCY):
+                        active[store] += 1
+                        return pending.pop(index)
+                condition.wait()
+            return None
+
+    def worker():
+        while True:
+            job = next_job()
+            if job is None:
+                return
+            store, url, search = job.store, job.url, job.search
             try:
-                # Updated selectors for title and price
-                title = item.find_element(By.CSS_SELECTOR, ".product-name").text.strip()
-                
-                price_elem = item.find_element(By.CSS_SELECTOR, ".price-current")
-                current_price = float(price_elem.text.replace('$', '').replace(',', '').strip())
-                
-                original_price = current_price
-                discount = 0.0
-                
-                try:
-                    orig_price_elem = item.find_element(By.CSS_SELECTOR, ".price-original")
-                    orig_price = float(orig_price_elem.text.replace('$', '').replace(',', '').strip())
-                    if orig_price > current_price:
-                        original_price = orig_price
-                        discount = ((original_price - current_price) / original_price) * 100
-                except: pass
-
-                link = item.find_element(By.CSS_SELECTOR, "a").get_attribute("href")
-
-                if discount > 0:
-                    products.append({
-                        "title": title,
-                        "price": current_price,
-                        "original_price": original_price,
-                        "discount": discount,
-                        "link": link
-                    })
-
+                with tracing.context(store=store, url=url), tracing.span('job'), profiling.profile(store), \
+                        pool.driver() as driver:
+                    products = search(driver) or []
             except Exception as e:
+                log.warning(f"Error while searching {store} ({url}): {str(e)}")
+                products = []
+            run = sorted(products, key=best_deal_first)
+            with condition:
+                results[store].append(run)
+                active[store] -= 1
+                condition.notify_all()
+            if on_results and products:
+                on_results(store, products)
+            if run_journal:
+                run_journal.record(store, url, products)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(pool.size)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results
+
+def drop_suspicious_prices(all_results):
+    """Check every store's merged results in one array pass and drop impossible prices.
+
+    Zero prices and was prices below the current one are removed; badge-only
+    discounts and discounts that disagree with the prices are kept but counted.
+    """
+    products = [product for results in all_results.values() for product in results]
+    with tracing.span('price_check', items=len(products)):
+        flags = discounts.batch_flags(products)
+    suspicious = discounts.flag_counts(flags)
+    if suspicious:
+        log.info("Suspicious prices: " + ", ".join(f"{count} {name}" for name, count in suspicious.items()))
+    flags = flags.tolist()
+    start = 0
+    for store, results in all_results.items():
+        store_flags = flags[start:start + len(results)]
+        start += len(results)
+        all_results[store] = [product for product, flag in zip(results, store_flags)
+                              if not flag & discounts.INVALID]
+    return all_results
+
+def search_all(query, retailers, pool, store_limits=None, fetch="browser", http_concurrency=8,
+               extract="page_source", on_results=None, run_journal=None):
+    """Fan every retailer's page jobs out over the pool and merge per store.
+
+    With fetch="http" server-rendered pages are fetched without a browser
+    first and only the remaining jobs are run on the pool. extract picks
+    how browser pages are read ("page_source" or "script"). on_results is
+    called with (store, products) as each page's products arrive. Every
+    page is sorted as it completes, so each store's list is one k-way merge
+    of those runs, best deal first. Jobs already completed in run_journal
+    are taken from it instead of being searched again.
+    """
+    # Each query paginates with its own budget, also when the daemon runs several at once
+    paginator = pagination.PAGINATOR.for_query()
+    jobs = search_jobs(query, retailers, extract, paginator)
+    results = defaultdict(list)
+    if run_journal:
+        remaining = []
+        for job in jobs:
+            products = run_journal.completed(job.store, job.url)
+            if products is None:
+                remaining.append(job)
                 continue
-
-        return sorted(products, key=lambda x: x["discount"], reverse=True)
-
-    except Exception as e:
-        print(f"Debug: Major error in Zara search - {str(e)}")
-        return []
-
-def save_to_csv(all_results, query):
+            results[job.store].append(sorted(products, key=best_deal_first))
+            if on_results:
+                on_results(job.store, products)
+        jobs = remaining
+    if fetch == "http":
+        jobs = run_http_jobs(jobs, results, http_concurrency, on_results, run_journal, paginator)
+    for store, runs in run_search_jobs(jobs, pool, store_limits, on_results, run_journal).items():
+        results[store].extend(runs)
+    all_results = {}
+    for store, search_function in retailers.items():
+        with tracing.span('sort', store=store):
+            products = list(heapq.merge(*results.get(store, []), key=best_deal_first))
+        if search_function is search_amazon:
+            all_results[store] = merge_amazon_products(products) if products else []
+        else:
+            all_results[store] = products
+    drop_suspicious_prices(all_results)
+    for store, products in all_results.items():
+        log.info(f"Found {len(products)} results from {store}")
+    return all_results
+
+ALL_RETAILERS = {
+    'Amazon': search_amazon,
+    'Walmart': search_walmart,
+    'Best Buy': search_bestbuy,
+    'Target': search_target,
+    "Macy's": search_macys,
+    'Old Navy': search_oldnavy,
+    'H&M': search_hm,
+    'Forever 21': search_forever21,
+    'Zara': search_zara
+}
+
+DEFAULT_RETAILERS = {
+    'Amazon': search_amazon,
+    'Walmart': search_walmart,
+    'Best Buy': search_bestbuy,
+    # 'Target': search_target,
+    # "Macy's": search_macys,
+    # 'Old Navy': search_oldnavy,
+    # 'H&M': search_hm,
+    # 'Forever 21': search_forever21,
+    # 'Zara': search_zara
+}
+
+def parse_store_limits(values):
+    """Parse repeated STORE=N options into a dict"""
+    limits = {}
+    for value in values:
+        store, _, limit = value.rpartition('=')
+        limits[store] = int(limit)
+    return limits
+
+CSV_HEADER = ['Store', 'Title', 'Current Price', 'Original Price', 'Discount %', 'Condition', 'Link']
+
+def csv_row(store, product, condition='New'):
+    return [
+        store,
+        product.title,
+        f"${product.price:.2f}",
+        f"${product.original_price:.2f}",
+        f"{product.discount:.1f}%",
+        condition,
+        product.link
+    ]
+
+def csv_rows(all_results):
+    """Output rows from search_all results in one pass, without re-sorting.
+
+    New discounted Amazon products come first, then discounted products
+    from the other stores, then Amazon products in other conditions. Each
+    store's list is already best deal first, so filtering keeps the order.
+    """
+    other_conditions = []
+    for product in all_results.get('Amazon', []):
+        if product.condition != 'New':
+            other_conditions.append(csv_row('Amazon', product, product.condition))
+        elif product.discount > 0:
+            yield csv_row('Amazon', product)
+
+    for store, results in all_results.items():
+        if store != 'Amazon':
+            for product in results:
+                if product.discount > 0:
+                    yield csv_row(store, product)
+
+    yield from other_conditions
+
+def csv_filename(query):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"price_comparison_{query}_{timestamp}.csv"
-    
+    return f"price_comparison_{query}_{timestamp}.csv"
+
+@tracing.timed('csv_write')
+def save_to_csv(all_results, query, filename=None):
+    filename = filename or csv_filename(query)
     with open(filename, 'w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
-        writer.writerow(['Store', 'Title', 'Current Price', 'Original Price', 'Discount %', 'Condition', 'Link'])
-        
-        # First write all new Amazon products with discounts
-        for store, results in all_results.items():
-            if store == 'Amazon':
-                sorted_results = sorted(results, key=lambda x: -x["discount"])
-                for product in sorted_results:
-                    if product.get('condition', 'New') == 'New' and product["discount"] > 0:
-                        writer.writerow([
-                            store,
-                            product['title'],
-                            f"${product['price']:.2f}",
-                            f"${product['original_price']:.2f}",
-                            f"{product['discount']:.1f}%",
-                            'New',
-                            product['link']
-                        ])
-        
-        # Then write products from other stores
-        for store, results in all_results.items():
-            if store != 'Amazon':
-                sorted_results = sorted(results, key=lambda x: -x["discount"])
-                for product in sorted_results:
-                    if product["discount"] > 0:
-                        writer.writerow([
-                            store,
-                            product['title'],
-                            f"${product['price']:.2f}",
-                            f"${product['original_price']:.2f}",
-                            f"{product['discount']:.1f}%",
-                            'New',
-                            product['link']
-                        ])
-        
-        # Finally write Amazon products with other conditions
-        for store, results in all_results.items():
-            if store == 'Amazon':
-                sorted_results = sorted(results, key=lambda x: -x["discount"])
-                for product in sorted_results:
-                    if product.get('condition', 'New') != 'New':
-                        writer.writerow([
-                            store,
-                            product['title'],
-                            f"${product['price']:.2f}",
-                            f"${product['original_price']:.2f}",
-                            f"{product['discount']:.1f}%",
-                            product.get('condition', 'New'),
-                            product['link']
-                        ])
-    
+        writer.writerow(CSV_HEADER)
+        writer.writerows(csv_rows(all_results))
     return filename
 
+class StreamingCSVWriter:
+    """Appends every page's products to FILENAME.partial as soon as they arrive.
+
+    A crash mid-run leaves everything found so far in the partial file (in
+    arrival order, before de-duplication). finish() writes the final,
+    ordered CSV and removes it.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.filename = csv_filename(query)
+        self.partial_filename = f"{self.filename}.partial"
+        self._file = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def add(self, store, products):
+        with self._lock, tracing.span('csv_write', store=store, items=len(products)):
+            if self._file is None:
+                self._file = open(self.partial_filename, 'w', newline='', encoding='utf-8')
+                self._writer = csv.writer(self._file)
+                self._writer.writerow(CSV_HEADER)
+            self._writer.writerows(csv_row(store, product, product.condition) for product in products)
+            self._file.flush()
+
+    def close(self):
+        """Close the partial file, keeping it on disk"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.partial_filename):
+            os.remove(self.partial_filename)
+
+    def finish(self, all_results):
+        save_to_csv(all_results, self.query, self.filename)
+        self.discard()
+        return self.filename
+
 if __name__ == "__main__":
-    query = input("Enter the product you want to search for: ")
-    print("\nInitializing browser...")
+    parser = argparse.ArgumentParser(description="Search retailers for discounted offers")
+    parser.add_argument("query", nargs="?", help="Product to search for")
+    parser.add_argument("--workers", type=int, default=3, help="Number of browser instances searching in parallel")
+    parser.add_argument("--store-limit", action="append", default=[], metavar="STORE=N",
+                        help=f"Maximum concurrent pages for one store (default {DEFAULT_STORE_CONCURRENCY})")
+    parser.add_argument("--fetch", choices=["browser", "http"], default="browser",
+                        help="Fetch server-rendered pages over HTTP and use the browser only for JS-only stores")
+    parser.add_argument("--http-concurrency", type=int, default=8)
+    parser.add_argument("--extract", choices=["page_source", "script"], default="page_source",
+                        help="Read browser pages via their page source or one execute_script call per page")
+    parser.add_argument("--lean", action="store_true",
+                        help="Block images, fonts, media and trackers and return from navigation at DOMContentLoaded")
+    parser.add_argument("--rate", type=float, default=pacing.DEFAULT_RATE,
+                        help="Requests per second allowed to each host, shared by all workers")
+    parser.add_argument("--host-rate", action="append", default=[], metavar="HOST=RATE",
+                        help="Override --rate for one host, e.g. www.amazon.com=0.3")
+    parser.add_argument("--retries", type=int, default=retry.DEFAULT_ATTEMPTS,
+                        help="Attempts per page before giving up on it")
+    parser.add_argument("--deal-discount", type=float, default=pagination.DEFAULT_MIN_DISCOUNT,
+                        help="Discount percentage that counts as a deal when deciding to load the next page")
+    parser.add_argument("--min-page-deals", type=int, default=pagination.DEFAULT_MIN_DEALS,
+                        help="Load a search's next page only if the last one had at least this many deals")
+    parser.add_argument("--max-pages", type=int, default=pagination.DEFAULT_MAX_PAGES, help="Pages per search")
+    parser.add_argument("--page-budget", type=int, default=pagination.DEFAULT_BUDGET,
+                        help="Pages after the first that one query may load in total")
+    parser.add_argument("--cache-ttl", type=float, default=page_cache.DEFAULT_TTL / 3600,
+                        help="Reuse pages captured within this many hours (0 disables the page cache)")
+    parser.add_argument("--cache-dir", default=str(page_cache.DEFAULT_DIRECTORY))
+    parser.add_argument("--cache-max-mb", type=float, default=page_cache.DEFAULT_MAX_BYTES / 1024 / 1024)
+    parser.add_argument("--record", metavar="DIR", help="Also save every captured page as a replay fixture in DIR")
+    parser.add_argument("--history", default=str(price_history.DEFAULT_PATH),
+                        help="SQLite price history every run's products are added to")
+    parser.add_argument("--no-history", action="store_true", help="Do not record this run's prices")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the pages an interrupted run of the same query already finished today")
+    parser.add_argument("--journal", metavar="PATH", help="Run journal file (default: one per query and day)")
+    parser.add_argument("--log-level", choices=tracing.LOG_LEVELS, default="INFO",
+                        help="DEBUG also shows every item parsed")
+    parser.add_argument("--trace", metavar="PATH", help="Write every timing span to PATH as JSON lines")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                        help="Profile CPU and allocations per retailer into DIR (default profiles/<timestamp>)")
+    parser.add_argument("--collapsed-stacks", action="store_true",
+                        help="With --profile, also sample stacks into collapsed.txt for flame graphs")
+    args = parser.parse_args()
+    tracing.configure_logging(args.log_level)
+    tracing.TRACER.configure(args.trace)
+    if args.profile is not None:
+        # One browser at a time keeps allocations attributed to a single retailer
+        args.workers = 1
+        profiling.enable(args.profile or None, args.collapsed_stacks)
+    if args.record:
+        replay.RECORDER.start(args.record)
+    pacing.RATE_LIMITER.configure(rate=args.rate, host_rates=pacing.parse_host_rates(args.host_rate))
+    retry.SCHEDULER.configure(attempts=args.retries)
+    pagination.PAGINATOR.configure(args.deal_discount, args.min_page_deals, args.max_pages, args.page_budget)
+    page_cache.CACHE.configure(args.cache_dir, args.cache_ttl * 3600, int(args.cache_max_mb * 1024 * 1024))
+
+    query = args.query or input("Enter the product you want to search for: ")
     
-    driver = setup_driver()
+    pool = DriverPool(args.workers, factory=partial(setup_driver, lean=args.lean))
+    csv_writer = StreamingCSVWriter(query)
+    run_journal = journal.RunJournal(args.journal or journal.default_path('offer', query), resume=args.resume)
     all_results = {}
     
     try:
-        retailers = {
-            'Amazon': search_amazon,
-            'Walmart': search_walmart,
-            'Best Buy': search_bestbuy,
-            # 'Target': search_target,
-            # "Macy's": search_macys,
-            # 'Old Navy': search_oldnavy,
-            # 'H&M': search_hm,
-            # 'Forever 21': search_forever21,
-            # 'Zara': search_zara
-        }
+        retailers = DEFAULT_RETAILERS
         
-        for store, search_function in retailers.items():
-            try:
-                print(f"\nSearching {store}...")
-                results = search_function(query, driver)
-                if results is None:
-                    results = []
-                all_results[store] = results
-                print(f"Found {len(results)} results from {store}")
-            except Exception as e:
-                print(f"Error while searching {store}: {str(e)}")
-                all_results[store] = []
+        log.info(f"Searching {', '.join(retailers)}...")
+        all_results = search_all(query, retailers, pool, parse_store_limits(args.store_limit),
+                                 fetch=args.fetch, http_concurrency=args.http_concurrency,
+                                 extract=args.extract, on_results=csv_writer.add, run_journal=run_journal)
         
         if any(results for results in all_results.values()):
-            filename = save_to_csv(all_results, query)
-            print(f"\nResults saved to: {filename}")
+            filename = csv_writer.finish(all_results)
+            log.info(f"Results saved to: {filename}")
+            groups = matching.match_products([product for products in all_results.values() for product in products])
+            if groups:
+                matching.print_comparison(groups)
+                log.info(f"Price comparison saved to: {matching.save_comparison(groups, query)}")
         else:
-            print("\nNo results found to save.")
+            csv_writer.discard()
+            log.info("No results found to save.")
+
+        if not args.no_history:
+            price_history.record(args.history, [product for products in all_results.values() for product in products],
+                                 'offer', query)
+        run_journal.finish()
+
+        print_startup_report()
+        page_cache.CACHE.print_report()
+        http_fetch.print_latency_report()
+        pacing.print_pacing_report(args.workers)
+        retry.print_retry_report()
+        pagination.print_pagination_report()
+        tracing.print_timing_report()
                     
     finally:
-        driver.quit()
+        csv_writer.close()
+        run_journal.close()
+        tracing.TRACER.close()
+        profiling.finish()
+        pool.quit()
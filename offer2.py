@@ -6,14 +6,40 @@ from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 import pandas as pd
 from datetime import datetime
+import argparse
+import logging
+from functools import partial
 import time
-import random
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+import re
+try:
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+except ImportError:  # lxml/cssselect are optional; html.parser is used instead
+    lxml = None
 from selenium.webdriver.chrome.options import Options
 from fake_useragent import UserAgent
 import undetected_chromedriver as uc
+import categories
+import discounts
+import http_fetch
+import journal
+import lean_load
+import near_dupes
+import pacing
+import page_cache
+import pagination
+import price_history
+import profiling
+import replay
+import retry
+import sweep_store
+import tracing
+from product import Product
 
-def setup_driver():
+log = logging.getLogger(__name__)
+
+def setup_driver(lean=False):
     options = uc.ChromeOptions()
     ua = UserAgent()
     options.add_argument('--disable-gpu')
@@ -21,8 +47,12 @@ def setup_driver():
     options.add_argument(f'--user-agent={ua.random}')
     options.add_argument('--disable-blink-features=AutomationControlled')
     options.add_argument('--start-maximized')
+    if lean:
+        lean_load.apply_lean_options(options)
     
     driver = uc.Chrome(options=options)
+    if lean:
+        lean_load.block_heavy_requests(driver)
     
     # Add stealth JavaScript
     stealth_js = """
@@ -39,6 +69,30 @@ def setup_driver():
     
     return driver
 
+class LazyDriver:
+    """Starts the browser on first use, so sweeps served from the cache or HTTP never launch one"""
+
+    def __init__(self, factory=setup_driver):
+        self._factory = factory
+        self._driver = None
+
+    def __getattr__(self, name):
+        if self._driver is None:
+            self._driver = self._factory()
+        return getattr(self._driver, name)
+
+    def quit(self):
+        if self._driver is not None:
+            self._driver.quit()
+
+def load_page(driver, url):
+    """Navigate the driver to url once the host's rate limit allows, recording the load time"""
+    pacing.RATE_LIMITER.acquire(url)
+    start = time.perf_counter()
+    with tracing.span('navigate', url=url):
+        driver.get(url)
+    http_fetch.record_latency('selenium', time.perf_counter() - start)
+
 def get_user_discount():
     while True:
         try:
@@ -49,224 +103,433 @@ def get_user_discount():
         except ValueError:
             print("Please enter a valid number")
 
+CLASSIFIER = categories.CategoryClassifier()
+
 def detect_product_category(title):
     """Detect product category based on keywords in title."""
-    title = title.lower()
-    categories = {
-        'laptop': ['laptop', 'notebook', 'chromebook'],
-        'tablet': ['tablet', 'ipad', 'galaxy tab'],
-        'phone': ['phone', 'iphone', 'smartphone', 'galaxy s', 'pixel'],
-        'headphone': ['headphone', 'earphone', 'earbud', 'airpod'],
-        'tv': ['tv', 'television', 'smart tv', 'oled', 'qled'],
-        'camera': ['camera', 'webcam', 'security cam'],
-        'gaming': ['gaming', 'xbox', 'playstation', 'nintendo', 'console'],
-        'computer': ['desktop', 'pc', 'computer', 'monitor'],
-        'wearable': ['watch', 'smartwatch', 'fitness tracker', 'band'],
-        'clothing': ['shirt', 'pants', 'jacket', 'dress', 'shoes', 'clothing'],
-        'home': ['furniture', 'chair', 'table', 'bed', 'sofa', 'mattress'],
-        'kitchen': ['kitchen', 'cookware', 'appliance', 'refrigerator', 'microwave']
-    }
-    
-    for category, keywords in categories.items():
-        if any(keyword in title for keyword in keywords):
-            return category
-    return 'other'
+    return CLASSIFIER.classify(title)
+
+def assign_categories(products):
+    """Classify a page's products in one batch"""
+    for product, category in zip(products, CLASSIFIER.classify_many(p.title for p in products)):
+        product.category = category
+    return products
+
+class SoupParserBackend:
+    """BeautifulSoup/html.parser backend, restricted to the result grid with a SoupStrainer"""
+    name = 'html.parser'
+
+    def parse(self, html, strainer=None):
+        return BeautifulSoup(html, 'html.parser', parse_only=strainer)
+
+    def select(self, node, selector):
+        return node.select(selector)
+
+    def select_one(self, node, selector):
+        return node.select_one(selector)
+
+    def text(self, node):
+        return node.get_text()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+class LxmlParserBackend:
+    """lxml backend with CSS selectors compiled to XPath once and reused across pages"""
+    name = 'lxml'
+
+    def __init__(self):
+        self._selectors = {}
+
+    def _compiled(self, selector):
+        compiled = self._selectors.get(selector)
+        if compiled is None:
+            compiled = self._selectors[selector] = CSSSelector(selector)
+        return compiled
+
+    def parse(self, html, strainer=None):
+        # lxml builds the whole tree in C; item selectors scope the work instead of a strainer
+        return lxml.html.fromstring(html)
+
+    def select(self, node, selector):
+        return self._compiled(selector)(node)
 
-def search_amazon_products(driver, keywords, max_items=50, max_retries=3):
+    def select_one(self, node, selector):
+        matches = self._compiled(selector)(node)
+        return matches[0] if matches else None
+
+    def text(self, node):
+        return node.text_content()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+PARSER_BACKENDS = {'html.parser': SoupParserBackend}
+if lxml is not None:
+    PARSER_BACKENDS['lxml'] = LxmlParserBackend
+
+def get_parser_backend(name='auto'):
+    """Return the lxml backend when it is installed, otherwise html.parser"""
+    if name == 'auto':
+        name = 'lxml' if 'lxml' in PARSER_BACKENDS else 'html.parser'
+    return PARSER_BACKENDS[name]()
+
+PARSER = get_parser_backend()
+
+AMAZON_RESULT_SELECTOR = 'div[data-component-type="s-search-result"]'
+BESTBUY_READY_SELECTORS = ['div.list-item', 'div[class*="product-item"]', '.sku-item']
+# Text only a page with result cards contains; a cheap check before an HTTP page is cached
+RESULT_MARKERS = {'Amazon': ['s-search-result'], 'Best Buy': ['sku-item', 'product-item', 'list-item']}
+
+# Only the result cards are parsed by the html.parser backend
+AMAZON_RESULT_STRAINER = SoupStrainer('div', attrs={'data-component-type': 's-search-result'})
+BESTBUY_RESULT_STRAINER = SoupStrainer('div', class_=re.compile('product|list-item'))
+
+@tracing.timed('extract')
+def parse_amazon_search_page(html, max_items=50, parser=None):
+    """Extract discounted products from a captured Amazon search page"""
+    parser = parser or PARSER
     products = []
-    retry_count = 0
+    root = parser.parse(html, AMAZON_RESULT_STRAINER)
+    items = parser.select(root, AMAZON_RESULT_SELECTOR)
+    log.debug("Found %d items", len(items))
     
-    while retry_count < max_retries:
+    for item in items[:max_items]:
         try:
-            url = f"https://www.amazon.com/s?k={keywords.replace(' ', '+')}&deals-widget=%257B%2522version%2522%253A1%252C%2522viewIndex%2522%253A0%252C%2522presetId%2522%253A%2522deals-collection-all-deals%2522%257D"
-            print(f"Searching URL: {url}")
+            title_elem = parser.select_one(item, 'h2 span.a-text-normal')
+            if title_elem is None:
+                continue
+            title = parser.text(title_elem).strip()
             
-            time.sleep(random.uniform(2, 5))
-            driver.get(url)
+            # Get original price first
+            original_price_elem = parser.select_one(item, '.a-text-price .a-offscreen')
+            if original_price_elem is None:
+                continue
+                
+            original_price_str = parser.text(original_price_elem).replace('$', '').replace(',', '').replace('..', '.')
+            original_price = float(original_price_str)
             
-            # Simulate human-like scrolling
-            for _ in range(3):
-                scroll_height = random.randint(100, 500)
-                driver.execute_script(f"window.scrollBy(0, {scroll_height});")
-                time.sleep(random.uniform(0.5, 1.5))
+            # Get current price
+            price_whole = parser.select_one(item, '.a-price:not(.a-text-price) .a-price-whole')
+            price_fraction = parser.select_one(item, '.a-price:not(.a-text-price) .a-price-fraction')
+            if price_whole is None:
+                continue
             
-            # Use BeautifulSoup to parse the page
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            items = soup.select('div[data-component-type="s-search-result"]')
-            print(f"Found {len(items)} items")
+            fraction = parser.text(price_fraction) if price_fraction is not None else '00'
+            current_price_str = f"{parser.text(price_whole)}.{fraction}".replace('..', '.')
+            current_price = float(current_price_str)
             
-            for item in items[:max_items]:
-                try:
-                    title_elem = item.select_one('h2 span.a-text-normal')
-                    if not title_elem:
-                        continue
-                    title = title_elem.text.strip()
-                    
-                    # Get original price first
-                    original_price_elem = item.select_one('.a-text-price .a-offscreen')
-                    if not original_price_elem:
-                        continue
-                        
-                    original_price_str = original_price_elem.text.replace('$', '').replace(',', '').replace('..', '.')
-                    original_price = float(original_price_str)
-                    
-                    # Get current price
-                    price_whole = item.select_one('.a-price:not(.a-text-price) .a-price-whole')
-                    price_fraction = item.select_one('.a-price:not(.a-text-price) .a-price-fraction')
-                    if not price_whole:
-                        continue
+            if current_price > 0 and original_price > current_price:  # Add validation
+                discount = round((original_price - current_price) / original_price * 100, 2)
+                log.debug("Product: %.50s...", title)
+                log.debug("Current Price: $%s", current_price)
+                log.debug("Original Price: $%s", original_price)
+                log.debug("Discount: %s%%", discount)
+                
+                # Get product URL
+                url_elem = parser.select_one(item, 'h2 a.a-link-normal')
+                if url_elem is not None:
+                    product_url = parser.attr(url_elem, 'href')
+                    if not product_url.startswith('http'):
+                        product_url = 'https://www.amazon.com' + product_url
                     
-                    current_price_str = f"{price_whole.text}.{price_fraction.text if price_fraction else '00'}".replace('..', '.')
-                    current_price = float(current_price_str)
+                    product_info = Product(title, current_price, original_price, discount, product_url, 'Amazon')
+                    products.append(product_info)
                     
-                    if current_price > 0 and original_price > current_price:  # Add validation
-                        discount = round((original_price - current_price) / original_price * 100, 2)
-                        print(f"\nProduct: {title[:50]}...")
-                        print(f"Current Price: ${current_price}")
-                        print(f"Original Price: ${original_price}")
-                        print(f"Discount: {discount}%")
-                        
-                        # Get product URL
-                        url_elem = item.select_one('h2 a.a-link-normal')
-                        if url_elem:
-                            product_url = url_elem.get('href')
-                            if not product_url.startswith('http'):
-                                product_url = 'https://www.amazon.com' + product_url
-                            
-                            product_info = {
-                                'title': title,
-                                'current_price': current_price,
-                                'original_price': original_price,
-                                'url': product_url,
-                                'discount': discount,
-                                'source': 'Amazon',
-                                'category': detect_product_category(title)
-                            }
-                            products.append(product_info)
-                            print(f"Added Amazon product with {discount}% discount")
-                            
-                except Exception as e:
-                    print(f"Error processing Amazon item: {str(e)}")
-                    continue
-            
-            # Return collected products if any were found
-            if products:
-                print(f"Found {len(products)} valid Amazon products")
-                return products
-            
-            retry_count += 1
-            
         except Exception as e:
-            retry_count += 1
-            print(f"Amazon attempt {retry_count} failed: {str(e)}")
-            if retry_count < max_retries:
-                time.sleep(random.uniform(5, 10))
+            log.debug("Error processing Amazon item: %s", e)
+            continue
     
-    return products  # Return empty list if no products found
+    log.info(f"Added {len(products)} discounted Amazon products")
+    return assign_categories(products)
 
-def search_bestbuy_products(driver, keywords, max_items=50, max_retries=3):
+@tracing.timed('extract')
+def parse_bestbuy_search_page(html, max_items=50, parser=None):
+    """Extract discounted products from a captured Best Buy search page"""
+    parser = parser or PARSER
     products = []
-    retry_count = 0
+    root = parser.parse(html, BESTBUY_RESULT_STRAINER)
+    items = parser.select(root, 'div.list-item, div[class*="product-item"]')
+    
+    if not items:
+        log.debug("No items found with primary selectors, trying alternative...")
+        items = parser.select(root, 'div[class*="product"]')
+    
+    log.debug("Found %d items on Best Buy using %s", len(items), parser.name)
     
-    while retry_count < max_retries:
+    for item in items[:max_items]:
         try:
-            url = f"https://www.bestbuy.com/site/searchpage.jsp?st={keywords.replace(' ', '+')}&cp=1"
-            print(f"Searching Best Buy URL: {url}")
+            # Extract title
+            title_elem = parser.select_one(item, 'h4 a, .product-title a, a[class*="title"]')
+            if title_elem is None:
+                continue
+            title = parser.text(title_elem).strip()
             
-            driver.get(url)
-            time.sleep(random.uniform(5, 8))
+            # Extract current price
+            price_elem = parser.select_one(item, 'div[class*="price"] span[aria-hidden="true"], .current-price')
+            if price_elem is None:
+                continue
+            current_price = float(parser.text(price_elem).replace('$', '').replace(',', '').strip())
             
-            # Try to handle cookie consent and popups
-            try:
-                popup_buttons = driver.find_elements(By.CSS_SELECTOR, 'button[class*="close"], .modal-close')
-                for button in popup_buttons:
-                    if button.is_displayed():
-                        button.click()
-                        time.sleep(1)
-            except:
-                pass
-            
-            # Use BeautifulSoup for parsing
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            items = soup.select('div.list-item, div[class*="product-item"]')
-            
-            if not items:
-                print("No items found with primary selectors, trying alternative...")
-                items = soup.select('div[class*="product"]')
-            
-            print(f"Found {len(items)} items on Best Buy using BeautifulSoup")
-            
-            for item in items[:max_items]:
-                try:
-                    # Extract title
-                    title_elem = item.select_one('h4 a, .product-title a, a[class*="title"]')
-                    if not title_elem:
-                        continue
-                    title = title_elem.get_text(strip=True)
-                    
-                    # Extract current price
-                    price_elem = item.select_one('div[class*="price"] span[aria-hidden="true"], .current-price')
-                    if not price_elem:
-                        continue
-                    current_price = float(price_elem.get_text().replace('$', '').replace(',', '').strip())
-                    
-                    # Extract original price
-                    original_price_elem = item.select_one('.was-price, [class*="original-price"]')
-                    if original_price_elem:
-                        original_price = float(original_price_elem.get_text().replace('$', '').replace('Was ', '').replace(',', '').strip())
-                        
-                        if original_price > current_price:
-                            discount = round((original_price - current_price) / original_price * 100, 2)
-                            product_url = title_elem.get('href')
-                            if not product_url.startswith('http'):
-                                product_url = 'https://www.bestbuy.com' + product_url
-                        
-                            product_info = {
-                                'title': title,
-                                'current_price': current_price,
-                                'original_price': original_price,
-                                'url': product_url,
-                                'discount': discount,
-                                'source': 'Best Buy',
-                                'category': detect_product_category(title)
-                            }
-                            products.append(product_info)
-                            print(f"Added Best Buy product with {discount}% discount")
+            # Extract original price
+            original_price_elem = parser.select_one(item, '.was-price, [class*="original-price"]')
+            if original_price_elem is not None:
+                original_price = float(parser.text(original_price_elem).replace('$', '').replace('Was ', '').replace(',', '').strip())
                 
-                except Exception as e:
-                    print(f"Error processing Best Buy item: {str(e)}")
-                    continue
-            
-            break  # Break the retry loop if successful
-            
+                if original_price > current_price:
+                    discount = round((original_price - current_price) / original_price * 100, 2)
+                    product_url = parser.attr(title_elem, 'href')
+                    if not product_url.startswith('http'):
+                        product_url = 'https://www.bestbuy.com' + product_url
+                
+                    product_info = Product(title, current_price, original_price, discount, product_url, 'Best Buy')
+                    products.append(product_info)
+        
         except Exception as e:
-            retry_count += 1
-            print(f"Best Buy attempt {retry_count} failed: {str(e)}")
-            if retry_count < max_retries:
-                time.sleep(random.uniform(10, 15))
+            log.debug("Error processing Best Buy item: %s", e)
+            continue
     
-    print(f"Found {len(products)} valid Best Buy products")
-    return products
+    log.info(f"Added {len(products)} discounted Best Buy products")
+    return assign_categories(products)
+
+# Both search pages are server-rendered, so --fetch http can skip the browser
+AMAZON_REQUIRES_JS = False
+BESTBUY_REQUIRES_JS = False
+
+def amazon_search_url(keywords, page=1):
+    url = f"https://www.amazon.com/s?k={keywords.replace(' ', '+')}&deals-widget=%257B%2522version%2522%253A1%252C%2522viewIndex%2522%253A0%252C%2522presetId%2522%253A%2522deals-collection-all-deals%2522%257D"
+    return url if page == 1 else f"{url}&page={page}"
+
+def bestbuy_search_url(keywords, page=1):
+    return f"https://www.bestbuy.com/site/searchpage.jsp?st={keywords.replace(' ', '+')}&cp={page}"
+
+# Class of the pagination link to the next results page; disabled on the last page
+NEXT_PAGE_MARKERS = {'Amazon': 's-pagination-next', 'Best Buy': 'sku-list-page-next'}
+
+def has_next_page(store, html):
+    """Whether a captured search page links an enabled next results page"""
+    for match in re.finditer(r'<a\b[^>]*' + NEXT_PAGE_MARKERS[store] + r'[^>]*>', html):
+        if 'disabled="true"' not in match.group(0) and 's-pagination-disabled' not in match.group(0):
+            return True
+    return False
+
+def prefetched_products(pages, store, url, parse):
+    """(products, has next page) of a page fetched over HTTP; None when the browser has to load it instead"""
+    result = pages.get(url)
+    if result is None or result.error or result.status != 200:
+        return None
+    if not page_cache.has_results(result.html, RESULT_MARKERS[store]):
+        log.warning(f"HTTP fetch of {url} returned no results page, leaving it to the browser")
+        return None
+    page_cache.store_page('offer2', store, url, result.html, result.final_url)
+    return parse(result.html), has_next_page(store, result.html)
+
+def load_amazon_products(driver, url, max_items=50, parser=None):
+    """(products, has next page) of one browser attempt at an Amazon search page.
+
+    Raises retry.FetchFailed if the page did not render.
+    """
+    log.info(f"Searching URL: {url}")
+    
+    load_page(driver, url)
+    ready = pacing.wait_for_ready(driver, [AMAZON_RESULT_SELECTOR])
+    
+    html = driver.page_source
+    if not ready:
+        if retry.looks_blocked(html):
+            raise retry.Blocked("Amazon served a captcha")
+        raise retry.FetchFailed("Timed out waiting for Amazon results")
+    # A rendered page without discounted items is a legitimate empty result
+    products = parse_amazon_search_page(html, max_items, parser)
+    page_cache.store_page('offer2', 'Amazon', url, html, driver.current_url)
+    log.info(f"Found {len(products)} valid Amazon products")
+    return products, has_next_page('Amazon', html)
+
+def search_amazon_products(driver, keywords, max_items=50, max_retries=3, parser=None, page=1):
+    """(Amazon deals for keywords, has next page), retrying the page with backoff behind Amazon's circuit breaker"""
+    url = amazon_search_url(keywords, page)
+    cached = page_cache.cached_page('offer2', 'Amazon', url)
+    if cached:
+        return parse_amazon_search_page(cached.html, max_items, parser), has_next_page('Amazon', cached.html)
+    
+    try:
+        return retry.SCHEDULER.call('Amazon', url, partial(load_amazon_products, driver, url, max_items, parser),
+                                    attempts=max_retries)
+    except Exception as e:
+        log.warning(f"Amazon search for '{keywords}' failed: {str(e)}")
+        return [], False
+
+def load_bestbuy_products(driver, url, max_items=50, parser=None):
+    """(products, has next page) of one browser attempt at a Best Buy search page.
+
+    Raises retry.Blocked on a bot check.
+    """
+    log.info(f"Searching Best Buy URL: {url}")
+    
+    load_page(driver, url)
+    ready = pacing.wait_for_ready(driver, BESTBUY_READY_SELECTORS, timeout=15)
+    
+    # Try to handle cookie consent and popups
+    try:
+        popup_buttons = driver.find_elements(By.CSS_SELECTOR, 'button[class*="close"], .modal-close')
+        for button in popup_buttons:
+            if button.is_displayed():
+                button.click()
+    except:
+        pass
+    
+    html = driver.page_source
+    if not ready and retry.looks_blocked(html):
+        raise retry.Blocked("Best Buy served a bot check")
+    products = parse_bestbuy_search_page(html, max_items, parser)
+    if ready:
+        page_cache.store_page('offer2', 'Best Buy', url, html, driver.current_url)
+    return products, has_next_page('Best Buy', html)
+
+def search_bestbuy_products(driver, keywords, max_items=50, max_retries=3, parser=None, page=1):
+    """(Best Buy deals for keywords, has next page), retrying the page with backoff behind Best Buy's circuit breaker"""
+    products, has_next = [], False
+    url = bestbuy_search_url(keywords, page)
+    cached = page_cache.cached_page('offer2', 'Best Buy', url)
+    if cached:
+        return parse_bestbuy_search_page(cached.html, max_items, parser), has_next_page('Best Buy', cached.html)
+    
+    try:
+        products, has_next = retry.SCHEDULER.call(
+            'Best Buy', url, partial(load_bestbuy_products, driver, url, max_items, parser), attempts=max_retries)
+    except Exception as e:
+        log.warning(f"Best Buy search for '{keywords}' failed: {str(e)}")
+    
+    log.info(f"Found {len(products)} valid Best Buy products")
+    return products, has_next
+
+# store -> (search URL for keywords and page, page parser, browser search)
+STORE_SEARCHES = {
+    'Amazon': (amazon_search_url, parse_amazon_search_page, search_amazon_products),
+    'Best Buy': (bestbuy_search_url, parse_bestbuy_search_page, search_bestbuy_products),
+}
+
+def search_store(store, keywords, driver, run_journal, prefetched=None, fetch="browser", max_retries=3,
+                 paginator=None):
+    """Products of a store's keyword search, following its pages while they keep yielding deals.
+
+    Pages are taken from run_journal or prefetched when there, fetched over
+    HTTP with fetch="http", and loaded in the browser otherwise. Follow-up
+    pages come from paginator, the keyword's paginator (default: a fresh one),
+    and stop early once a page links no next page or repeats earlier products.
+    """
+    paginator = paginator or pagination.PAGINATOR.for_query()
+    search_url, parse, search = STORE_SEARCHES[store]
+    prefetched = {} if prefetched is None else prefetched
+    products = []
+    seen = set()
+    page = 1
+    while True:
+        url = search_url(keywords, page)
+        page_products = run_journal.completed(store, url)
+        has_next = True  # journaled pages do not keep their pagination links
+        if page_products is None:
+            with tracing.context(store=store, url=url), tracing.span('job'), profiling.profile(store):
+                if fetch == "http" and url not in prefetched and not page_cache.CACHE.contains(url):
+                    prefetched.update(http_fetch.fetch_pages([url]))
+                fetched = prefetched_products(prefetched, store, url, parse)
+                if fetched is None:
+                    fetched = search(driver, keywords, max_retries=max_retries, page=page)
+                page_products, has_next = fetched
+            run_journal.record(store, url, page_products)
+        new_products = [product for product in page_products if product.link not in seen]
+        seen.update(product.link for product in new_products)
+        products.extend(new_products)
+        if not has_next or (page > 1 and not new_products) or not paginator.should_continue(page, page_products):
+            return products
+        page += 1
 
 def filter_discounted_products(products, min_discount=50):  # Changed default to match MIN_DISCOUNT_PERCENTAGE
-    filtered = [p for p in products if p['discount'] >= min_discount]
-    print(f"Filtering products: {len(products)} total, {len(filtered)} with {min_discount}%+ discount")
+    """Products meeting min_discount, compared as one NumPy batch; suspicious prices never pass"""
+    filtered, _, flags = discounts.filter_discounted(products, min_discount)
+    log.info(f"Filtering products: {len(products)} total, {len(filtered)} with {min_discount}%+ discount")
+    suspicious = discounts.flag_counts(flags)
+    if suspicious:
+        log.info("Suspicious prices: " + ", ".join(f"{count} {name}" for name, count in suspicious.items()))
     return filtered
 
+@tracing.timed('csv_write')
 def save_to_csv(products, filename="discounted_products.csv"):
-    df = pd.DataFrame(products)
-    # Reorder columns and rename for clarity
-    df = df[['title', 'category', 'current_price', 'original_price', 'discount', 'url', 'source']]  # Add category
-    df.columns = ['Product', 'Category', 'Current Price ($)', 'Original Price ($)', 'Discount (%)', 'URL', 'Source']
+    # Build the columns straight from the records, already in output order
+    df = pd.DataFrame({
+        'Product': [p.title for p in products],
+        'Category': [p.category for p in products],
+        'Current Price ($)': [p.price for p in products],
+        'Original Price ($)': [p.original_price for p in products],
+        'Discount (%)': [p.discount for p in products],
+        'URL': [p.link for p in products],
+        'Source': [p.store for p in products],
+    })
     
     # Sort by discount percentage in descending order
     df = df.sort_values(by='Discount (%)', ascending=False)
     
     df.to_csv(filename, index=False)
-    print(f"Saved {len(products)} discounted products to {filename} (sorted by discount percentage)")
+    log.info(f"Saved {len(products)} discounted products to {filename} (sorted by discount percentage)")
 
 if __name__ == "__main__":
-    MIN_DISCOUNT_PERCENTAGE = get_user_discount()
+    parser = argparse.ArgumentParser(description="Daily Amazon and Best Buy deal sweep")
+    parser.add_argument("--min-discount", type=float, help="Minimum discount percentage (prompted when omitted)")
+    parser.add_argument("--fetch", choices=["browser", "http"], default="browser",
+                        help="Fetch server-rendered search pages over HTTP before falling back to the browser")
+    parser.add_argument("--http-concurrency", type=int, default=8)
+    parser.add_argument("--lean", action="store_true",
+                        help="Block images, fonts, media and trackers and return from navigation at DOMContentLoaded")
+    parser.add_argument("--rate", type=float, default=pacing.DEFAULT_RATE,
+                        help="Requests per second allowed to each host")
+    parser.add_argument("--host-rate", action="append", default=[], metavar="HOST=RATE",
+                        help="Override --rate for one host, e.g. www.bestbuy.com=0.2")
+    parser.add_argument("--retries", type=int, default=retry.DEFAULT_ATTEMPTS,
+                        help="Attempts per search page before giving up on it")
+    parser.add_argument("--min-page-deals", type=int, default=pagination.DEFAULT_MIN_DEALS,
+                        help="Load a search's next page only if the last one had this many deals at --min-discount")
+    parser.add_argument("--max-pages", type=int, default=pagination.DEFAULT_MAX_PAGES, help="Pages per search")
+    parser.add_argument("--page-budget", type=int, default=pagination.DEFAULT_BUDGET,
+                        help="Pages after the first that each keyword's searches may load")
+    parser.add_argument("--cache-ttl", type=float, default=page_cache.DEFAULT_TTL / 3600,
+                        help="Reuse pages captured within this many hours (0 disables the page cache)")
+    parser.add_argument("--cache-dir", default=str(page_cache.DEFAULT_DIRECTORY))
+    parser.add_argument("--cache-max-mb", type=float, default=page_cache.DEFAULT_MAX_BYTES / 1024 / 1024)
+    parser.add_argument("--record", metavar="DIR", help="Also save every captured page as a replay fixture in DIR")
+    parser.add_argument("--history", default=str(price_history.DEFAULT_PATH),
+                        help="SQLite price history every run's products are added to")
+    parser.add_argument("--no-history", action="store_true", help="Do not record this run's prices")
+    parser.add_argument("--categories", metavar="JSON",
+                        help="Category taxonomy file ({category: [keywords]}) used instead of the built-in one")
+    parser.add_argument("--parquet", metavar="DIR",
+                        help="Also write the sweep to a Parquet dataset partitioned by date/source/category")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the searches an interrupted sweep already finished today")
+    parser.add_argument("--journal", metavar="PATH", help="Run journal file (default: one per day)")
+    parser.add_argument("--log-level", choices=tracing.LOG_LEVELS, default="INFO",
+                        help="DEBUG also shows every item parsed")
+    parser.add_argument("--trace", metavar="PATH", help="Write every timing span to PATH as JSON lines")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                        help="Profile CPU and allocations per retailer into DIR (default profiles/<timestamp>)")
+    parser.add_argument("--collapsed-stacks", action="store_true",
+                        help="With --profile, also sample stacks into collapsed.txt for flame graphs")
+    args = parser.parse_args()
+    tracing.configure_logging(args.log_level)
+    tracing.TRACER.configure(args.trace)
+    if args.profile is not None:
+        profiling.enable(args.profile or None, args.collapsed_stacks)
+    if args.categories:
+        CLASSIFIER = categories.CategoryClassifier(categories.load_taxonomy(args.categories))
+    if args.parquet:
+        sweep_store.require_pyarrow()
+    if args.record:
+        replay.RECORDER.start(args.record)
+    pacing.RATE_LIMITER.configure(rate=args.rate, host_rates=pacing.parse_host_rates(args.host_rate))
+    retry.SCHEDULER.configure(attempts=args.retries)
+    page_cache.CACHE.configure(args.cache_dir, args.cache_ttl * 3600, int(args.cache_max_mb * 1024 * 1024))
+
+    MIN_DISCOUNT_PERCENTAGE = args.min_discount if args.min_discount is not None else get_user_discount()
+    pagination.PAGINATOR.configure(MIN_DISCOUNT_PERCENTAGE, args.min_page_deals, args.max_pages, args.page_budget)
     search_categories = {
         'deals': ['clearance', 'discount', 'sale', 'deal'],
         'electronics': ['laptop deals', 'tablet sale', 'phone deals'],
@@ -274,40 +537,76 @@ if __name__ == "__main__":
         'fashion': ['fashion deals', 'clothing sale', 'shoes clearance']
     }
     
-    driver = None
+    driver = LazyDriver(partial(setup_driver, lean=args.lean))
+    run_journal = journal.RunJournal(args.journal or journal.default_path('offer2'), resume=args.resume)
     try:
-        driver = setup_driver()
-        driver.implicitly_wait(10)
         all_products = []
+        seen_products = []
+        
+        # Fetch every server-rendered search page that is not cached concurrently up front
+        prefetched = {}
+        if args.fetch == "http":
+            urls = []
+            for terms in search_categories.values():
+                for keywords in terms:
+                    if not AMAZON_REQUIRES_JS:
+                        urls.append(amazon_search_url(keywords))
+                    if not BESTBUY_REQUIRES_JS:
+                        urls.append(bestbuy_search_url(keywords))
+            urls = [url for url in urls if not page_cache.CACHE.contains(url)
+                    and run_journal.completed('Amazon', url) is None and run_journal.completed('Best Buy', url) is None]
+            log.info(f"Fetching {len(urls)} search pages over HTTP...")
+            prefetched = http_fetch.fetch_pages(urls, concurrency=args.http_concurrency)
         
         for category, terms in search_categories.items():
-            print(f"\nSearching in category: {category}")
+            log.info(f"Searching in category: {category}")
             for keywords in terms:
-                print(f"Searching for: {keywords}")
-                time.sleep(random.uniform(3, 7))  # Add delay between searches
+                log.info(f"Searching for: {keywords}")
+                paginator = pagination.PAGINATOR.for_query()
                 
-                # Search both Amazon and Best Buy
-                amazon_products = search_amazon_products(driver, f"{keywords}")
-                bestbuy_products = search_bestbuy_products(driver, f"{keywords}")
+                # Search both Amazon and Best Buy, loading in the browser only what HTTP could not
+                # and skipping what an interrupted run already journaled
+                amazon_products = search_store('Amazon', keywords, driver, run_journal, prefetched,
+                                               args.fetch, args.retries, paginator)
+                bestbuy_products = search_store('Best Buy', keywords, driver, run_journal, prefetched,
+                                                args.fetch, args.retries, paginator)
                 
-                # Filter products meeting discount threshold
-                amazon_filtered = filter_discounted_products(amazon_products, min_discount=MIN_DISCOUNT_PERCENTAGE)
-                bestbuy_filtered = filter_discounted_products(bestbuy_products, min_discount=MIN_DISCOUNT_PERCENTAGE)
+                seen_products.extend(amazon_products)
+                seen_products.extend(bestbuy_products)
                 
-                all_products.extend(amazon_filtered)
-                all_products.extend(bestbuy_filtered)
+                # Filter both stores' products meeting the discount threshold as one batch
+                filtered = filter_discounted_products(amazon_products + bestbuy_products,
+                                                      min_discount=MIN_DISCOUNT_PERCENTAGE)
+                all_products.extend(filtered)
+                amazon_count = sum(1 for p in filtered if p.store == 'Amazon')
                 
-                print(f"Category '{category}' - '{keywords}': Found {len(amazon_filtered)} Amazon and {len(bestbuy_filtered)} Best Buy products meeting {MIN_DISCOUNT_PERCENTAGE}% discount threshold")
+                log.info(f"Category '{category}' - '{keywords}': Found {amazon_count} Amazon and {len(filtered) - amazon_count} Best Buy products meeting {MIN_DISCOUNT_PERCENTAGE}% discount threshold")
         
         if all_products:
-            unique_products = {p['url']: p for p in all_products}.values()
+            unique_products = near_dupes.dedupe(all_products)
             save_to_csv(list(unique_products), f"deals_{datetime.now().strftime('%Y%m%d')}.csv")
-            print(f"\nTotal unique products found: {len(unique_products)}")
+            if args.parquet:
+                sweep_store.write_sweep(list(unique_products), args.parquet)
+            log.info(f"Total unique products found: {len(unique_products)}")
         else:
-            print(f"No products with {MIN_DISCOUNT_PERCENTAGE}% or more discount found.")  # Modified to use variable
+            log.info(f"No products with {MIN_DISCOUNT_PERCENTAGE}% or more discount found.")  # Modified to use variable
+        
+        if seen_products and not args.no_history:
+            price_history.record(args.history, seen_products, 'offer2')
+        run_journal.finish()
+        
+        page_cache.CACHE.print_report()
+        http_fetch.print_latency_report()
+        pacing.print_pacing_report()
+        retry.print_retry_report()
+        pagination.print_pagination_report()
+        tracing.print_timing_report()
             
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error(f"An error occurred: {e}")
+        log.info(f"Finished searches are kept in {run_journal.path}; rerun with --resume to continue")
     finally:
-        if driver:
-            driver.quit()
+        run_journal.close()
+        tracing.TRACER.close()
+        profiling.finish()
+        driver.quit()
@@ -0,0 +1,186 @@
+"""Long-running search daemon that keeps a warm pool of browsers.
+
+Start it once and the browser startup cost is paid once, not per query:
+
+    python offer_daemon.py serve --workers 3 --recycle-after 200
+
+Queries are sent over a local socket, one JSON object per line
+({"query": "laptop", "retailers": ["Amazon"], "fetch": "browser", "extract": "script"}):
+
+    python offer_daemon.py query "laptop" --save
+
+or by dropping NAME.json request files into the directory given with
+--queue-dir; the answer is written next to it as NAME.result.json.
+"""
+import argparse
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+import http_fetch
+import offer
+import pacing
+import page_cache
+import tracing
+from product import Product
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+log = logging.getLogger(__name__)
+
+def run_query(pool, request, store_limits=None):
+    """Search the requested retailers for one query on the shared pool"""
+    query = request['query']
+    stores = request.get('retailers') or list(offer.DEFAULT_RETAILERS)
+    retailers = {store: offer.ALL_RETAILERS[store] for store in stores}
+    # Nothing reports the daemon's spans and latencies, so keep them from piling up across queries
+    tracing.TRACER.reset()
+    http_fetch.reset_latencies()
+    start = time.perf_counter()
+    results = offer.search_all(query, retailers, pool, store_limits, fetch=request.get('fetch', 'browser'),
+                               extract=request.get('extract', 'page_source'))
+    results = {store: [product.as_dict() for product in products] for store, products in results.items()}
+    return {'query': query, 'results': results, 'seconds': round(time.perf_counter() - start, 2)}
+
+def answer(pool, request, store_limits):
+    try:
+        return run_query(pool, request, store_limits)
+    except Exception as e:
+        log.exception(f"Error answering {request!r}")
+        return {'query': request.get('query'), 'error': str(e)}
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {'error': f"Invalid request: {str(e)}"}
+            else:
+                response = answer(self.server.pool, request, self.server.store_limits)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+class QueryServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, pool, store_limits=None):
+        super().__init__(address, QueryHandler)
+        self.pool = pool
+        self.store_limits = store_limits
+
+def watch_queue(directory, pool, store_limits, stop, poll_interval=1.0):
+    """Answer NAME.json request files with NAME.result.json until stop is set"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    while not stop.is_set():
+        for request_path in sorted(directory.glob('*.json')):
+            if request_path.name.endswith('.result.json'):
+                continue
+            # Renaming claims the request, so several daemons can share a directory
+            claimed = request_path.with_suffix('.working')
+            try:
+                request_path.rename(claimed)
+            except OSError:
+                continue
+            try:
+                request = json.loads(claimed.read_text(encoding='utf-8'))
+            except ValueError as e:
+                response = {'error': f"Invalid request: {str(e)}"}
+            else:
+                response = answer(pool, request, store_limits)
+            result_path = directory / f"{request_path.stem}.result.json"
+            partial_path = directory / f"{request_path.stem}.result.tmp"
+            partial_path.write_text(json.dumps(response), encoding='utf-8')
+            partial_path.replace(result_path)
+            claimed.unlink()
+        stop.wait(poll_interval)
+
+def serve(args):
+    pacing.RATE_LIMITER.configure(rate=args.rate, host_rates=pacing.parse_host_rates(args.host_rate))
+    page_cache.CACHE.configure(ttl=args.cache_ttl * 3600)
+    store_limits = offer.parse_store_limits(args.store_limit)
+    pool = offer.DriverPool(args.workers, factory=partial(offer.setup_driver, lean=args.lean),
+                            max_pages=args.recycle_after)
+    pool.start()
+
+    stop = threading.Event()
+    if args.queue_dir:
+        threading.Thread(target=watch_queue, args=(args.queue_dir, pool, store_limits, stop), daemon=True).start()
+        log.info(f"Watching {args.queue_dir} for query files")
+
+    server = QueryServer((args.host, args.port), pool, store_limits)
+    log.info(f"Offer Finder daemon listening on {args.host}:{args.port} with {args.workers} warm browser(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Shutting down...")
+    finally:
+        stop.set()
+        server.server_close()
+        pool.quit()
+
+def send_query(query, host=DEFAULT_HOST, port=DEFAULT_PORT, retailers=None, fetch='browser', extract='page_source'):
+    """Send one query to a running daemon and return its decoded response"""
+    request = {'query': query, 'fetch': fetch, 'extract': extract}
+    if retailers:
+        request['retailers'] = retailers
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        with connection.makefile('r', encoding='utf-8') as reader:
+            return json.loads(reader.readline())
+
+def query(args):
+    response = send_query(args.query, args.host, args.port, args.retailer, args.fetch, args.extract)
+    if 'error' in response:
+        print(f"Daemon error: {response['error']}")
+        return
+    for store, products in response['results'].items():
+        print(f"Found {len(products)} results from {store}")
+    print(f"Answered in {response['seconds']}s")
+    if args.save and any(response['results'].values()):
+        results = {store: [Product.from_dict(values) for values in products]
+                   for store, products in response['results'].items()}
+        filename = offer.save_to_csv(results, args.query)
+        print(f"Results saved to: {filename}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offer Finder search daemon")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run the daemon with a warm browser pool")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--workers", type=int, default=3, help="Number of warm browser instances")
+    serve_parser.add_argument("--recycle-after", type=int, default=200, help="Restart a browser after this many pages")
+    serve_parser.add_argument("--lean", action="store_true", help="Block images, fonts, media and trackers")
+    serve_parser.add_argument("--queue-dir", help="Also answer request files dropped into this directory")
+    serve_parser.add_argument("--store-limit", action="append", default=[], metavar="STORE=N")
+    serve_parser.add_argument("--rate", type=float, default=pacing.DEFAULT_RATE)
+    serve_parser.add_argument("--host-rate", action="append", default=[], metavar="HOST=RATE")
+    serve_parser.add_argument("--cache-ttl", type=float, default=page_cache.DEFAULT_TTL / 3600,
+                              help="Reuse pages captured within this many hours (0 disables the page cache)")
+    serve_parser.set_defaults(func=serve)
+
+    query_parser = subparsers.add_parser("query", help="Send a query to a running daemon")
+    query_parser.add_argument("query")
+    query_parser.add_argument("--host", default=DEFAULT_HOST)
+    query_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    query_parser.add_argument("--retailer", action="append", help="Store to search (repeatable)")
+    query_parser.add_argument("--fetch", choices=["browser", "http"], default="browser")
+    query_parser.add_argument("--extract", choices=["page_source", "script"], default="page_source")
+    query_parser.add_argument("--save", action="store_true", help="Write the results to a CSV file")
+    query_parser.set_defaults(func=query)
+
+    args = parser.parse_args()
+    tracing.configure_logging()
+    args.func(args)
@@ -0,0 +1,150 @@
+"""Request pacing shared by every search worker.
+
+Politeness is enforced by a token bucket per host instead of fixed random
+sleeps, and pages are considered loaded as soon as their result grid is in
+the DOM. Time spent waiting on either is accumulated so a run can report
+how much of it was idle.
+"""
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+import tracing
+
+DEFAULT_RATE = 0.5   # requests per second per host
+DEFAULT_BURST = 2
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() books a slot and returns the delay until it"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+class PacingStats:
+    """Worker-seconds spent idle (rate limiting), waiting for pages, and working"""
+
+    def __init__(self):
+        self._seconds = defaultdict(float)
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def add(self, kind, seconds):
+        with self._lock:
+            self._seconds[kind] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._seconds)
+
+class HostRateLimiter:
+    """One token bucket per host, shared by all drivers and the HTTP backend"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, host_rates=None, stats=None):
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = host_rates or {}
+        self.stats = stats or STATS
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rate=None, burst=None, host_rates=None):
+        with self._lock:
+            if rate is not None:
+                self.rate = rate
+            if burst is not None:
+                self.burst = burst
+            if host_rates:
+                self.host_rates.update(host_rates)
+            self._buckets.clear()
+
+    def _bucket(self, url):
+        host = urlsplit(url).hostname or ''
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.host_rates.get(host, self.rate), self.burst)
+            return bucket
+
+    def acquire(self, url):
+        delay = self._bucket(url).reserve()
+        if delay > 0:
+            time.sleep(delay)
+        self.stats.add('idle', delay)
+        return delay
+
+    async def acquire_async(self, url):
+        delay = self._bucket(url).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.stats.add('idle', delay)
+        return delay
+
+STATS = PacingStats()
+RATE_LIMITER = HostRateLimiter()
+
+def wait_for_ready(driver, selectors, timeout=10):
+    """Block until any of the CSS selectors is present; False on timeout"""
+    start = time.perf_counter()
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: any(d.find_elements(By.CSS_SELECTOR, selector) for selector in selectors))
+        return True
+    except TimeoutException:
+        return False
+    finally:
+        elapsed = time.perf_counter() - start
+        STATS.add('ready_wait', elapsed)
+        tracing.TRACER.record('wait', elapsed)
+
+def wait_for_more_items(driver, item_selector, previous_count, timeout=3):
+    """After a scroll, wait until more items than previous_count are rendered"""
+    start = time.perf_counter()
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: len(d.find_elements(By.CSS_SELECTOR, item_selector)) > previous_count)
+        return True
+    except TimeoutException:
+        return False
+    finally:
+        elapsed = time.perf_counter() - start
+        STATS.add('ready_wait', elapsed)
+        tracing.TRACER.record('scroll_wait', elapsed)
+
+def parse_host_rates(values):
+    """Parse repeated HOST=RATE options into a dict"""
+    rates = {}
+    for value in values:
+        host, _, rate = value.rpartition('=')
+        rates[host] = float(rate)
+    return rates
+
+def print_pacing_report(workers=1):
+    """Idle vs. page-wait vs. work time, in worker-seconds over the run"""
+    wall = time.perf_counter() - STATS.started
+    seconds = STATS.snapshot()
+    capacity = wall * workers
+    idle = seconds.get('idle', 0.0)
+    ready = seconds.get('ready_wait', 0.0)
+    work = max(capacity - idle - ready, 0.0)
+    print(f"\nRun time {wall:.1f}s over {workers} worker(s):")
+    for label, value in (('rate-limit idle', idle), ('waiting for pages', ready), ('other work', work)):
+        share = value / capacity * 100 if capacity else 0
+        print(f"  {label:18} {value:8.1f}s  {share:5.1f}%")
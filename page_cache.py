@@ -0,0 +1,172 @@
+"""On-disk cache of captured search pages.
+
+Entries are keyed by normalized URL and stored zlib-compressed together
+with the URL the page finally loaded from. Entries older than the TTL are
+ignored; once the cache grows past its size cap the least recently used
+entries are evicted.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import namedtuple
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import replay
+import retry
+
+DEFAULT_DIRECTORY = Path.home() / '.cache' / 'offer_finder' / 'pages'
+DEFAULT_TTL = 6 * 3600
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+log = logging.getLogger(__name__)
+
+# Per-request parameters that change on every visit without changing the results
+VOLATILE_PARAMS = {'qid', 'ref', 'ref_', 'crid', 'sprefix', 'xpid'}
+
+CachedPage = namedtuple('CachedPage', ['url', 'final_url', 'html', 'age'])
+
+def normalize_url(url):
+    """Lower-case scheme and host, sort query parameters, drop volatile ones and the fragment"""
+    parts = urlsplit(url.strip())
+    path = '/'.join(segment for segment in parts.path.split('/') if not segment.startswith('ref='))
+    params = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+              if key not in VOLATILE_PARAMS]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path or '/', urlencode(sorted(params)), ''))
+
+class PageCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.configure(directory, ttl, max_bytes)
+
+    def configure(self, directory=None, ttl=None, max_bytes=None):
+        with self._lock:
+            if directory is not None:
+                self.directory = Path(directory)
+                self._size = None
+            if ttl is not None:
+                self.ttl = ttl
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _path(self, url):
+        digest = hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.z"
+
+    def _fresh_path(self, url):
+        path = self._path(url)
+        try:
+            written = path.stat().st_mtime
+        except OSError:
+            return None, None
+        age = time.time() - written
+        return (path, age) if age <= self.ttl else (None, None)
+
+    def contains(self, url):
+        """True if a fresh entry exists, without counting a hit or miss"""
+        return self.enabled and self._fresh_path(url)[0] is not None
+
+    def get(self, url):
+        if not self.enabled:
+            return None
+        path, age = self._fresh_path(url)
+        entry = None
+        if path is not None:
+            try:
+                entry = json.loads(zlib.decompress(path.read_bytes()))
+                # Access time orders eviction; mtime stays the write time for the TTL
+                os.utime(path, (time.time(), path.stat().st_mtime))
+            except (OSError, ValueError, zlib.error):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return CachedPage(url, entry['final_url'], entry['html'], age)
+
+    def put(self, url, html, final_url=None):
+        if not self.enabled or not html:
+            return
+        path = self._path(url)
+        data = zlib.compress(json.dumps({'final_url': final_url or url, 'html': html}).encode('utf-8'), 6)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            previous = path.stat().st_size if path.exists() else 0
+            partial = path.with_suffix(f".{threading.get_ident()}.tmp")
+            partial.write_bytes(data)
+            partial.replace(path)
+        except OSError as e:
+            log.warning(f"Could not cache {url}: {str(e)}")
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data) - previous
+        self._evict()
+
+    def _entries(self):
+        return [path for path in self.directory.glob('*/*.z')]
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            if self._size is None:
+                self._size = sum(path.stat().st_size for path in self._entries())
+            if self._size <= self.max_bytes:
+                return
+            entries = []
+            for path in self._entries():
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except OSError:
+                    pass
+            self._size = total
+
+    def print_report(self):
+        if not self.enabled:
+            return
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        print(f"\nPage cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)")
+
+CACHE = PageCache()
+
+def cached_page(script, store, url):
+    """Page cache lookup; hits are also saved as fixtures of script when recording"""
+    cached = CACHE.get(url)
+    if cached:
+        replay.RECORDER.record(script, store, url, cached.html, cached.final_url)
+    return cached
+
+def store_page(script, store, url, html, final_url):
+    """Keep a freshly captured page in the page cache and, when recording, as a fixture of script"""
+    CACHE.put(url, html, final_url)
+    replay.RECORDER.record(script, store, url, html, final_url)
+
+def has_results(html, markers):
+    """Whether a page fetched without the browser holds result cards rather than a bot check.
+
+    markers is text of which at least one only appears in pages with result cards.
+    """
+    return any(marker in html for marker in markers) and not retry.looks_blocked(html)
@@ -0,0 +1,96 @@
+"""Adaptive pagination driven by how many deals each page yields.
+
+A search keeps following its next page while the last page produced at
+least min_deals products discounted by min_discount percent or more, up to
+max_pages per search. Pages after the first are taken from one budget
+shared by all of a query's searches; once it is spent, searches stop after
+the page they are on. Productive searches go deeper, and dead ones stop
+after page one instead of always loading a fixed number of pages.
+
+PAGINATOR holds the configured settings and the run's totals. Every query
+(a search_all call, one offer2 keyword) paginates with its own
+PAGINATOR.for_query(), so concurrent queries never share a budget.
+"""
+import threading
+
+DEFAULT_MIN_DISCOUNT = 20.0   # percent off that makes a product count as a deal
+DEFAULT_MIN_DEALS = 3         # deals a page needs for the next page to be loaded
+DEFAULT_MAX_PAGES = 5         # pages per search
+DEFAULT_BUDGET = 40           # pages after the first per query
+
+class PageBudget:
+    """Thread-safe count of the follow-up pages a query may still load"""
+
+    def __init__(self, pages=DEFAULT_BUDGET):
+        self.pages = pages
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Reserve one more page; False once the budget is spent"""
+        with self._lock:
+            if self.used >= self.pages:
+                return False
+            self.used += 1
+            return True
+
+class Paginator:
+    def __init__(self, min_discount=DEFAULT_MIN_DISCOUNT, min_deals=DEFAULT_MIN_DEALS,
+                 max_pages=DEFAULT_MAX_PAGES, budget=DEFAULT_BUDGET, parent=None):
+        self.min_discount = min_discount
+        self.min_deals = min_deals
+        self.max_pages = max_pages
+        self.budget = PageBudget(budget)
+        self.followed = 0
+        self.stopped = {'yield': 0, 'max_pages': 0, 'budget': 0}
+        self._parent = parent
+        self._lock = threading.Lock()
+
+    def configure(self, min_discount=None, min_deals=None, max_pages=None, budget=None):
+        if min_discount is not None:
+            self.min_discount = min_discount
+        if min_deals is not None:
+            self.min_deals = min_deals
+        if max_pages is not None:
+            self.max_pages = max_pages
+        if budget is not None:
+            self.budget = PageBudget(budget)
+
+    def for_query(self):
+        """A paginator with these settings and a fresh budget for one query; its counts add up here"""
+        return Paginator(self.min_discount, self.min_deals, self.max_pages, self.budget.pages, parent=self)
+
+    def deals(self, products):
+        return sum(1 for product in products if product.discount >= self.min_discount)
+
+    def _count(self, reason=None):
+        with self._lock:
+            if reason:
+                self.stopped[reason] += 1
+            else:
+                self.followed += 1
+        if self._parent:
+            self._parent._count(reason)
+
+    def _stop(self, reason):
+        self._count(reason)
+        return False
+
+    def should_continue(self, page, products):
+        """Whether to load page + 1 after page (1-based) yielded products"""
+        if page >= self.max_pages:
+            return self._stop('max_pages')
+        if self.deals(products) < self.min_deals:
+            return self._stop('yield')
+        if not self.budget.take():
+            return self._stop('budget')
+        self._count()
+        return True
+
+PAGINATOR = Paginator()
+
+def print_pagination_report():
+    stopped = PAGINATOR.stopped
+    print(f"\nFollow-up pages loaded: {PAGINATOR.followed} with a {PAGINATOR.budget.pages} page budget per query "
+          f"(searches stopped: {stopped['yield']} low yield, {stopped['max_pages']} at max pages, "
+          f"{stopped['budget']} out of budget)")
@@ -0,0 +1,217 @@
+"""Local SQLite store of every price the scrapers have seen.
+
+Each run's products are ingested in one transaction, keyed by a canonical
+product id (Amazon ASIN, Best Buy SKU, Walmart item id, otherwise the
+normalized link), so the same product seen on different days forms a
+price time series per condition (an ASIN listed New and Used is two
+series). The indexes cover the questions asked of it:
+
+    python price_history.py lowest amazon:B0C1234567 --days 90
+    python price_history.py drops
+    python price_history.py top --category laptop
+"""
+import argparse
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+import tracing
+from canonical import product_key
+
+DEFAULT_PATH = Path.home() / '.cache' / 'offer_finder' / 'history.sqlite'
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    query TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    product_key TEXT NOT NULL UNIQUE,
+    store TEXT NOT NULL,
+    title TEXT NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    link TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prices (
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    observed_at INTEGER NOT NULL,
+    price REAL NOT NULL,
+    original_price REAL NOT NULL,
+    discount REAL NOT NULL,
+    condition TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS prices_by_series ON prices(product_id, condition, observed_at, run_id);
+CREATE INDEX IF NOT EXISTS prices_by_run ON prices(run_id, discount);
+CREATE INDEX IF NOT EXISTS products_by_category ON products(category);
+"""
+
+# SQLite limits the number of ? parameters per statement
+LOOKUP_CHUNK = 500
+
+class PriceHistory:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _product_ids(self, keys):
+        ids = {}
+        keys = list(keys)
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            for row in self.connection.execute(
+                    f"SELECT id, product_key FROM products WHERE product_key IN ({placeholders})", chunk):
+                ids[row['product_key']] = row['id']
+        return ids
+
+    def record_run(self, products, source, query=None, observed_at=None):
+        """Ingest one run's products in a single transaction; returns the run id"""
+        observed_at = int(observed_at or time.time())
+        keyed = [(product_key(product.store, product.link), product) for product in products]
+        with self.connection:
+            run_id = self.connection.execute(
+                "INSERT INTO runs (started_at, source, query) VALUES (?, ?, ?)",
+                (observed_at, source, query)).lastrowid
+            self.connection.executemany(
+                """INSERT INTO products (product_key, store, title, category, link) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(product_key) DO UPDATE SET
+                       title = excluded.title,
+                       link = excluded.link,
+                       category = CASE WHEN excluded.category != '' THEN excluded.category ELSE category END""",
+                ((key, product.store, product.title, product.category, product.link) for key, product in keyed))
+            ids = self._product_ids({key for key, _ in keyed})
+            self.connection.executemany(
+                """INSERT INTO prices (product_id, run_id, observed_at, price, original_price, discount, condition)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                ((ids[key], run_id, observed_at, product.price, product.original_price, product.discount,
+                  product.condition) for key, product in keyed))
+        return run_id
+
+    def latest_run(self, source=None):
+        if source:
+            row = self.connection.execute("SELECT MAX(id) FROM runs WHERE source = ?", (source,)).fetchone()
+        else:
+            row = self.connection.execute("SELECT MAX(id) FROM runs").fetchone()
+        return row[0]
+
+    def lowest_price(self, key, days=90, condition='New'):
+        """(lowest price, when) for a product key in one condition over the last days, or None"""
+        since = int(time.time() - days * 86400)
+        row = self.connection.execute(
+            """SELECT MIN(prices.price) AS price, prices.observed_at FROM prices
+               JOIN products ON products.id = prices.product_id
+               WHERE products.product_key = ? AND prices.condition = ? AND prices.observed_at >= ?""",
+            (key, condition, since)).fetchone()
+        return None if row['price'] is None else (row['price'], row['observed_at'])
+
+    def price_drops(self, run_id=None):
+        """Products of a run (default: the latest) whose price fell since their previous observation
+        in the same condition"""
+        run_id = run_id or self.latest_run()
+        # One index seek per product for its observation just before this run
+        return self.connection.execute(
+            """WITH observed AS (
+                   SELECT current.product_id, current.condition, current.price,
+                          (SELECT earlier.price FROM prices AS earlier
+                           WHERE earlier.product_id = current.product_id
+                             AND earlier.condition = current.condition
+                             AND (earlier.observed_at, earlier.run_id) < (current.observed_at, current.run_id)
+                           ORDER BY earlier.observed_at DESC, earlier.run_id DESC LIMIT 1) AS previous
+                   FROM prices AS current
+                   WHERE current.run_id = ?
+               )
+               SELECT products.product_key, products.store, products.title, products.link,
+                      observed.condition, observed.previous, observed.price
+               FROM observed JOIN products ON products.id = observed.product_id
+               WHERE observed.previous > observed.price
+               ORDER BY (observed.previous - observed.price) / observed.previous DESC""",
+            (run_id,)).fetchall()
+
+    def top_discounts(self, category=None, limit=20, run_id=None):
+        """Best discounts of a run (default: the latest), optionally within one category"""
+        run_id = run_id or self.latest_run()
+        sql = """SELECT products.product_key, products.store, products.category, products.title, products.link,
+                        prices.price, prices.original_price, prices.discount
+                 FROM prices JOIN products ON products.id = prices.product_id
+                 WHERE prices.run_id = ?"""
+        params = [run_id]
+        if category:
+            sql += " AND products.category = ?"
+            params.append(category)
+        sql += " ORDER BY prices.discount DESC LIMIT ?"
+        params.append(limit)
+        return self.connection.execute(sql, params).fetchall()
+
+@tracing.timed('history')
+def record(path, products, source, query=None):
+    """Ingest products into the history at path and report the run's price drops"""
+    start = time.perf_counter()
+    history = PriceHistory(path)
+    try:
+        run_id = history.record_run(products, source, query)
+        drops = history.price_drops(run_id)
+    finally:
+        history.close()
+    log.info(f"Recorded {len(products)} prices in {path} in {time.perf_counter() - start:.2f}s "
+             f"({len(drops)} dropped since the previous run)")
+    return run_id
+
+def show_lowest(history, args):
+    result = history.lowest_price(args.key, args.days, args.condition)
+    if result is None:
+        print(f"No {args.condition} prices for {args.key} in the last {args.days} days")
+        return
+    price, observed_at = result
+    print(f"${price:.2f} on {time.strftime('%Y-%m-%d', time.localtime(observed_at))}")
+
+def show_drops(history, args):
+    for row in history.price_drops(args.run):
+        print(f"{row['store']:10} {row['condition']:12} ${row['previous']:>9.2f} -> ${row['price']:>9.2f}  "
+              f"{row['title'][:60]}")
+
+def show_top(history, args):
+    for row in history.top_discounts(args.category, args.limit, args.run):
+        print(f"{row['store']:10} {row['discount']:5.1f}%  ${row['price']:>9.2f}  {row['title'][:60]}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the Offer Finder price history")
+    parser.add_argument("--db", default=str(DEFAULT_PATH))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    lowest_parser = subparsers.add_parser("lowest", help="Lowest price of one product over a period")
+    lowest_parser.add_argument("key", help="Product key, e.g. amazon:B0C1234567")
+    lowest_parser.add_argument("--days", type=int, default=90)
+    lowest_parser.add_argument("--condition", default="New", help="Condition of the series, e.g. Used or Renewed")
+    lowest_parser.set_defaults(func=show_lowest)
+
+    drops_parser = subparsers.add_parser("drops", help="Products whose price dropped since their previous run")
+    drops_parser.add_argument("--run", type=int, help="Run id (default: the latest)")
+    drops_parser.set_defaults(func=show_drops)
+
+    top_parser = subparsers.add_parser("top", help="Top discounts of a run")
+    top_parser.add_argument("--category")
+    top_parser.add_argument("--limit", type=int, default=20)
+    top_parser.add_argument("--run", type=int, help="Run id (default: the latest)")
+    top_parser.set_defaults(func=show_top)
+
+    args = parser.parse_args()
+    history = PriceHistory(args.db)
+    try:
+        args.func(history, args)
+    finally:
+        history.close()
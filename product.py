@@ -0,0 +1,32 @@
+"""Product record shared by offer.py and offer2.py.
+
+A daily sweep holds tens of thousands of products, so the record uses
+__slots__ instead of a per-instance dict, and the few distinct store,
+condition and category strings are interned so every product shares one
+copy of each.
+"""
+import sys
+
+class Product:
+    """One search result. price is the current price; discount is a percentage"""
+    __slots__ = ('title', 'price', 'original_price', 'discount', 'link', 'store', 'condition', 'category')
+
+    def __init__(self, title, price, original_price, discount, link, store, condition='New', category=''):
+        self.title = title
+        self.price = price
+        self.original_price = original_price
+        self.discount = discount
+        self.link = link
+        self.store = sys.intern(store)
+        self.condition = sys.intern(condition)
+        self.category = sys.intern(category)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{name: values[name] for name in cls.__slots__ if name in values})
+
+    def __repr__(self):
+        return f"Product({self.store!r}, {self.title[:40]!r}, ${self.price:.2f}, {self.discount:.1f}% off)"
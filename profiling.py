@@ -0,0 +1,174 @@
+"""Per-retailer CPU and memory profiles of a run (--profile).
+
+Every search job runs under cProfile and between two tracemalloc
+snapshots, and its wall time is split into CPU time of the job's thread
+and time spent waiting (WebDriver round trips, page loads, rate-limit and
+retry sleeps). At the end of the run each retailer gets:
+
+    profiles/Amazon.pstats    combined cProfile stats (python -m pstats, snakeviz, ...)
+    profiles/Amazon.txt       top functions by cumulative time and top allocation sites
+
+With collapsed stacks enabled, a sampling thread also records the job
+threads' Python stacks to collapsed.txt (one "store;frame;frame count" line
+per stack) for flamegraph.pl or speedscope.
+
+Allocations are process-wide, so the scripts run browser searches one at a
+time while profiling to keep them attributed to one retailer.
+"""
+import cProfile
+import io
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_DIRECTORY = Path('profiles')
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+SAMPLE_INTERVAL = 0.005
+
+def default_directory():
+    return DEFAULT_DIRECTORY / datetime.now().strftime('%Y%m%d_%H%M%S')
+
+def file_name(store):
+    return re.sub(r'[^A-Za-z0-9]+', '_', store).strip('_') or 'other'
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+def own_allocations_removed(snapshot):
+    return snapshot.filter_traces([tracemalloc.Filter(False, __file__),
+                                   tracemalloc.Filter(False, tracemalloc.__file__)])
+
+class StackSampler(threading.Thread):
+    """Samples the Python stacks of the threads currently running a profiled job"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.active = {}  # thread id -> store
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, store in list(self.active.items()):
+                frame = frames.get(thread_id)
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame))
+                    frame = frame.f_back
+                if labels:
+                    self.stacks[';'.join([store] + labels[::-1])] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+class JobStats:
+    def __init__(self):
+        self.jobs = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.profiles = []
+        self.allocations = defaultdict(lambda: [0, 0])  # site -> [bytes, blocks]
+
+class Profiler:
+    def __init__(self, directory=None, collapsed=False):
+        self.directory = Path(directory or default_directory())
+        self.collapsed = collapsed
+        self.stores = defaultdict(JobStats)
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        tracemalloc.start()
+        if self.collapsed:
+            self._sampler = StackSampler()
+            self._sampler.start()
+
+    @contextmanager
+    def profile(self, store):
+        """Profile one search job of store"""
+        profiler = cProfile.Profile()
+        thread_id = threading.get_ident()
+        before = tracemalloc.take_snapshot()
+        if self._sampler:
+            self._sampler.active[thread_id] = store
+        wall, cpu = time.perf_counter(), time.thread_time()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            if self._sampler:
+                self._sampler.active.pop(thread_id, None)
+            growth = own_allocations_removed(tracemalloc.take_snapshot()).compare_to(
+                own_allocations_removed(before), 'lineno')
+            with self._lock:
+                stats = self.stores[store]
+                stats.jobs += 1
+                stats.wall += wall
+                stats.cpu += cpu
+                stats.profiles.append(profiler)
+                for difference in growth:
+                    if difference.size_diff > 0:
+                        site = stats.allocations[str(difference.traceback[0])]
+                        site[0] += difference.size_diff
+                        site[1] += difference.count_diff
+
+    def stop(self):
+        if self._sampler:
+            self._sampler.stop()
+        tracemalloc.stop()
+
+    def write_reports(self):
+        """Write the per-retailer files and print where each retailer's time went"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for store, stats in self.stores.items():
+            combined = pstats.Stats(*stats.profiles)
+            combined.dump_stats(str(self.directory / f"{file_name(store)}.pstats"))
+            text = io.StringIO()
+            pstats.Stats(*stats.profiles, stream=text).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            text.write(f"\nTop allocation sites still held after each job ({stats.jobs} jobs):\n")
+            sites = sorted(stats.allocations.items(), key=lambda item: -item[1][0])[:TOP_ALLOCATIONS]
+            for site, (size, count) in sites:
+                text.write(f"{size / 1024:10.1f} KiB {count:8} blocks  {site}\n")
+            (self.directory / f"{file_name(store)}.txt").write_text(text.getvalue(), encoding='utf-8')
+        if self._sampler:
+            with open(self.directory / 'collapsed.txt', 'w', encoding='utf-8') as file:
+                for stack, count in self._sampler.stacks.most_common():
+                    file.write(f"{stack} {count}\n")
+
+        print(f"\nProfiles written to {self.directory}:")
+        print(f"  {'Store':12} {'Jobs':>5} {'Wall s':>8} {'CPU s':>8} {'Waiting':>8} {'Held KiB':>10}")
+        for store, stats in sorted(self.stores.items()):
+            waiting = max(stats.wall - stats.cpu, 0.0) / stats.wall * 100 if stats.wall else 0
+            held = sum(size for size, _ in stats.allocations.values()) / 1024
+            print(f"  {store[:12]:12} {stats.jobs:>5} {stats.wall:>8.2f} {stats.cpu:>8.2f} {waiting:>7.0f}% {held:>10.0f}")
+
+PROFILER = None
+
+def enable(directory=None, collapsed=False):
+    global PROFILER
+    PROFILER = Profiler(directory, collapsed)
+    PROFILER.start()
+    return PROFILER
+
+def profile(store):
+    """Context manager profiling a job of store when --profile is on, else a no-op"""
+    return PROFILER.profile(store) if PROFILER else nullcontext()
+
+def finish():
+    if PROFILER:
+        PROFILER.stop()
+        PROFILER.write_reports()
@@ -0,0 +1,154 @@
+"""Record captured search pages as fixtures and replay them offline.
+
+Run either script with --record DIR to save every page it captures:
+
+    python offer.py "laptop" --record fixtures/ --cache-ttl 0
+
+DIR/manifest.jsonl indexes the saved pages by retailer and URL. StubDriver
+serves them back through the subset of the WebDriver API the scrapers use,
+so the extraction code (including the element-by-element path) runs with
+no browser and no network.
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+import page_cache
+
+MANIFEST = 'manifest.jsonl'
+
+class FixtureRecorder:
+    """Writes captured pages to a fixture directory; a no-op until started"""
+
+    def __init__(self):
+        self.directory = None
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def start(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._seen = {entry['key'] for entry in load_manifest(self.directory)}
+
+    def record(self, source, retailer, url, html, final_url=None):
+        if self.directory is None or not html:
+            return
+        key = f"{source}:{page_cache.normalize_url(url)}"
+        with self._lock:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+            slug = ''.join(c if c.isalnum() else '_' for c in retailer)
+            name = f"{slug}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.html"
+            (self.directory / name).write_text(html, encoding='utf-8')
+            entry = {'key': key, 'source': source, 'retailer': retailer, 'url': url,
+                     'final_url': final_url or url, 'file': name}
+            with open(self.directory / MANIFEST, 'a', encoding='utf-8') as manifest:
+                manifest.write(json.dumps(entry) + '\n')
+
+RECORDER = FixtureRecorder()
+
+def load_manifest(directory):
+    path = Path(directory) / MANIFEST
+    if not path.exists():
+        return []
+    with open(path, encoding='utf-8') as manifest:
+        return [json.loads(line) for line in manifest if line.strip()]
+
+class StubElement:
+    """WebElement stand-in backed by a BeautifulSoup tag"""
+
+    def __init__(self, tag, page_url):
+        self._tag = tag
+        self._page_url = page_url
+
+    @property
+    def text(self):
+        return ' '.join(self._tag.get_text().split())
+
+    def get_attribute(self, name):
+        if name == 'innerHTML':
+            return self._tag.decode_contents()
+        value = self._tag.get(name)
+        if isinstance(value, list):
+            value = ' '.join(value)
+        if name in ('href', 'src') and value:
+            return urljoin(self._page_url, value)
+        return value
+
+    def find_elements(self, by, selector):
+        if by != By.CSS_SELECTOR:
+            raise NotImplementedError(f"StubDriver only supports CSS selectors, not {by}")
+        return [StubElement(tag, self._page_url) for tag in self._tag.select(selector)]
+
+    def find_element(self, by, selector):
+        elements = self.find_elements(by, selector)
+        if not elements:
+            raise NoSuchElementException(f"No element matches {selector}")
+        return elements[0]
+
+    def is_displayed(self):
+        return True
+
+    def click(self):
+        pass
+
+class StubDriver:
+    """Serves recorded pages by URL through the WebDriver calls the scrapers make"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.entries = load_manifest(self.directory)
+        self._by_url = {page_cache.normalize_url(entry['url']): entry for entry in self.entries}
+        self.current_url = 'about:blank'
+        self.page_source = '<html></html>'
+        self._root = None
+
+    def load(self, entry):
+        """Show a manifest entry as the current page"""
+        self.current_url = entry['final_url']
+        self.page_source = (self.directory / entry['file']).read_text(encoding='utf-8')
+        self._root = None
+
+    def get(self, url):
+        entry = self._by_url.get(page_cache.normalize_url(url))
+        if entry is None:
+            self.current_url, self.page_source, self._root = url, '<html></html>', None
+        else:
+            self.load(entry)
+
+    def _document(self):
+        if self._root is None:
+            self._root = StubElement(BeautifulSoup(self.page_source, 'html.parser'), self.current_url)
+        return self._root
+
+    def find_elements(self, by, selector):
+        return self._document().find_elements(by, selector)
+
+    def find_element(self, by, selector):
+        return self._document().find_element(by, selector)
+
+    def execute_script(self, script, *args):
+        return None
+
+    def execute_cdp_cmd(self, command, params):
+        return {}
+
+    def get_log(self, log_type):
+        return []
+
+    def delete_all_cookies(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def quit(self):
+        pass
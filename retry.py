@@ -0,0 +1,170 @@
+"""Per-URL retries and per-retailer circuit breakers shared by every search worker.
+
+A failed page is retried on its own with exponential backoff and full
+jitter, so one flaky URL no longer restarts a whole retailer sweep and
+everything collected so far is kept. Each retailer has a circuit breaker:
+after FAILURE_THRESHOLD consecutive failures (errors, timeouts, captcha
+pages) its remaining pages are skipped for COOLDOWN seconds instead of
+hammering a site that is refusing us. After the cooldown one trial page is
+let through; success closes the circuit again.
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 2.0   # seconds before the first retry, doubled on each one
+DEFAULT_MAX_DELAY = 30.0
+FAILURE_THRESHOLD = 5
+COOLDOWN = 120.0
+
+log = logging.getLogger(__name__)
+
+# Any of these in a page means the retailer served a bot check instead of results
+BLOCKED_MARKERS = ['captcha', 'robot check', 'access denied', 'are you a human', 'unusual traffic']
+
+class FetchFailed(Exception):
+    """A page did not load or rendered no results; worth retrying"""
+
+class Blocked(FetchFailed):
+    """The retailer answered with a captcha or bot check"""
+
+class CircuitOpen(Exception):
+    """The retailer's circuit breaker is open; the page was not requested"""
+
+def looks_blocked(html):
+    lowered = (html or '')[:20000].lower()
+    return any(marker in lowered for marker in BLOCKED_MARKERS)
+
+def backoff_delay(attempt, base=DEFAULT_BASE_DELAY, cap=DEFAULT_MAX_DELAY):
+    """Full-jitter delay before retry number attempt (1 = first retry)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """Closed -> open after threshold consecutive failures -> half-open after cooldown"""
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        """Whether a request may go out now; only one trial request while half-open"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """Count a failure; True when it (re)opened the circuit"""
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self._trial = False
+                return True
+            return False
+
+class FetchScheduler:
+    """Runs page fetches with per-URL retries behind one circuit breaker per retailer"""
+
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._breakers = {}
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def configure(self, attempts=None, base_delay=None, threshold=None, cooldown=None):
+        with self._lock:
+            if attempts is not None:
+                self.attempts = attempts
+            if base_delay is not None:
+                self.base_delay = base_delay
+            if threshold is not None:
+                self.threshold = threshold
+            if cooldown is not None:
+                self.cooldown = cooldown
+            self._breakers.clear()
+
+    def breaker(self, store):
+        with self._lock:
+            breaker = self._breakers.get(store)
+            if breaker is None:
+                breaker = self._breakers[store] = CircuitBreaker(self.threshold, self.cooldown)
+            return breaker
+
+    def _count(self, store, kind):
+        with self._lock:
+            self._counts[store][kind] += 1
+
+    def call(self, store, url, fetch, attempts=None):
+        """fetch() with retries; raises CircuitOpen, or the last error once attempts run out"""
+        attempts = attempts or self.attempts
+        breaker = self.breaker(store)
+        for attempt in range(1, attempts + 1):
+            if not breaker.allow():
+                self._count(store, 'skipped')
+                raise CircuitOpen(f"{store} circuit open, skipping {url}")
+            try:
+                result = fetch()
+            except Exception as e:
+                self._count(store, 'blocked' if isinstance(e, Blocked) else 'failed')
+                if breaker.record_failure():
+                    log.warning(f"{store} failing repeatedly, pausing it for {breaker.cooldown:.0f}s")
+                if attempt == attempts:
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                log.info(f"Retrying {url} in {delay:.1f}s (attempt {attempt} failed: {str(e)[:80]})")
+                self._count(store, 'retried')
+                time.sleep(delay)
+                continue
+            breaker.record_success()
+            self._count(store, 'ok')
+            return result
+
+    def report(self):
+        """{store: {'ok', 'failed', 'blocked', 'retried', 'skipped', 'state'}}"""
+        with self._lock:
+            stores = {store: dict(counts) for store, counts in self._counts.items()}
+            breakers = dict(self._breakers)
+        for store, counts in stores.items():
+            counts['state'] = breakers[store].state if store in breakers else 'closed'
+        return stores
+
+SCHEDULER = FetchScheduler()
+
+def print_retry_report():
+    report = SCHEDULER.report()
+    if not any(counts.get(kind) for counts in report.values() for kind in ('failed', 'blocked', 'skipped')):
+        return
+    print("\nPage failures per retailer:")
+    for store, counts in sorted(report.items()):
+        print(f"  {store:12} {counts.get('ok', 0):4} ok  {counts.get('retried', 0):4} retried  "
+              f"{counts.get('failed', 0):4} failed  {counts.get('blocked', 0):4} blocked  "
+              f"{counts.get('skipped', 0):4} skipped  circuit {counts['state']}")
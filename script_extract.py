@@ -0,0 +1,81 @@
+"""Extract every result card of a loaded page in one execute_script call.
+
+Instead of one WebDriver round trip per element, or shipping the whole page
+source over the wire, the browser runs the retailer's selector lists itself
+and returns the raw card fields as JSON. Prices, discounts and conditions
+are then worked out in Python by the same rules the other modes use.
+
+A card config names the item selector and, per field, the fallback
+selectors to read:
+
+    first match of each selector -> list with one text (or None) per selector
+    every=True                   -> texts of all matches of the selectors
+    attr='href'                  -> absolute link instead of text
+    attr=<other>                 -> that attribute, falling back to the text
+"""
+import tracing
+
+
+CARD_SCRIPT = r"""
+var config = arguments[0];
+
+function query(root, selector, every) {
+    // Selectors the browser cannot parse simply match nothing
+    try {
+        return every ? Array.prototype.slice.call(root.querySelectorAll(selector)) : root.querySelector(selector);
+    } catch (e) {
+        return every ? [] : null;
+    }
+}
+
+function read(element, attr) {
+    if (!element) return null;
+    if (attr === 'href') return element.href || element.getAttribute('href') || null;
+    return (attr && element.getAttribute(attr)) || element.textContent;
+}
+
+var next = null;
+if (config.next) {
+    var link = query(document, config.next, false);
+    next = link ? read(link, 'href') : null;
+}
+
+var root = document;
+if (config.grid.length) {
+    root = null;
+    for (var i = 0; i < config.grid.length && !root; i++) {
+        root = query(document, config.grid[i], false);
+    }
+    if (!root) return {cards: null, next: next};
+}
+
+var cards = query(root, config.item, true).map(function (card) {
+    var record = {};
+    Object.keys(config.fields).forEach(function (name) {
+        var field = config.fields[name];
+        if (field.every) {
+            record[name] = field.selectors.length
+                ? query(card, field.selectors.join(', '), true).map(function (element) { return element.textContent; })
+                : [];
+        } else {
+            record[name] = field.selectors.map(function (selector) {
+                return read(query(card, selector, false), field.attr);
+            });
+        }
+    });
+    return record;
+});
+return {cards: cards, next: next};
+"""
+
+def field(selectors, attr=None, every=False):
+    return {'selectors': list(selectors), 'attr': attr, 'every': every}
+
+def card_config(item, fields, grid=None, next_link=None):
+    return {'item': item, 'fields': fields, 'grid': list(grid or []), 'next': next_link}
+
+@tracing.timed('script_read')
+def extract_cards(driver, config):
+    """(cards, next page URL) for the loaded page; cards is None when no grid matched"""
+    result = driver.execute_script(CARD_SCRIPT, config) or {}
+    return result.get('cards'), result.get('next')
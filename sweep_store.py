@@ -0,0 +1,90 @@
+"""Columnar copies of the offer2 daily sweeps.
+
+Each sweep is written as a Parquet dataset partitioned by date, source and
+category (sweeps/date=2024-05-01/source=Amazon/category=laptop/...), with
+dictionary-encoded string columns. load_sweeps reads back only the columns
+and partitions asked for, so a month of sweeps loads without parsing every
+CSV:
+
+    df = load_sweeps('sweeps', columns=['title', 'discount'], start='2024-05-01', categories=['laptop'])
+
+pyarrow is optional; without it offer2 keeps writing CSV only.
+"""
+import logging
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; sweeps are then written as CSV only
+    pa = None
+
+DEFAULT_DIRECTORY = Path('sweeps')
+PARTITION_COLUMNS = ['date', 'source', 'category']
+
+log = logging.getLogger(__name__)
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+
+def partitioning():
+    return ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITION_COLUMNS]), flavor='hive')
+
+def sweep_table(products, date):
+    """Arrow table of one sweep; the partition columns end up in the directory names"""
+    return pa.table({
+        'date': pa.array([date] * len(products), pa.string()),
+        'source': pa.array([p.store for p in products], pa.string()),
+        'category': pa.array([p.category or 'other' for p in products], pa.string()),
+        'title': pa.array([p.title for p in products], pa.string()),
+        'price': pa.array([p.price for p in products], pa.float64()),
+        'original_price': pa.array([p.original_price for p in products], pa.float64()),
+        'discount': pa.array([p.discount for p in products], pa.float64()),
+        'link': pa.array([p.link for p in products], pa.string()),
+    })
+
+def write_sweep(products, directory=DEFAULT_DIRECTORY, date=None):
+    """Write one sweep into the partitioned dataset, replacing everything stored for that date.
+
+    String columns are dictionary-encoded in the Parquet files.
+    """
+    require_pyarrow()
+    date = date or datetime.now().strftime('%Y-%m-%d')
+    # An earlier sweep of the date may have sources or categories this one does not rewrite
+    shutil.rmtree(Path(directory) / f"date={date}", ignore_errors=True)
+    pq.write_to_dataset(sweep_table(products, date), root_path=str(directory),
+                        partitioning=partitioning(), compression='zstd', use_dictionary=True,
+                        existing_data_behavior='overwrite_or_ignore')
+    log.info(f"Saved {len(products)} products to {directory} (Parquet, date={date})")
+    return Path(directory)
+
+def load_sweeps(directory=DEFAULT_DIRECTORY, columns=None, start=None, end=None, sources=None, categories=None):
+    """DataFrame of the sweeps between start and end (YYYY-MM-DD, inclusive).
+
+    Partitions outside the date range, sources and categories are skipped
+    without being opened, and only the requested columns are read. The
+    partition columns come back as pandas categoricals.
+    """
+    require_pyarrow()
+    dataset = ds.dataset(str(directory), format='parquet', partitioning=partitioning())
+    conditions = []
+    if start:
+        conditions.append(ds.field('date') >= start)
+    if end:
+        conditions.append(ds.field('date') <= end)
+    if sources:
+        conditions.append(ds.field('source').isin(sources))
+    if categories:
+        conditions.append(ds.field('category').isin(categories))
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+    df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    for column in PARTITION_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
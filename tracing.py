@@ -0,0 +1,142 @@
+"""Timing spans for every stage of a search run, and the scripts' logging setup.
+
+Stages are timed with spans tagged by retailer and URL:
+
+    with tracing.span('navigate', url=url):
+        driver.get(url)
+
+    @tracing.timed('extract')            # also records how many items came back
+    def extract_products(html, spec, page_url): ...
+
+Tags set with tracing.context(store=..., url=...) apply to every span the
+thread opens inside it, so a search job only tags itself once. Spans can be
+streamed to a JSON-lines file (--trace) and are summarized per stage and
+retailer at the end of a run, which shows where the minutes of a query go.
+Progress and diagnostics go through the logging module instead of print;
+per-item messages are DEBUG, so they cost nothing at the default level.
+"""
+import functools
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+def configure_logging(level='INFO'):
+    logging.basicConfig(level=getattr(logging, level), format='%(message)s')
+
+class Tracer:
+    """Thread-safe collector of finished spans"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._spans = []
+        self._sink = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def configure(self, trace_path=None):
+        """Also write every span as a JSON line to trace_path"""
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+            self._sink = open(trace_path, 'w', encoding='utf-8') if trace_path else None
+
+    def close(self):
+        self.configure(None)
+
+    def reset(self):
+        """Drop the finished spans, e.g. before each query of a long-running daemon"""
+        with self._lock:
+            self._spans = []
+            self.started = time.perf_counter()
+
+    def _tags(self):
+        return getattr(self._local, 'tags', {})
+
+    @contextmanager
+    def context(self, **tags):
+        """Tag every span this thread opens inside the block"""
+        previous = self._tags()
+        self._local.tags = {**previous, **tags}
+        try:
+            yield
+        finally:
+            self._local.tags = previous
+
+    def record(self, stage, seconds, **tags):
+        """Add a span for a duration measured elsewhere"""
+        span = {'stage': stage, **self._tags(), **tags, 'seconds': seconds,
+                'start': time.perf_counter() - self.started - seconds,
+                'thread': threading.current_thread().name}
+        with self._lock:
+            self._spans.append(span)
+            if self._sink is not None:
+                self._sink.write(json.dumps(span, default=str) + '\n')
+
+    @contextmanager
+    def span(self, stage, **tags):
+        """Time the block; the yielded dict takes extra fields such as items"""
+        fields = dict(tags)
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields['error'] = type(e).__name__
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, **fields)
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self):
+        """[(stage, store, count, total s, mean s, p90 s, max s, items)], most total time first"""
+        grouped = defaultdict(list)
+        items = defaultdict(int)
+        for span in self.spans():
+            key = (span['stage'], span.get('store', ''))
+            grouped[key].append(span['seconds'])
+            items[key] += span.get('items', 0)
+        rows = []
+        for (stage, store), samples in grouped.items():
+            p90 = statistics.quantiles(samples, n=10)[-1] if len(samples) > 1 else samples[0]
+            rows.append((stage, store, len(samples), sum(samples), sum(samples) / len(samples), p90,
+                         max(samples), items[(stage, store)]))
+        rows.sort(key=lambda row: -row[3])
+        return rows
+
+TRACER = Tracer()
+span = TRACER.span
+context = TRACER.context
+
+def timed(stage):
+    """Decorator running the function in a span; list results also record their length as items"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(stage) as fields:
+                result = func(*args, **kwargs)
+                if isinstance(result, list):
+                    fields['items'] = len(result)
+                return result
+        return wrapper
+    return decorate
+
+def print_timing_report():
+    """Time per stage and retailer over the run (spans nest, so stages overlap)"""
+    rows = TRACER.summary()
+    if not rows:
+        return
+    print(f"\nTime per stage ({time.perf_counter() - TRACER.started:.1f}s run):")
+    print(f"  {'Stage':16} {'Store':12} {'Count':>6} {'Total s':>9} {'Mean ms':>9} {'p90 ms':>9} "
+          f"{'Max ms':>9} {'Items':>7} {'us/item':>8}")
+    for stage, store, count, total, mean, p90, longest, items in rows:
+        per_item = f"{total / items * 1e6:8.0f}" if items else f"{'':8}"
+        print(f"  {stage:16} {store[:12]:12} {count:>6} {total:>9.2f} {mean * 1000:>9.1f} {p90 * 1000:>9.1f} "
+              f"{longest * 1000:>9.1f} {items:>7} {per_item}")